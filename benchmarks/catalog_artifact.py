@@ -0,0 +1,80 @@
+"""
+Démarrage à froid du catalogue produits, par taille :
+  - featurisation complète des products (ce que fait rebuild_catalog après la pagination HubSpot)
+  - snapshot JSON (ancien format : featurisation et index recalculés au chargement)
+  - artefact binaire, lu en entier (S3) ou mappé en mémoire (fichier local)
+vérifie que le catalogue rechargé est identique à l'original (colonnes, index, résultats de matching)
+et qu'un artefact d'une autre version des features est ignoré.
+
+Usage : python benchmarks/catalog_artifact.py [taille ...]
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from synthetic import synthetic_products, synthetic_order_lines
+
+import matching_products
+from matching_products import (
+    _ARRAY_COLUMNS, _LIST_COLUMNS, ProductCatalog, load_catalog_snapshot, match_items_batch,
+)
+
+
+def timed(fn, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return out, 1000 * best
+
+
+def same_catalog(a: ProductCatalog, b: ProductCatalog) -> bool:
+    return (all(getattr(a, n) == getattr(b, n) for n in _LIST_COLUMNS + _ARRAY_COLUMNS)
+            and a._index == b._index and a._pos == b._pos and a.high_water_mark == b.high_water_mark)
+
+
+def run(size: int, folder: str) -> int:
+    products = synthetic_products(size)
+    catalog, t_build = timed(lambda: ProductCatalog(products), repeat=1)
+
+    json_path = os.path.join(folder, f"catalog_{size}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(catalog.to_snapshot(), f, ensure_ascii=False, separators=(",", ":"))
+    artifact_path = os.path.join(folder, f"catalog_{size}.bin")
+    body = catalog.to_artifact()
+    with open(artifact_path, "wb") as f:
+        f.write(body)
+
+    from_json, t_json       = timed(lambda: load_catalog_snapshot(json_path))
+    from_bytes, t_bytes     = timed(lambda: ProductCatalog.from_artifact(body))
+    from_mmap, t_mmap       = timed(lambda: load_catalog_snapshot(artifact_path))
+
+    lines = synthetic_order_lines(products, 20)
+    expected = match_items_batch(catalog, lines)
+    errors = sum(not same_catalog(catalog, c) for c in (from_bytes, from_mmap))
+    errors += sum(match_items_batch(c, lines) != expected for c in (from_json, from_bytes, from_mmap))
+
+    # Artefact d'une autre version des features : ignoré (reconstruction côté ensure_catalog).
+    matching_products.CATALOG_FEATURES_VERSION += 1
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            errors += load_catalog_snapshot(artifact_path) is not None
+    finally:
+        matching_products.CATALOG_FEATURES_VERSION -= 1
+
+    print(f"{size:>7} products | featurisation {t_build:8.1f} ms | JSON {os.path.getsize(json_path) / 2 ** 20:6.1f} Mo "
+          f"{t_json:8.1f} ms | artefact {len(body) / 2 ** 20:6.1f} Mo : bytes {t_bytes:7.1f} ms, mmap {t_mmap:7.1f} ms "
+          f"| écarts {errors}")
+    return errors
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as folder:
+        total = sum(run(size, folder) for size in [int(x) for x in sys.argv[1:]] or [10000, 50000])
+    sys.exit(1 if total else 0)
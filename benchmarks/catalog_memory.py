@@ -0,0 +1,75 @@
+"""
+Mémoire du catalogue produits (tracemalloc), par tranche de 10 000 products :
+  - lignes au format dict d'origine (11 clés dont 3 sets et la description) : référence
+  - colonnes de ProductCatalog seules (tableaux, chaînes internées, masques de bits)
+  - ProductCatalog complet (colonnes + index inversé + positions)
+et temps de scan complet par ligne de commande.
+
+Usage : python benchmarks/catalog_memory.py [taille ...]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from synthetic import synthetic_products, synthetic_order_lines
+
+import normalization
+from matching_products import ProductCatalog, _featurize_product, match_one_item
+
+
+def clear_normalization_caches():
+    normalization._strip_accents_lower.cache_clear()
+    normalization._normalize_address.cache_clear()
+    normalization._normalize_company_name.cache_clear()
+
+
+def traced(build):
+    # Les caches LRU de normalisation, remplis pendant la construction, ne sont pas comptés.
+    clear_normalization_caches()
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    clear_normalization_caches()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def legacy_rows(products):
+    rows = []
+    for p in products:
+        row = _featurize_product(p)
+        row["desc"] = p["properties"].get("description") or ""
+        rows.append(row)
+    return rows
+
+
+def columns_only(products):
+    catalog = ProductCatalog(products)
+    catalog._index, catalog._pos = {}, {}
+    return catalog
+
+
+def run(size: int, n_lines: int = 20):
+    products = synthetic_products(size)
+    per_10k  = 10000 / size / 2 ** 20
+
+    _, legacy = traced(lambda: legacy_rows(products))
+    _, columns = traced(lambda: columns_only(products))
+    catalog, full = traced(lambda: ProductCatalog(products))
+
+    lines = synthetic_order_lines(products, n_lines)
+    t0 = time.perf_counter()
+    for it in lines:
+        match_one_item(catalog, it, prune=False)
+    scan = 1000 * (time.perf_counter() - t0) / n_lines
+
+    print(f"{size:>7} products | lignes dict {legacy * per_10k:6.1f} Mo/10k | colonnes {columns * per_10k:6.1f} Mo/10k | "
+          f"catalogue complet {full * per_10k:6.1f} Mo/10k | scan complet {scan:7.2f} ms/ligne")
+
+
+if __name__ == "__main__":
+    for size in [int(x) for x in sys.argv[1:]] or [10000, 50000]:
+        run(size)
@@ -0,0 +1,78 @@
+"""
+Matching entreprise en mode "packed" contre la cascade séquentielle, sur un faux HubSpot dont le
+tokenizer CONTAINS_TOKEN diffère de celui du client (tokenizer="stem" : pluriels confondus) et des
+entrées dont les mots de rue sont mis au singulier / pluriel. HubSpot renvoie alors des candidats que
+le rattachement côté client ne reconnaît pas : le mode packed doit retomber sur les recherches par
+stratégie et rendre exactement les mêmes résultats (entreprise, méthode, score) que la cascade séquentielle.
+
+Usage : python benchmarks/company_packed.py [--companies 2000] [--inputs 300]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+
+import requests
+
+from synthetic import synthetic_companies, synthetic_company_inputs
+from fake_hubspot import start_server
+
+SEARCH_ROUTE = "POST /crm/v3/objects/companies/search"
+
+
+def plural_variants(inputs, seed: int = 3):
+    """
+    Entrées dont chaque mot de l'adresse de plus de 3 lettres perd ou gagne un "s" final (une fois sur deux).
+    """
+    rng = random.Random(seed)
+    out = []
+    for it in inputs:
+        words = []
+        for w in it["adresse"].split():
+            if len(w) > 3 and w.isalpha() and rng.random() < 0.5:
+                w = w[:-1] if w.endswith("s") else w + "s"
+            words.append(w)
+        out.append(dict(it, adresse=" ".join(words)))
+    return out
+
+
+def run_mode(base_url, matching_company, inputs, mode):
+    requests.post(f"{base_url}/__reset")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [matching_company.find_hubspot_company_ids([it], min_score=75, mode=mode) for it in inputs]
+    searches = requests.get(f"{base_url}/__stats").json().get(SEARCH_ROUTE, 0)
+    return [(r["match"], r["hs_object_id"], r["method"], r["score"]) for r in results], searches
+
+
+def main(n_companies: int, n_inputs: int) -> int:
+    import hubspot_client
+    import matching_company
+
+    base_url, server = start_server(0, n_companies, tokenizer="stem")
+    hubspot_client.HUBSPOT_API_BASE = base_url
+    inputs = synthetic_company_inputs(synthetic_companies(n_companies), n_inputs)
+    try:
+        errors = 0
+        for label, corpus in (("entrées exactes", inputs), ("pluriels modifiés", plural_variants(inputs))):
+            ref, ref_searches = run_mode(base_url, matching_company, corpus, "sequential")
+            _, concurrent_searches = run_mode(base_url, matching_company, corpus, "concurrent")
+            packed, packed_searches = run_mode(base_url, matching_company, corpus, "packed")
+            diffs = sum(a != b for a, b in zip(ref, packed))
+            errors += diffs
+            print(f"{label:<18} | recherches/item : séquentiel {ref_searches / n_inputs:5.2f}, "
+                  f"concurrent {concurrent_searches / n_inputs:5.2f}, packed {packed_searches / n_inputs:5.2f} "
+                  f"| écarts packed {diffs}/{n_inputs}")
+    finally:
+        server.terminate()
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=2000)
+    parser.add_argument("--inputs", type=int, default=300)
+    args = parser.parse_args()
+    os.environ["HUBSPOT_SEARCH_RATE"] = os.environ["HUBSPOT_CRM_RATE"] = "100000"
+    sys.exit(1 if main(args.companies, args.inputs) else 0)
@@ -0,0 +1,168 @@
+"""
+Benchmark de bout en bout hors-ligne : faux HubSpot local (latence, 429 injectés) + S3 en mémoire.
+
+Pour chaque taille (catalogue produits et base entreprises synthétiques de même taille), mesure par étape :
+  - catalog_build      : reconstruction complète du catalogue (liste paginée products)
+  - company_sequential : find_hubspot_company_ids, cascade séquentielle (mode du handler par défaut)
+  - company_concurrent : find_hubspot_company_ids, cascade concurrente (toutes les recherches en parallèle)
+  - company_packed     : find_hubspot_company_ids, stratégies groupées en filterGroups (environ 2,2 recherches)
+  - products           : match_products_preserve_shape sur les lignes d'une commande (delta catalogue inclus)
+  - handler            : lambda_handler sur un événement S3 ObjectCreated (DEAL JSON + log), création de la
+                         transaction et des lignes produits comprise
+  - handler_async      : idem avec hubspot_create_deal_async.lambda_handler (log, entreprise et produits en parallèle)
+et rapporte p50 / p95, nombre d'appels HubSpot (et de 429) et pic mémoire Python (tracemalloc).
+
+Usage : python benchmarks/end_to_end.py [--sizes 1000 10000 100000] [--orders 20] [--latency-ms 20]
+                                       [--rate-429 0.0] [--portal-limits]
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import requests
+
+from synthetic import synthetic_companies, synthetic_company_inputs, synthetic_order_lines, synthetic_products
+from fake_hubspot import start_server
+from fake_s3 import FakeS3
+
+LINES_PER_ORDER = 8
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p * (len(ordered) - 1))))]
+
+
+class Stage:
+    """
+    Une étape mesurée en deux passes identiques : latence et appels HubSpot (compteurs du faux serveur)
+    sur la première, pic mémoire sur la seconde (tracemalloc ralentit fortement l'exécution).
+    `make_calls(pass_no)` retourne la liste des appels (sans argument) à chronométrer.
+    """
+    def __init__(self, name: str, base_url: str, make_calls):
+        self.name       = name
+        self.base_url   = base_url
+        self.make_calls = make_calls
+
+    def run(self) -> "Stage":
+        requests.post(f"{self.base_url}/__reset")
+        self.latencies = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for fn in self.make_calls(0):
+                t0 = time.perf_counter()
+                fn()
+                self.latencies.append(time.perf_counter() - t0)
+        self.api = requests.get(f"{self.base_url}/__stats").json()
+
+        calls = self.make_calls(1)
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for fn in calls:
+                fn()
+        _, self.peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return self
+
+    def report(self) -> str:
+        calls = sum(v for k, v in self.api.items() if k != "429")
+        return (f"  {self.name:<20} n={len(self.latencies):<4} p50 {1000 * percentile(self.latencies, .5):9.1f} ms  "
+                f"p95 {1000 * percentile(self.latencies, .95):9.1f} ms  appels HubSpot {calls:>5} "
+                f"(429 : {self.api.get('429', 0)})  pic mémoire {self.peak / 2 ** 20:8.1f} Mo")
+
+
+def run(size: int, orders: int, latency_ms: float, rate_429: float):
+    import hubspot_client
+    import matching_company
+    import matching_products
+    import tools
+    import hubspot_create_deal
+    import hubspot_create_deal_async
+
+    base_url, server = start_server(size, size, latency_ms=latency_ms, rate_429=rate_429)
+    hubspot_client.HUBSPOT_API_BASE = base_url
+    matching_products._product_cache_catalog = None
+    # Transaction et lignes produits réellement créées (sur le faux HubSpot).
+    hubspot_create_deal.create_transaction_with_line_product = functools.partial(
+        tools.create_transaction_with_line_product, DEV=False
+    )
+
+    products  = synthetic_products(size)
+    companies = synthetic_company_inputs(synthetic_companies(size), orders)
+    lines     = [synthetic_order_lines(products, LINES_PER_ORDER, seed=i) for i in range(orders)]
+
+    s3 = FakeS3()
+    bucket = hubspot_create_deal.BUCKET
+    hubspot_create_deal.connexion_aws = lambda: {"status": "success", "message": "S3 en mémoire", "client": s3}
+
+    def handler_calls(pass_no, handler=hubspot_create_deal.lambda_handler, tag="bench"):
+        # Cache entreprises vide à chaque passe : les deux passes font le même travail.
+        matching_company.company_cache = matching_company.CompanyMatchCache(uri=None)
+        calls = []
+        for i, (it, order) in enumerate(zip(companies, lines)):
+            key = f"{hubspot_create_deal.FOLDER}/deal_[{tag} {pass_no}-{i}].json"
+            s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(
+                {"entreprise": it, "produits": order, "total": sum(l["prix_unitaire"] * l["quantite"] for l in order)}
+            ))
+            s3.put_object(Bucket=bucket, Key=f"LOGS/log_[{tag} {pass_no}-{i}].json", Body=json.dumps(
+                {"workflow": {"DEAL": {"status": "", "matching_products": {}, "transaction": {}}}}
+            ))
+            event = {"Records": [{"eventSource": "aws:s3", "eventName": "ObjectCreated:Put",
+                                  "s3": {"bucket": {"name": bucket}, "object": {"key": key}}}]}
+            calls.append(lambda event=event: handler(event, None))
+        return calls
+
+    stages = [
+        Stage("catalog_build", base_url, lambda _: [lambda: matching_products.ensure_catalog(force_refresh=True)]),
+        Stage("company_sequential", base_url, lambda _: [
+            lambda it=it: matching_company.find_hubspot_company_ids([it], min_score=75, mode="sequential")
+            for it in companies
+        ]),
+        Stage("company_concurrent", base_url, lambda _: [
+            lambda it=it: matching_company.find_hubspot_company_ids([it], min_score=75, mode="concurrent")
+            for it in companies
+        ]),
+        Stage("company_packed", base_url, lambda _: [
+            lambda it=it: matching_company.find_hubspot_company_ids([it], min_score=75, mode="packed")
+            for it in companies
+        ]),
+        Stage("products", base_url, lambda _: [
+            lambda order=order: matching_products.match_products_preserve_shape(order, min_score=78, incremental=True)
+            for order in lines
+        ]),
+        Stage("handler", base_url, handler_calls),
+        Stage("handler_async", base_url, lambda pass_no: handler_calls(
+            pass_no, handler=hubspot_create_deal_async.lambda_handler, tag="bench async"
+        )),
+    ]
+    try:
+        for st in stages:
+            st.run()
+    finally:
+        server.terminate()
+
+    print(f"{size} products / {size} entreprises, {orders} commandes, latence {latency_ms} ms, 429 {rate_429:.0%}")
+    for st in stages:
+        print(st.report())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--portal-limits", action="store_true",
+                        help="garde les budgets de débit du client (sinon levés : on mesure le pipeline, pas le quota)")
+    args = parser.parse_args()
+
+    if not args.portal_limits:
+        os.environ["HUBSPOT_SEARCH_RATE"] = os.environ["HUBSPOT_CRM_RATE"] = "100000"
+    for size in args.sizes:
+        run(size, args.orders, args.latency_ms, args.rate_429)
+    sys.exit(0)
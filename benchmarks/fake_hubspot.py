@@ -0,0 +1,302 @@
+"""
+Faux serveur HubSpot local pour les benchmarks (aucun appel au portail) :
+  - companies : liste paginée + search (filterGroups EQ / CONTAINS_TOKEN)
+  - products  : liste paginée + search (hs_lastmodifieddate GT)
+  - deals, line_items (unitaire, batch/create et batch/read), line_items associés à un deal (v4)
+  - latence configurable et injection de 429 (avec Retry-After)
+  - CONTAINS_TOKEN : jetons du client (strip_accents_lower) ou, avec tokenizer="stem", jetons sans pluriel
+    (s / x final) pour simuler un tokenizer HubSpot différent de celui du client
+  - compteurs d'appels par route : GET /__stats, POST /__reset
+
+Lancé dans un processus séparé (start_server) pour ne pas fausser la mesure mémoire du client.
+
+Usage autonome : python benchmarks/fake_hubspot.py [--products N] [--companies N] [--port P] ...
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import synthetic_companies, synthetic_products
+
+from normalization import strip_accents_lower
+
+SEARCH_LIMIT_MAX = 200
+DEAL_PATH = re.compile(r"^/crm/v4/objects/deals/([^/]+)/")
+
+
+def _tokens(v) -> set:
+    return set(strip_accents_lower(v or "").split())
+
+
+def _stem_tokens(v) -> set:
+    return {w[:-1] if len(w) > 3 and w[-1] in "sx" else w for w in _tokens(v)}
+
+
+TOKENIZERS = {"client": _tokens, "stem": _stem_tokens}
+
+
+def _ms(iso: str) -> int:
+    return int(datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+class FakeHubSpot:
+    def __init__(self, products, companies, latency_ms: float = 0.0, rate_429: float = 0.0,
+                 retry_after: float = 0.1, seed: int = 0, tokenizer: str = "client"):
+        self.products    = products
+        self.companies   = companies
+        self.latency     = latency_ms / 1000.0
+        self.rate_429    = rate_429
+        self.retry_after = retry_after
+        self.rng         = random.Random(seed)
+        self.tokens      = TOKENIZERS[tokenizer]
+        self.counts      = Counter()
+        self.lock        = threading.Lock()
+        self.next_id     = 900000000
+        self.line_items  = {}   # id -> {"properties", "deal_id"}
+        self.by_zip = {}
+        for c in companies:
+            self.by_zip.setdefault(c["properties"].get("zip"), []).append(c)
+        self.routes = {
+            ("GET",  "/crm/v3/objects/companies"):              self.list_companies,
+            ("POST", "/crm/v3/objects/companies/search"):       self.search_companies,
+            ("GET",  "/crm/v3/objects/products"):               self.list_products,
+            ("POST", "/crm/v3/objects/products/search"):        self.search_products,
+            ("POST", "/crm/v3/objects/deals"):                  self.create_deal,
+            ("POST", "/crm/v3/objects/line_items"):             self.create_line_item,
+            ("POST", "/crm/v3/objects/line_items/batch/create"): self.create_line_items,
+            ("POST", "/crm/v3/objects/line_items/batch/read"):   self.read_line_items,
+            ("GET",  "/crm/v4/objects/deals/{id}/associations/line_items"): self.deal_line_items,
+        }
+
+    # ---- outils ----
+    def _new_id(self) -> str:
+        with self.lock:
+            self.next_id += 1
+            return str(self.next_id)
+
+    @staticmethod
+    def _page(rows, query, limit_default=100):
+        limit = int((query.get("limit") or [limit_default])[0])
+        after = int((query.get("after") or [0])[0])
+        out = {"results": rows[after:after + limit]}
+        if after + limit < len(rows):
+            out["paging"] = {"next": {"after": str(after + limit)}}
+        return out
+
+    @staticmethod
+    def _record(obj, properties=None):
+        props = obj["properties"]
+        if properties:
+            props = {k: props.get(k) for k in properties}
+        return {"id": obj["id"], "properties": props, "createdAt": obj.get("updatedAt", "2024-01-01T00:00:00Z"),
+                "updatedAt": obj.get("updatedAt", "2024-01-01T00:00:00Z"), "archived": False}
+
+    # ---- routes ----
+    def list_companies(self, query, body):
+        if (query.get("archived") or ["false"])[0] == "true":
+            return 200, {"results": []}
+        return 200, self._page(self.companies, query)
+
+    def search_companies(self, query, body):
+        out, seen = [], set()
+        for group in body.get("filterGroups", []):
+            filters = group.get("filters", [])
+            zip_eq = next((f["value"] for f in filters if f["propertyName"] == "zip" and f["operator"] == "EQ"), None)
+            pool = self.by_zip.get(zip_eq, []) if zip_eq is not None else self.companies
+            for c in pool:
+                ok = True
+                for f in filters:
+                    v = c["properties"].get(f["propertyName"])
+                    if f["operator"] == "EQ":
+                        ok = (v or "").strip() == f["value"]
+                    elif f["operator"] == "CONTAINS_TOKEN":
+                        ok = self.tokens(f["value"]) <= self.tokens(v)
+                    else:
+                        return 400, {"message": f"operator {f['operator']} non émulé"}
+                    if not ok:
+                        break
+                if ok and c["id"] not in seen:
+                    seen.add(c["id"])
+                    out.append(c)
+        limit = min(int(body.get("limit", 10)), SEARCH_LIMIT_MAX)
+        after = int(body.get("after", 0))
+        page = {"total": len(out), "results": [self._record(c, body.get("properties")) for c in out[after:after + limit]]}
+        if after + limit < len(out):
+            page["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, page
+
+    def list_products(self, query, body):
+        if (query.get("archived") or ["false"])[0] == "true":
+            return 200, {"results": []}
+        return 200, self._page(self.products, query)
+
+    def search_products(self, query, body):
+        since = None
+        for group in body.get("filterGroups", []):
+            for f in group.get("filters", []):
+                if f["propertyName"] == "hs_lastmodifieddate" and f["operator"] == "GT":
+                    since = int(f["value"])
+        rows = [p for p in self.products if since is None or _ms(p["updatedAt"]) > since]
+        limit = min(int(body.get("limit", 10)), SEARCH_LIMIT_MAX)
+        after = int(body.get("after", 0))
+        page = {"total": len(rows), "results": rows[after:after + limit]}
+        if after + limit < len(rows):
+            page["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, page
+
+    def create_deal(self, query, body):
+        now = datetime.utcnow().isoformat() + "Z"
+        return 201, {"id": self._new_id(), "properties": body.get("properties", {}),
+                     "createdAt": now, "updatedAt": now, "archived": False}
+
+    def _store_line_item(self, inp):
+        line_item_id = self._new_id()
+        deal_id = next((a["to"]["id"] for a in inp.get("associations", []) or []), None)
+        with self.lock:
+            self.line_items[line_item_id] = {"properties": inp.get("properties", {}), "deal_id": deal_id}
+        return line_item_id
+
+    def create_line_item(self, query, body):
+        return 201, {"id": self._store_line_item(body), "properties": body.get("properties", {})}
+
+    def create_line_items(self, query, body):
+        results = []
+        for inp in body.get("inputs", []):
+            res = {"id": self._store_line_item(inp), "properties": inp.get("properties", {})}
+            if "objectWriteTraceId" in inp:
+                res["objectWriteTraceId"] = inp["objectWriteTraceId"]
+            results.append(res)
+        return 201, {"status": "COMPLETE", "results": results}
+
+    def read_line_items(self, query, body):
+        with self.lock:
+            found = [(inp["id"], self.line_items.get(inp["id"])) for inp in body.get("inputs", [])]
+        return 200, {"status": "COMPLETE", "results": [
+            {"id": i, "properties": {k: str(li["properties"].get(k)) for k in body.get("properties", [])}}
+            for i, li in found if li is not None
+        ]}
+
+    def deal_line_items(self, query, body):
+        deal_id = query["deal_id"][0]
+        with self.lock:
+            rows = [{"toObjectId": int(i), "associationTypes": []}
+                    for i, li in self.line_items.items() if li["deal_id"] == deal_id]
+        return 200, self._page(rows, query, limit_default=500)
+
+    # ---- dispatch ----
+    def handle(self, method: str, path: str, query, body):
+        """
+        Retourne (statut, en-têtes, corps JSON).
+        """
+        if path == "/__stats":
+            with self.lock:
+                return 200, {}, dict(self.counts)
+        if path == "/__reset":
+            with self.lock:
+                self.counts.clear()
+            return 200, {}, {}
+
+        deal = DEAL_PATH.match(path)
+        if deal:
+            query = {**query, "deal_id": [deal.group(1)]}
+            path = DEAL_PATH.sub("/crm/v4/objects/deals/{id}/", path)
+        route = self.routes.get((method, path))
+        if route is None:
+            return 404, {}, {"message": f"route inconnue {method} {path}"}
+
+        with self.lock:
+            self.counts[f"{method} {path}"] += 1
+            throttled = self.rate_429 and self.rng.random() < self.rate_429
+            if throttled:
+                self.counts["429"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            return 429, {"Retry-After": str(self.retry_after)}, {"status": "error", "category": "RATE_LIMITS"}
+        status, payload = route(query, body)
+        return status, {}, payload
+
+
+def _handler_class(api: FakeHubSpot):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, comme l'API réelle
+
+        def _serve(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            status, headers, payload = api.handle(self.command, url.path, parse_qs(url.query), body)
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = _serve
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int, n_products: int, n_companies: int, latency_ms: float = 0.0, rate_429: float = 0.0,
+          retry_after: float = 0.1, ready=None, tokenizer: str = "client"):
+    api = FakeHubSpot(synthetic_products(n_products), synthetic_companies(n_companies),
+                      latency_ms=latency_ms, rate_429=rate_429, retry_after=retry_after, tokenizer=tokenizer)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler_class(api))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(n_products: int, n_companies: int, latency_ms: float = 0.0, rate_429: float = 0.0,
+                 retry_after: float = 0.1, tokenizer: str = "client"):
+    """
+    Démarre le faux HubSpot dans un processus séparé. Retourne (url de base, processus).
+    """
+    port  = free_port()
+    ready = multiprocessing.Event()
+    proc  = multiprocessing.Process(
+        target=serve, args=(port, n_products, n_companies, latency_ms, rate_429, retry_after, ready, tokenizer),
+        daemon=True,
+    )
+    proc.start()
+    if not ready.wait(300):
+        proc.terminate()
+        raise RuntimeError("Le faux serveur HubSpot n'a pas démarré.")
+    return f"http://127.0.0.1:{port}", proc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--tokenizer", choices=sorted(TOKENIZERS), default="client")
+    args = parser.parse_args()
+    print(f"Faux HubSpot sur http://127.0.0.1:{args.port} (HUBSPOT_API_BASE)")
+    serve(args.port, args.products, args.companies, args.latency_ms, args.rate_429, args.retry_after,
+          tokenizer=args.tokenizer)
@@ -0,0 +1,75 @@
+"""
+S3 en mémoire pour les benchmarks : le sous-ensemble du client boto3 utilisé par la Lambda
+(get_object, put_object avec IfMatch / IfNoneMatch, list_objects_v2 / paginator, exceptions.NoSuchKey), avec compteurs d'appels.
+"""
+import io
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class _Exceptions:
+    NoSuchKey = NoSuchKey
+
+
+class _ListPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix="", StartAfter="", PaginationConfig=None):
+        with self.s3.lock:
+            self.s3.counts["list_objects_v2"] += 1
+            keys = sorted(k for (b, k) in self.s3.objects if b == Bucket and k.startswith(Prefix) and k > StartAfter)
+            contents = [{"Key": k, "LastModified": self.s3.objects[(Bucket, k)][1]} for k in keys]
+        for i in range(0, len(contents), 1000):
+            yield {"Contents": contents[i:i + 1000], "KeyCount": len(contents[i:i + 1000])}
+
+
+class FakeS3:
+    exceptions = _Exceptions
+
+    def __init__(self):
+        self.objects = {}   # (bucket, key) -> (body, LastModified, ETag)
+        self.counts  = Counter()
+        self.lock    = threading.Lock()
+        self._clock  = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._etag   = 0
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        body = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        with self.lock:
+            self.counts["put_object"] += 1
+            current = self.objects.get((Bucket, Key))
+            if (IfMatch is not None and (current is None or current[2] != IfMatch)) \
+                    or (IfNoneMatch == "*" and current is not None):
+                raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": "At least one of the "
+                                   "pre-conditions you specified did not hold"}, "ResponseMetadata": {"HTTPStatusCode": 412}},
+                                  "PutObject")
+            self._clock += timedelta(seconds=1)
+            self._etag  += 1
+            etag = f'"{self._etag}"'
+            self.objects[(Bucket, Key)] = (body, self._clock, etag)
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            self.counts["get_object"] += 1
+            if (Bucket, Key) not in self.objects:
+                raise NoSuchKey(Key)
+            body, modified, etag = self.objects[(Bucket, Key)]
+        return {"Body": io.BytesIO(body), "LastModified": modified, "ETag": etag, "ContentLength": len(body)}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        pages = list(_ListPaginator(self).paginate(Bucket, Prefix, kwargs.get("StartAfter", "")))
+        return pages[0] if pages else {"KeyCount": 0}
+
+    def get_paginator(self, name):
+        if name != "list_objects_v2":
+            raise NotImplementedError(name)
+        return _ListPaginator(self)
@@ -0,0 +1,63 @@
+"""
+Coût d'import (démarrage à froid) de chaque module de la Lambda :
+  - chaque import est mesuré dans un interpréteur neuf (comme un conteneur Lambda à froid)
+  - médiane sur plusieurs répétitions
+  - liste des dépendances lourdes chargées par l'import (elles devraient l'être au premier usage)
+
+Usage : python benchmarks/import_time.py [répétitions]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_function")
+
+MODULES = [
+    "storage",
+    "hubspot_client",
+    "company_cache",
+    "matching_company",
+    "matching_products",
+    "tools",
+    "hubspot_create_deal",
+]
+HEAVY = ["boto3", "botocore", "hubspot", "dotenv", "rapidfuzz", "numpy"]
+
+PROBE = """
+import sys, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(dt, ",".join(heavy) or "-")
+"""
+
+
+def measure(module: str):
+    env = dict(os.environ)
+    # Aucun token : l'import ne doit plus en avoir besoin.
+    env.pop("ACCESS_TOKEN_HUBSPOT", None)
+    env["PYTHONPATH"] = LAMBDA_DIR
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"Import de {module} en échec :\n{out.stderr}")
+    dt, heavy = out.stdout.strip().splitlines()[-1].split(" ", 1)
+    return float(dt), heavy
+
+
+def run(repeat: int = 5):
+    print(f"{'module':<22} {'médiane':>10} {'min':>10}   dépendances lourdes chargées")
+    for module in MODULES:
+        samples, heavy = [], ""
+        for _ in range(repeat):
+            dt, heavy = measure(module)
+            samples.append(dt)
+        print(f"{module:<22} {1000 * statistics.median(samples):8.1f}ms {1000 * min(samples):8.1f}ms   {heavy}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
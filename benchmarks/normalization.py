@@ -0,0 +1,98 @@
+"""
+Coût par appel de la normalisation d'adresse / de nom :
+  - "avant" : implémentation d'origine (≈15 re.sub non compilés par adresse), recopiée ci-dessous
+  - "après" : normalization.py, à froid (LRU vidé, chaînes toutes différentes) et à chaud (chaînes répétées,
+    comme les candidats renvoyés par plusieurs étapes de la cascade)
+  - vérifie que les deux implémentations donnent le même résultat
+
+Usage : python benchmarks/normalization.py [nombre d'adresses]
+"""
+import random
+import re
+import sys
+import time
+import unicodedata
+
+import synthetic  # noqa: F401  (chemin lambda_function)
+
+import normalization
+
+
+# ---- implémentation d'origine (référence) ----
+def legacy_strip_accents_lower(s: str) -> str:
+    s = s or ""
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    s = s.lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def legacy_normalize_name(s: str) -> str:
+    s = legacy_strip_accents_lower(s)
+    s = re.sub(r"\b(pharmacie|pharma|pharm|parapharmacie|para)\b", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def legacy_normalize_address(s: str) -> str:
+    s = legacy_strip_accents_lower(s)
+    replacements = {
+        r"\bav\b": "avenue", r"\bav\.\b": "avenue", r"\bar\b": "avenue",
+        r"\br\b": "rue", r"\br\.\b": "rue", r"\bbd\b": "boulevard",
+        r"\bctr?e?\b": "centre", r"\bctal?\b": "centre", r"\bctal?\.\b": "centre",
+        r"\ball(ee|e|é)e?\b": "allee", r"\bste\b": "sainte", r"\bst\b": "saint",
+        r"centre cial": "centre commercial", r"ctre cial": "centre commercial", r"c cial": "centre commercial",
+    }
+    for pat, rep in replacements.items():
+        s = re.sub(pat, rep, s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+# ----------------------------------------------
+
+
+VOIES = ["Rue", "R.", "Av.", "Avenue", "Bd", "Allée", "Pl.", "Ctre Cial", "C Cial", "Centre Cial", "Quai", "Ste", "St"]
+NOMS  = ["de la Paix", "Foch", "Victor Hugo", "des Roses", "Porte Baron", "Leclerc", "Auchan", "Jean Jaurès", "du Marché"]
+
+
+def synthetic_addresses(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [f"{rng.randint(1, 200)} {rng.choice(VOIES)} {rng.choice(NOMS)} {i}" for i in range(n)]
+
+
+def per_call_us(fn, values) -> float:
+    t0 = time.perf_counter()
+    for v in values:
+        fn(v)
+    return 1e6 * (time.perf_counter() - t0) / len(values)
+
+
+def run(n: int = 20000):
+    addrs = synthetic_addresses(n)
+    names = [f"Pharmacie {a}" for a in addrs]
+
+    diffs = sum(1 for a in addrs if legacy_normalize_address(a) != normalization.normalize_address(a))
+    diffs += sum(1 for s in names if legacy_normalize_name(s) != normalization.normalize_company_name(s))
+
+    # À chaud : chaque adresse revient 10 fois (input + candidats des étapes de la cascade).
+    repeated = addrs[: n // 10] * 10
+
+    for label, legacy, new, values in (
+        ("adresse", legacy_normalize_address, normalization.normalize_address, addrs),
+        ("nom",     legacy_normalize_name,    normalization.normalize_company_name, names),
+    ):
+        before = per_call_us(legacy, values)
+        normalization._strip_accents_lower.cache_clear()
+        normalization._normalize_address.cache_clear()
+        normalization._normalize_company_name.cache_clear()
+        cold = per_call_us(new, values)
+        warm_values = repeated if label == "adresse" else [f"Pharmacie {a}" for a in repeated]
+        before_warm = per_call_us(legacy, warm_values)
+        warm = per_call_us(new, warm_values)
+        print(f"{label:<8} | avant {before:6.2f} µs/appel | après à froid {cold:6.2f} µs/appel | "
+              f"répétées : avant {before_warm:6.2f} µs, après {warm:6.2f} µs")
+
+    print(f"écarts avant/après : {diffs}")
+    return diffs
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000) else 0)
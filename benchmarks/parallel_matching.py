@@ -0,0 +1,57 @@
+"""
+Compare, pour une grosse commande (réassort), le matching produits :
+  - scan complet séquentiel (match_one_item, prune=False) : référence
+  - mode lot (match_items_batch)
+  - mode parallèle (match_items_parallel) avec 2, 4... processus
+vérifie que les résultats sont identiques à la référence et mesure le temps total.
+Le gain dépend des cœurs réellement disponibles (sur Lambda : proportionnel à la mémoire allouée).
+
+Usage : python benchmarks/parallel_matching.py [--sizes 20000 50000] [--lines 150] [--workers 2 4]
+"""
+import argparse
+import os
+import sys
+import time
+
+from synthetic import synthetic_products, synthetic_order_lines
+
+import matching_products
+from matching_products import ProductCatalog, match_one_item, match_items_batch, match_items_parallel
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def run(size: int, n_lines: int, workers_list) -> int:
+    products = synthetic_products(size)
+    lines    = synthetic_order_lines(products, n_lines)
+    catalog  = ProductCatalog(products)
+
+    serial, t_serial = timed(lambda: [match_one_item(catalog, it, prune=False) for it in lines])
+    batch, t_batch   = timed(lambda: match_items_batch(catalog, lines))
+    diffs = sum(a != b for a, b in zip(serial, batch))
+    print(f"{size:>7} products, {n_lines} lignes ({os.cpu_count()} cœurs) | séquentiel {t_serial:7.2f} s | "
+          f"lot {t_batch:7.2f} s (écarts {diffs})")
+
+    for workers in workers_list:
+        parallel, t_par = timed(lambda: match_items_parallel(catalog, lines, workers=workers))
+        d = sum(a != b for a, b in zip(serial, parallel))
+        diffs += d
+        print(f"{'':>7}   parallèle {workers:>2} processus {t_par:7.2f} s  (x{t_serial / t_par:4.1f})  écarts {d}")
+    return diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 50000])
+    parser.add_argument("--lines", type=int, default=150)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    args = parser.parse_args()
+
+    # Le seuil de repli séquentiel ne doit pas masquer la mesure.
+    matching_products.PARALLEL_MIN_ROWS = 0
+    total = sum(run(s, args.lines, args.workers) for s in args.sizes)
+    sys.exit(1 if total else 0)
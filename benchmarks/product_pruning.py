@@ -0,0 +1,77 @@
+"""
+Compare le matching produits en scan complet, avec l'index inversé (élagage des candidats)
+et en mode lot (matrice rapidfuzz cdist + bonus vectorisés) :
+  - vérifie que les résultats sont identiques au scan complet, y compris sur des lignes sans token commun
+    avec le catalogue (pluriels, fautes : le bon product ne partage aucun signal avec l'entrée)
+  - mesure le temps par ligne selon la taille du catalogue
+Puis le top 3 des candidats : scan sans borne (chaque candidat scoré) contre _top_candidates
+(borne max_bonus + score_cutoff rapidfuzz), résultats comparés.
+
+Usage : python benchmarks/product_pruning.py [taille ...]
+"""
+import sys
+import time
+
+from synthetic import synthetic_near_miss_lines, synthetic_products, synthetic_order_lines
+
+from matching_products import (
+    ProductCatalog, match_one_item, match_items_batch, input_features, name_ratio, _score_at, _top_candidates,
+)
+
+
+def unbounded_top(feat, catalog, k):
+    scored = [(pos,) + _score_at(feat, catalog, pos, name_ratio(feat["norm_name"], name))
+              for pos, name in enumerate(catalog.norm_names)]
+    return sorted(scored, key=lambda r: -r[1])[:k]
+
+
+def run(size: int, n_lines: int = 50):
+    products = synthetic_products(size)
+    lines    = synthetic_order_lines(products, n_lines)
+    catalog  = ProductCatalog(products)
+
+    t0 = time.perf_counter()
+    full = [match_one_item(catalog, it, prune=False) for it in lines]
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pruned = [match_one_item(catalog, it, prune=True) for it in lines]
+    t_pruned = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = match_items_batch(catalog, lines)
+    t_batch = time.perf_counter() - t0
+
+    diffs = sum(1 for a, b, c in zip(full, pruned, batch) if not a == b == c)
+    print(f"{size:>7} products | scan complet {1000 * t_full / n_lines:8.2f} ms/ligne | "
+          f"index {1000 * t_pruned / n_lines:8.2f} ms/ligne | lot {1000 * t_batch / n_lines:8.2f} ms/ligne | "
+          f"écarts {diffs}/{n_lines}")
+
+    near = synthetic_near_miss_lines(products, n_lines)
+    t0 = time.perf_counter()
+    near_full = [match_one_item(catalog, it, prune=False, alternatives=2) for it in near]
+    t_near_full = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    near_pruned = [match_one_item(catalog, it, prune=True, alternatives=2) for it in near]
+    t_near_pruned = time.perf_counter() - t0
+    near_diffs = sum(1 for a, b in zip(near_full, near_pruned) if a != b)
+    print(f"{'':>7} near-miss | scan complet {1000 * t_near_full / n_lines:8.2f} ms/ligne | "
+          f"index {1000 * t_near_pruned / n_lines:8.2f} ms/ligne | écarts {near_diffs}/{n_lines}")
+
+    feats = [input_features(it["nom_produit"], it["prix_unitaire"]) for it in lines]
+    t0 = time.perf_counter()
+    ref = [unbounded_top(f, catalog, 3) for f in feats]
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    top = [_top_candidates(f, catalog, range(len(catalog)), 3) for f in feats]
+    t_top = time.perf_counter() - t0
+    top_diffs = sum(1 for a, b in zip(ref, top) if a != b)
+    print(f"{'':>7}   top 3 | sans borne {1000 * t_ref / n_lines:8.2f} ms/ligne | "
+          f"élagué {1000 * t_top / n_lines:8.2f} ms/ligne | écarts {top_diffs}/{n_lines}")
+    return diffs + near_diffs + top_diffs
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 5000, 20000]
+    total = sum(run(s) for s in sizes)
+    sys.exit(1 if total else 0)
@@ -0,0 +1,130 @@
+"""
+Générateurs de données synthétiques (catalogue produits, lignes de commande)
+pour les benchmarks hors-ligne. Aucune dépendance à HubSpot.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda_function"))
+os.environ.setdefault("ACCESS_TOKEN_HUBSPOT", "benchmark-token")
+
+GAMMES     = ["sommeil", "stress", "vitalite", "immunite", "detox", "cheveux", "minceur", "digestion",
+              "energie", "memoire", "articulations", "beaute", "peau", "ongles", "transit", "magnesium"]
+AROMES     = ["fraise", "orange", "citron", "citron vert", "menthe", "framboise", "mangue", ""]
+TAILLES    = [30, 42, 60, 90, 120]
+VARIANTES  = ["", "UG", "PLV", "présentoir", "sachet", "échantillon", "pack", "trousse"]
+
+
+def synthetic_products(n: int, seed: int = 42):
+    """
+    n products au format de l'API HubSpot (id, updatedAt, properties).
+    """
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        gamme  = rng.choice(GAMMES)
+        arome  = rng.choice(AROMES)
+        taille = rng.choice(TAILLES)
+        var    = rng.choice(VARIANTES)
+        name   = " ".join(filter(None, ["Naali Gummies", gamme.capitalize(), arome, f"x{taille}", var, f"R{i}"]))
+        desc   = f"EAN {3760000000000 + i}" if rng.random() < 0.5 else ""
+        out.append({
+            "id": str(100000 + i),
+            # Modifiés à une minute d'intervalle : le delta incrémental ne ramène que les derniers.
+            "updatedAt": (datetime(2024, 1, 1) + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "properties": {
+                "name": name,
+                "price": f"{rng.uniform(2, 40):.2f}",
+                "hs_sku": f"SKU-{i}",
+                "hs_product_id": None,
+                "description": desc,
+            },
+        })
+    return out
+
+
+def synthetic_order_lines(products, n: int, seed: int = 7):
+    """
+    n lignes de commande bruitées à partir des products (fautes, prix arrondis, casse).
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(n):
+        p = rng.choice(products)["properties"]
+        name = p["name"]
+        if rng.random() < 0.3:
+            name = name.upper()
+        if rng.random() < 0.3:
+            name = name.replace("Gummies", "gommies")
+        if rng.random() < 0.2:
+            words = name.split()
+            del words[rng.randrange(len(words))]
+            name = " ".join(words)
+        price = round(float(p["price"]) * rng.uniform(0.95, 1.05), 2)
+        lines.append({"nom_produit": name, "prix_unitaire": price, "quantite": rng.randint(1, 24)})
+    return lines
+
+
+def synthetic_near_miss_lines(products, n: int, seed: int = 13):
+    """
+    n lignes de commande dont les mots diffèrent tous de ceux du catalogue (pluriels, lettre en trop) :
+    aucun token commun avec le product d'origine, seul le fuzzy (et le prix) peut le retrouver.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(n):
+        p = rng.choice(products)["properties"]
+        words = [w + rng.choice("se") for w in p["name"].split() if not w.startswith("R")]
+        lines.append({"nom_produit": " ".join(words), "prix_unitaire": float(p["price"]), "quantite": 1})
+    return lines
+
+
+VOIES     = ["rue", "avenue", "boulevard", "allée", "place", "chemin"]
+VOIES_ABR = {"rue": "R.", "avenue": "Av.", "boulevard": "Bd", "allée": "All.", "place": "Pl.", "chemin": "Ch."}
+RUES      = ["de la Paix", "Foch", "Victor Hugo", "des Roses", "Porte Baron", "Jean Jaurès", "du Marché",
+             "de la Gare", "Pasteur", "de la République", "des Lilas", "Gambetta"]
+ENSEIGNES = ["du Centre", "de la Gare", "des Halles", "du Marché", "Principale", "de la Mairie", "du Parc", "Saint-Michel"]
+MALLS     = ["Centre Commercial Auchan", "C Cial Leclerc", "Centre Cial Carrefour", ""]
+
+
+def synthetic_companies(n: int, seed: int = 11):
+    """
+    n entreprises (pharmacies) au format de l'API HubSpot, ~20 par code postal.
+    """
+    rng = random.Random(seed)
+    zips = [f"{rng.randint(1000, 95999):05d}" for _ in range(max(1, n // 20))]
+    out = []
+    for i in range(n):
+        voie = rng.choice(VOIES)
+        out.append({
+            "id": str(500000 + i),
+            "properties": {
+                "name": f"Pharmacie {rng.choice(ENSEIGNES)} {i}",
+                "address": f"{rng.randint(1, 200)} {voie} {rng.choice(RUES)}",
+                "address2": rng.choice(MALLS),
+                "zip": rng.choice(zips),
+                "client_naali": rng.choice(["true", "false", None]),
+            },
+        })
+    return out
+
+
+def synthetic_company_inputs(companies, n: int, seed: int = 13):
+    """
+    n entrées "entreprise" (nom, adresse, code postal) telles qu'extraites d'un PDF, bruitées.
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        p = rng.choice(companies)["properties"]
+        num, voie, rue = p["address"].split(" ", 2)
+        if rng.random() < 0.5:
+            voie = VOIES_ABR[voie]
+        adresse = f"{num} {voie} {rue}"
+        if p["address2"] and rng.random() < 0.5:
+            adresse = f"{adresse}, {p['address2']}"
+        nom = p["name"].replace("Pharmacie", rng.choice(["Pharmacie", "PHARMACIE", "Pharma", ""])).strip()
+        out.append({"nom": nom, "adresse": adresse, "code_postal": p["zip"]})
+    return out
@@ -0,0 +1,63 @@
+"""
+Build de l'artefact binaire du catalogue produits, hors Lambda (CI, cron) ; le même build est
+disponible dans la Lambda avec event = {"mode": "catalog"} (règle EventBridge planifiée).
+
+Usage : python lambda_function/build_catalog.py [URI] [--check]
+  URI     : chemin local ou s3://bucket/key (défaut : CATALOG_SNAPSHOT_URI)
+  --check : n'appelle pas HubSpot ; relit l'artefact existant et affiche son en-tête et son temps de chargement
+"""
+import argparse
+import sys
+import time
+
+import matching_products
+from storage import map_bytes
+
+
+def check_artifact(uri: str) -> int:
+    raw = map_bytes(uri)
+    if raw is None:
+        print(f"❌ Aucun artefact sur {uri}")
+        return 1
+    try:
+        header = matching_products.artifact_header(raw)
+    except ValueError as e:
+        print(f"❌ {uri} : {e}")
+        return 1
+    finally:
+        if not isinstance(raw, bytes):
+            raw.close()
+
+    t0 = time.perf_counter()
+    catalog = matching_products.load_catalog_snapshot(uri)
+    elapsed = 1000 * (time.perf_counter() - t0)
+    print(f"{uri} : format {header['version']}, features {header['features_version']}, "
+          f"marshal {header['marshal_version']}, {header['size']} octets")
+    if catalog is None:
+        print(f"❌ Artefact périmé (attendu : format {matching_products.CATALOG_ARTIFACT_VERSION}, "
+              f"features {matching_products.CATALOG_FEATURES_VERSION})")
+        return 1
+    print(f"✅ {len(catalog)} products, high-water mark {catalog.high_water_mark}, chargé en {elapsed:.1f} ms")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("uri", nargs="?", default=matching_products.CATALOG_SNAPSHOT_URI)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not args.uri:
+        parser.error("URI absente et CATALOG_SNAPSHOT_URI non défini")
+    if args.check:
+        return check_artifact(args.uri)
+
+    t0 = time.perf_counter()
+    summary = matching_products.build_catalog_artifact(args.uri)
+    print(f"✅ Artefact écrit : {summary['products']} products, {summary['bytes']} octets, "
+          f"{time.perf_counter() - t0:.1f} s ({summary['uri']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from storage import StorageWriteConflict, read_bytes, read_bytes_etag, write_bytes_if
+
+# ========= CACHE DES MATCHINGS ENTREPRISE =========
+# Clé : (code postal, jeton rue, jeton nom) normalisés. Valeur : résultat du matching retenu.
+# En mémoire dans le conteneur (LRU borné + TTL), persistance optionnelle (fichier local ou S3).
+
+COMPANY_CACHE_URI        = os.getenv("COMPANY_CACHE_URI")
+COMPANY_CACHE_MAX        = int(os.getenv("COMPANY_CACHE_MAX", "2000"))
+COMPANY_CACHE_TTL        = int(os.getenv("COMPANY_CACHE_TTL", str(7 * 24 * 3600)))
+# client_naali change quand le client passe d'implantation à réassort : TTL plus court.
+COMPANY_CACHE_NAALI_TTL  = int(os.getenv("COMPANY_CACHE_NAALI_TTL", str(6 * 3600)))
+
+CACHED_FIELDS = ("hs_object_id", "matched_name", "score", "method", "client_naali")
+
+# Plusieurs conteneurs écrivent la même copie persistée : save() relit la copie, y fusionne les seules
+# modifications de l'invocation puis l'écrit conditionnée à l'ETag lu, en relisant si elle a changé entre-temps.
+SAVE_ATTEMPTS = 3
+
+
+class CompanyMatchCache:
+    def __init__(self, max_entries: int = COMPANY_CACHE_MAX, ttl: int = COMPANY_CACHE_TTL,
+                 naali_ttl: int = COMPANY_CACHE_NAALI_TTL, uri: Optional[str] = COMPANY_CACHE_URI):
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.naali_ttl   = naali_ttl
+        self.uri         = uri
+        self._entries    = OrderedDict()
+        self._loaded     = False
+        # Modifications à persister depuis le dernier save() : clé -> entrée, ou None pour une suppression.
+        self._pending    = {}
+        self._lock       = threading.RLock()
+
+    @staticmethod
+    def _key(key: Tuple[str, ...]) -> str:
+        return "|".join(key)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.uri:
+            return
+        try:
+            raw = read_bytes(self.uri)
+        except Exception as e:
+            print(f"⚠️ Cache entreprises illisible ({self.uri}) : {e}")
+            return
+        if raw:
+            self._entries.update(json.loads(raw.decode("utf-8")))
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        """
+        Entrée non expirée (et marquée comme récemment utilisée), sinon None.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            k = self._key(key)
+            entry = self._entries.get(k)
+            if entry is None:
+                return None
+            if time.time() - entry["stored_at"] > self.ttl:
+                # Pas de réécriture pour une simple expiration : save() écarte les entrées expirées.
+                del self._entries[k]
+                return None
+            self._entries.move_to_end(k)
+            return dict(entry)
+
+    def naali_is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["naali_at"] <= self.naali_ttl
+
+    def put(self, key: Tuple[str, ...], result: Dict[str, Any]) -> None:
+        now = time.time()
+        entry = {f: result.get(f) for f in CACHED_FIELDS}
+        entry["stored_at"] = now
+        entry["naali_at"]  = now
+        k = self._key(key)
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[k] = entry
+            self._entries.move_to_end(k)
+            self._evict()
+            self._pending[k] = dict(entry)
+
+    def refresh_naali(self, key: Tuple[str, ...], client_naali: Any) -> None:
+        k = self._key(key)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None:
+                entry["client_naali"] = client_naali
+                entry["naali_at"]     = time.time()
+                # Copie : save() reconnaît ainsi une modification faite pendant son écriture.
+                self._pending[k] = dict(entry)
+
+    def invalidate(self, key: Tuple[str, ...]) -> None:
+        k = self._key(key)
+        with self._lock:
+            # Suppression aussi propagée à la copie persistée, même si l'entrée n'est plus dans la vue locale.
+            self._entries.pop(k, None)
+            self._pending[k] = None
+
+    def _merge(self, stored: Dict[str, Any], pending: Dict[str, Any]) -> "OrderedDict[str, Any]":
+        """
+        Copie persistée + modifications de l'invocation. Pour une même clé, l'entrée la plus récemment
+        rafraîchie l'emporte (un autre conteneur a pu l'écrire après nous) ; les entrées expirées sont écartées.
+        """
+        now = time.time()
+        merged = OrderedDict((k, e) for k, e in stored.items() if now - e["stored_at"] <= self.ttl)
+        for k, entry in pending.items():
+            if entry is None:
+                merged.pop(k, None)
+            elif k not in merged or merged[k]["naali_at"] <= entry["naali_at"]:
+                merged[k] = entry
+                merged.move_to_end(k)
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+        return merged
+
+    def save(self) -> None:
+        """
+        Persiste les modifications de l'invocation (no-op sans URI ou sans insertion, rafraîchissement ou
+        invalidation) : fusion avec la copie persistée, écriture conditionnée à son ETag.
+        """
+        with self._lock:
+            if not self.uri or not self._pending:
+                return
+            pending = dict(self._pending)
+        try:
+            for _ in range(SAVE_ATTEMPTS):
+                raw, etag = read_bytes_etag(self.uri)
+                merged = self._merge(json.loads(raw.decode("utf-8")) if raw else {}, pending)
+                body = json.dumps(merged, ensure_ascii=False, separators=(",", ":"))
+                try:
+                    write_bytes_if(self.uri, body.encode("utf-8"), etag, content_type="application/json")
+                except StorageWriteConflict:
+                    continue
+                with self._lock:
+                    for k, entry in pending.items():
+                        if self._pending.get(k) is entry:
+                            del self._pending[k]
+                return
+            print(f"⚠️ Cache entreprises ({self.uri}) modifié en continu par d'autres invocations : écriture reportée")
+        except Exception as e:
+            print(f"⚠️ Échec de l'écriture du cache entreprises ({self.uri}) : {e}")
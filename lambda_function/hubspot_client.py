@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any, Dict, Optional
+
+import tracing
+
+# ========= CLIENT HTTP HUBSPOT PARTAGÉ =========
+# Une seule session (pool keep-alive) par conteneur Lambda, réutilisée entre invocations à chaud.
+
+HUBSPOT_API_BASE = os.getenv("HUBSPOT_API_BASE", "https://api.hubapi.com").rstrip("/")
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT    = 20
+POOL_MAXSIZE    = 20
+RETRY_MAX       = 4
+BACKOFF_BASE    = 0.5   # secondes, doublé à chaque tentative
+
+# ========= BUDGETS DE DÉBIT (token buckets) =========
+# L'API search a son propre plafond, bien plus bas que le reste de l'API CRM.
+# Valeurs par défaut avec une marge sous les limites d'une app privée ; ajustables par portail.
+SEARCH_RATE_PER_SEC = float(os.getenv("HUBSPOT_SEARCH_RATE", "4"))
+CRM_RATE_PER_SEC    = float(os.getenv("HUBSPOT_CRM_RATE", "9"))
+# Attente max pour obtenir un jeton avant de lever HubSpotRateLimitError.
+RATE_LIMIT_MAX_WAIT = float(os.getenv("HUBSPOT_RATE_LIMIT_MAX_WAIT", "30"))
+
+
+class HubSpotError(Exception):
+    """
+    Erreur de disponibilité HubSpot. Volontairement hors de RuntimeError : les `except RuntimeError`
+    des fallbacks métier ne doivent pas la capturer (elle remonte jusqu'au handler).
+    """
+
+
+class HubSpotRateLimitError(HubSpotError):
+    """
+    Budget de débit HubSpot épuisé (attente max dépassée ou 429 persistants).
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate          = rate
+        self.capacity      = capacity or rate
+        self.tokens        = self.capacity
+        self.updated       = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock         = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait: float = RATE_LIMIT_MAX_WAIT) -> bool:
+        """
+        Prend un jeton, en attendant si besoin. False si l'attente dépasserait max_wait.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def block_for(self, seconds: float) -> None:
+        # Retry-After / quota épuisé : plus aucun jeton pendant `seconds`.
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def observe(self, remaining: int, interval_s: float) -> None:
+        # Aligne le bucket sur le quota restant annoncé par HubSpot pour la fenêtre en cours.
+        with self._lock:
+            self.tokens = min(self.tokens, float(remaining))
+        if remaining <= 0:
+            self.block_for(interval_s)
+
+
+_buckets = {
+    "search": TokenBucket(SEARCH_RATE_PER_SEC),
+    "crm"   : TokenBucket(CRM_RATE_PER_SEC),
+}
+
+def budget_for(path: str) -> str:
+    return "search" if path.rstrip("/").endswith("/search") else "crm"
+
+def throttle(budget: str = "crm") -> None:
+    """
+    Consomme un jeton du budget (pour les appels HubSpot hors de ce client, ex. SDK).
+    """
+    if not _buckets[budget].acquire():
+        raise HubSpotRateLimitError(f"Budget HubSpot '{budget}' épuisé (attente > {RATE_LIMIT_MAX_WAIT}s).")
+
+def _observe_headers(budget: str, resp: requests.Response) -> None:
+    remaining = resp.headers.get("X-HubSpot-RateLimit-Remaining")
+    interval  = resp.headers.get("X-HubSpot-RateLimit-Interval-Milliseconds")
+    if remaining is None:
+        return
+    try:
+        _buckets[budget].observe(int(remaining), int(interval or 10000) / 1000.0)
+    except ValueError:
+        pass
+
+_session: Optional[requests.Session] = None
+_env_loaded = False
+
+def load_env() -> None:
+    """
+    Charge le .env local une seule fois (python-dotenv optionnel, absent en Lambda).
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+def get_token() -> str:
+    """
+    Token d'app privée, résolu à l'appel (et non à l'import des modules).
+    """
+    load_env()
+    token = os.getenv("ACCESS_TOKEN_HUBSPOT")
+    if not token:
+        raise RuntimeError(
+            "ACCESS_TOKEN_HUBSPOT absent. "
+            "Exporte la variable d’environnement avec le token d’app privée HubSpot."
+        )
+    return token.strip()
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        session = requests.Session()
+        # Retries urllib3 limités aux erreurs de connexion (requête jamais partie) ;
+        # les statuts HTTP (dont 429 + Retry-After) sont gérés dans request().
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=POOL_MAXSIZE,
+            max_retries=Retry(total=RETRY_MAX, connect=RETRY_MAX, read=0, status=0, backoff_factor=BACKOFF_BASE,
+                              respect_retry_after_header=False),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        _session = session
+    return _session
+
+def url(path: str) -> str:
+    return path if path.startswith("http") else f"{HUBSPOT_API_BASE}{path}"
+
+def _retry_delay(resp: requests.Response, attempt: int) -> float:
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return BACKOFF_BASE * (2 ** attempt)
+
+def request(method: str, path: str, params: Optional[Dict[str, Any]] = None, json: Any = None,
+            idempotent: Optional[bool] = None, timeout=None, budget: Optional[str] = None) -> requests.Response:
+    """
+    Appel HubSpot authentifié via la session partagée, cadencé par le budget de débit
+    ("search" pour les endpoints /search, "crm" sinon).
+    - 429 : le budget est suspendu (Retry-After) puis l'appel rejoué ; HubSpotRateLimitError si ça persiste.
+    - 5xx : rejoué seulement si l'appel est idempotent (GET par défaut, ou idempotent=True).
+    Retourne la dernière réponse ; le contrôle du statut reste à l'appelant.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method == "GET"
+    budget = budget or budget_for(path)
+    headers = {"Authorization": f"Bearer {get_token()}"}
+
+    for attempt in range(RETRY_MAX + 1):
+        throttle(budget)
+        resp = get_session().request(
+            method, url(path), headers=headers, params=params, json=json,
+            timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        _observe_headers(budget, resp)
+        tracing.count("hubspot_calls")
+        if attempt:
+            tracing.count("retries")
+
+        if resp.status_code == 429:
+            tracing.count("rate_limited")
+            if attempt == RETRY_MAX:
+                raise HubSpotRateLimitError(
+                    f"HubSpot 429 persistant sur {path} après {RETRY_MAX + 1} tentatives : {resp.text}"
+                )
+            _buckets[budget].block_for(_retry_delay(resp, attempt))
+            continue
+
+        if not (idempotent and resp.status_code >= 500) or attempt == RETRY_MAX:
+            return resp
+        time.sleep(_retry_delay(resp, attempt))
+    return resp
+
+def get(path: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+    return request("GET", path, params=params, **kwargs)
+
+def post(path: str, json: Any = None, **kwargs) -> requests.Response:
+    return request("POST", path, json=json, **kwargs)
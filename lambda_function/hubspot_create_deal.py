@@ -1,18 +1,67 @@
-from tools             import *
-from matching_company  import *
-from matching_products import *
+from tools import (
+    DEAL_FINAL_STATUSES,
+    DEAL_LATEST_CURSOR_KEY,
+    connexion_aws,
+    create_transaction_with_line_product,
+    deal_base_name,
+    find_last_deal_json,
+    get_deal_status,
+    list_deal_json_files,
+    load_deal_cursor,
+    load_deal_log,
+    read_json_object,
+    s3_event_objects,
+    save_deal_cursor,
+    save_deal_log,
+)
+from matching_company  import find_hubspot_company_ids
+from matching_products import build_catalog_artifact, ensure_catalog, match_products_preserve_shape
+import tracing
 
-import json, re
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+BUCKET = "hubspot-tickets-pdf"
+FOLDER = "DEAL_JSON"
+
+# Nombre de DEAL JSON traités en parallèle en mode backlog.
+BACKLOG_CONCURRENCY = 4
+
+# Mode du matching entreprise (voir find_hubspot_company_ids). Par défaut "sequential" : le moins de
+# recherches (environ 1,8 par DEAL), l'API search ayant le plafond le plus bas (4/s, partagé avec les threads
+# du backlog). "concurrent" (latence minimale, environ 4,9 recherches par DEAL) est à activer explicitement.
+COMPANY_MATCH_MODE = os.getenv("COMPANY_MATCH_MODE", "sequential")
 
 
 def lambda_handler(event, context):
     """
     Lambda pour créer la transaction dans Hubspot depuis le dernier JSON DEAL
     et mettre à jour le log existant correspondant au PDF.
+
+    Avec event = {"mode": "backlog"}, traite tous les DEAL JSON pas encore traités
+    (d'après le statut DEAL de leur log) au lieu du seul dernier.
+
+    Avec un événement S3 ObjectCreated (direct ou via SQS), traite exactement les DEAL JSON
+    nommés par l'événement, sans lister le bucket.
+
+    Avec event = {"mode": "catalog"} (tâche planifiée), reconstruit le catalogue produits depuis
+    HubSpot et réécrit son artefact binaire (CATALOG_SNAPSHOT_URI), sans traiter de DEAL JSON.
     """
+    return handle_event(event)
+
 
-    BUCKET = "hubspot-tickets-pdf"
-    FOLDER = "DEAL_JSON"
+def handle_event(event, process_file=None) -> dict:
+    """
+    Corps du handler, commun aux variantes : `process_file` traite un DEAL JSON chargé
+    (signature de process_deal_file, utilisé par défaut).
+    """
+    process_file = process_file or process_deal_file
+
+    if (event or {}).get("mode") == "catalog":
+        return build_catalog_step()
 
     # ----------------------------------------------------------->
     # (1) Connexion AWS
@@ -25,185 +74,494 @@ def lambda_handler(event, context):
     s3_client = aws_conn["client"]
     # ----------------------------------------------------------->
 
+    if (event or {}).get("mode") == "backlog":
+        return process_backlog(s3_client, process_file)
+
+    if (event or {}).get("Records"):
+        return process_s3_event(s3_client, event, process_file)
+
+    trace = tracing.Trace()
     try:
         
         # ----------------------------------------------------------->
-        # (2) Récupérer le dernier JSON DEAL.
-        llm_data, file_name = get_last_json(
-            s3_client, bucket=BUCKET, prefix=FOLDER
-        )
+        # (2) Récupérer le dernier JSON DEAL (listing paginé à partir du curseur de ce mode) et son log.
+        with trace.span("s3_fetch"):
+            cursor    = load_deal_cursor(s3_client, bucket=BUCKET, key=DEAL_LATEST_CURSOR_KEY)
+            last      = find_last_deal_json(s3_client, bucket=BUCKET, prefix=FOLDER, cursor=cursor)
+            file_name = last["Key"]
+            llm_data, deal_log = _load_deal_and_log(s3_client, file_name)
         # ----------------------------------------------------------->
 
+    except Exception as e:
+        print(f"❌ Erreur inattendue : {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"status": "error", "message": str(e)}),
+        }
+
+    response = process_file(s3_client, file_name, llm_data, deal_log=deal_log, trace=trace)
+
+    # Le curseur n'avance que si le fichier a pu être traité (log mis à jour). Curseur propre à ce mode :
+    # les fichiers plus anciens sautés ici restent visibles pour le backlog.
+    if response["statusCode"] != 500 and last["Key"] != (cursor or {}).get("key"):
+        _advance_cursor(s3_client, last, key=DEAL_LATEST_CURSOR_KEY)
+    return response
+
+
+def _advance_cursor(s3_client, obj: dict, **kwargs):
+    try:
+        save_deal_cursor(s3_client, bucket=BUCKET, obj=obj, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Échec de l'écriture du curseur DEAL_JSON : {e}")
+
+
+def process_deal_file(s3_client, file_name: str, llm_data: dict, sync_catalog: bool = True,
+                      deal_log: dict = None, trace: tracing.Trace = None) -> dict:
+    """
+    Crée la transaction Hubspot pour un DEAL JSON et met à jour le log du PDF correspondant.
+    sync_catalog : synchronise le delta du catalogue produits avant le matching
+                   (désactivé quand l'appelant l'a déjà fait pour un lot de fichiers).
+    deal_log     : log du PDF déjà chargé par l'appelant (load_deal_log), sinon lu ici.
+    trace        : trace démarrée par l'appelant (lecture S3 déjà chronométrée), sinon créée ici.
+    Durées et compteurs par étape : enregistrés dans workflow.DEAL.metrics du log et émis en EMF.
+    """
+    trace = trace or tracing.Trace()
+    with tracing.activate(trace):
+        response = _process_deal_file(s3_client, file_name, llm_data, sync_catalog, deal_log, trace)
+    trace.emit(File=file_name, StatusCode=response["statusCode"])
+    return response
+
+
+def _write_log(s3_client, deal_log: dict, trace: tracing.Trace):
+    # Les métriques sont figées avant l'écriture : la durée de log_write n'est visible qu'en EMF.
+    deal_log["data"]["workflow"]["DEAL"]["metrics"] = trace.as_dict()
+    with trace.span("log_write"):
+        save_deal_log(s3_client, BUCKET, deal_log)
+
+
+def _write_final_log(s3_client, deal_log: dict, trace: tracing.Trace, response: dict) -> dict:
+    # ----------------------------------------------------------->
+    # (11) Écriture unique du log, quelle que soit l'issue (IfMatch sur l'ETag lu).
+    # Un échec d'écriture rend la réponse en erreur sans nouvelle tentative d'écriture.
+    if deal_log is None:
+        return response
+    try:
+        _write_log(s3_client, deal_log, trace)
+    except Exception as e:
+        print(f"❌ Échec de l'écriture du log ({deal_log['key']}) : {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"status": "error", "message": str(e)}),
+        }
+    print(f"✅ Log mis à jour dans S3 ({deal_log['key']})")
+    return response
+
+
+# ===================== CHECKPOINTS =====================
+# Chaque étape terminée est enregistrée dans workflow.DEAL.checkpoint du log du PDF : matching entreprise
+# (trouvée), matching produits (tous trouvés), ID de la transaction, lignes produits créées. Une nouvelle
+# invocation pour le même DEAL JSON (retry, timeout, backlog) reprend à la première étape non terminée :
+# pas de second matching, pas de transaction en double, seules les lignes produits manquantes sont postées.
+
+def _deal_checkpoint(log_data: dict, llm_data: dict) -> dict:
+    """
+    Checkpoint du log pour ce DEAL JSON (créé si absent). Celui d'un autre contenu
+    (DEAL JSON régénéré pour le même PDF) est remplacé : tout est refait.
+    """
+    deal   = log_data["workflow"]["DEAL"]
+    source = hashlib.sha1(json.dumps(llm_data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    checkpoint = deal.get("checkpoint") or {}
+    if checkpoint.get("source") != source:
+        if checkpoint:
+            print("⚠️ DEAL JSON modifié depuis le dernier passage : checkpoint ignoré")
+        checkpoint = deal["checkpoint"] = {"source": source}
+    return checkpoint
+
+
+def _process_deal_file(s3_client, file_name: str, llm_data: dict, sync_catalog: bool,
+                       deal_log: dict, trace: tracing.Trace) -> dict:
+
+    try:
+
         # ----------------------------------------------------------->
         # (3) Extraire le nom du fichier PDF.
-        match = re.search(r"\[(.*?)\]", file_name)
-        if not match:
+        base_name = deal_base_name(file_name)
+        if not base_name:
             raise ValueError("Impossible d'extraire le nom du PDF depuis le fichier JSON")
-        base_name = match.group(1)
-        print(f"📄 Dernier fichier DEAL trouvé : {base_name}")
+        print(f"📄 Fichier DEAL à traiter : {base_name}")
         # ----------------------------------------------------------->
 
         # ----------------------------------------------------------->
-        # (4) Charger le log JSON correspondant.
-        log_key     = f"LOGS/log_[{base_name}].json"
-        log_obj     = s3_client.get_object(Bucket=BUCKET, Key=log_key)
-        log_content = log_obj["Body"].read().decode("utf-8")
-        log_data    = json.loads(log_content)
+        # (4) Charger le log JSON correspondant (sauf s'il a été lu avec le DEAL JSON).
+        if deal_log is None:
+            with trace.span("log_load"):
+                deal_log = load_deal_log(s3_client, bucket=BUCKET, base_name=base_name)
+        log_data   = deal_log["data"]
+        checkpoint = _deal_checkpoint(log_data, llm_data)
         # ----------------------------------------------------------->
 
         # ----------------------------------------------------------->
-        # (5) Matching Entreprise (depuis PDF -> Hubspot).
-        infos_entreprise_pdf = llm_data["entreprise"]
-        matching_company     = find_hubspot_company_ids(
-            [infos_entreprise_pdf], min_score=75
-        )
+        # (5) Matching Entreprise (depuis PDF -> Hubspot), sauf s'il a déjà abouti.
+        matching_company = checkpoint.get("matching_company")
+        if matching_company is None:
+            infos_entreprise_pdf = llm_data["entreprise"]
+            with trace.span("company_match"):
+                matching_company = find_hubspot_company_ids(
+                    [infos_entreprise_pdf], min_score=75, mode=COMPANY_MATCH_MODE, use_cache=True
+                )
+        else:
+            print("⏩ Matching entreprise repris du checkpoint")
         # ----------------------------------------------------------->
 
         # Si l'entreprise n'a pas été retrouvé, un enregistre le logging avec l'erreur.
         if matching_company.get("match") != "found":
-            log_data["workflow"]["DEAL"]["status"]  = "Failed"
-            log_data["workflow"]["DEAL"]["details"] = "Aucun matching entreprise trouvé"
-            s3_client.put_object(
-                Bucket=BUCKET,
-                Key=log_key,
-                Body=json.dumps(log_data, ensure_ascii=False, indent=2),
-                ContentType="application/json",
-            )
-            return {
-                "statusCode": 404,
-                "body": json.dumps({
-                    "status": "failed",
-                    "message": "Aucun matching Hubspot trouvé pour l'entreprise"
-                }),
-            }
-        # ----------------------------------------------------------->
+            response = _company_not_found(log_data)
 
-        # ----------------------------------------------------------->
-        # (6) Matching Produits (depuis PDF -> Hubspot).
-        infos_produits_pdf = llm_data["produits"]
-        matching_products  = match_products_preserve_shape(
-            infos_produits_pdf, min_score=78, force_refresh=True
-        )
+        else:
+            # ----------------------------------------------------------->
+            # (6) Matching Produits (depuis PDF -> Hubspot), sauf s'il a déjà abouti.
+            matching_products = checkpoint.get("matching_products")
+            if matching_products is None:
+                infos_produits_pdf = llm_data["produits"]
+                with trace.span("product_match"):
+                    matching_products = match_products_preserve_shape(
+                        infos_produits_pdf, min_score=78, incremental=sync_catalog, alternatives=2
+                    )
+            else:
+                print("⏩ Matching produits repris du checkpoint")
 
-        # Liste permettent d'enregistrer les produits non retrouvés sur Hubspot.
-        missing_matching_products = []
-        for i in matching_products:
-            
-            # Récupération du nom du produit en input.
-            product_name = i["input"]["nom_produit"]
-
-            # Si le produit n'as pas été retrouvé sur Hubspot, on l'ajoute à la liste.
-            if i["match"] == "no_match":
-                missing_matching_products.append(product_name)
-
-            # Enregistrement du résultat du matching du produit dans le logging.
-            log_data["workflow"]["DEAL"]["matching_products"][product_name] = {
-                "match"         : i["match"],
-                "hs_object_id"  : i["hs_object_id"],
-                "matched_name"  : i["matched_name"],
-                "matched_price" : i["matched_price"],
-                "score"         : i["score"],
-                "method"        : i["method"],
-            }
-
-        # Enregistrement dans le logging les produits non retrouvées sur Hubspot.
-        if missing_matching_products:
-            log_data["workflow"]["DEAL"]["status"]  = "Failed"
-            log_data["workflow"]["DEAL"]["details"] = (f"Matching non retrouvé pour les produits : {missing_matching_products}")
-            s3_client.put_object(
-                Bucket=BUCKET,
-                Key=log_key,
-                Body=json.dumps(log_data, ensure_ascii=False, indent=2),
-                ContentType="application/json",
-            )
-            return {
-                "statusCode": 404,
-                "body": json.dumps({
-                    "status": "failed",
-                    "message": f"Matching non retrouvé pour les produits : {missing_matching_products}"
-                }),
-            }
-        # ----------------------------------------------------------->
+            response = _complete_deal(s3_client, base_name, deal_log, llm_data,
+                                      matching_company, matching_products, trace)
 
-        # ----------------------------------------------------------->
-        # (7) Préparation des lignes produits en y associant leurs ID hubspot.
-        ligne_produits = []
-        for i in matching_products:
-            produit = {
-                "name"         : i["matched_name"],
-                "price"        : i["matched_price"],
-                "quantity"     : i["input"]["quantite"],
-                "hs_product_id": i["hs_object_id"],
-            }
-            ligne_produits.append(produit)
-        # ----------------------------------------------------------->
+    except Exception as e:
+        response = _failed_response(deal_log, e)
 
-        # ----------------------------------------------------------->
-        # (8) Création de la transaction Hubspot.
-        commande = {
-            "nom"            : llm_data.get("entreprise", {}).get("nom"),
-            "id_hubspot"     : matching_company.get("hs_object_id"),
-            "is_naali_client": matching_company.get("client_naali"),
-            "total_price"    : llm_data.get("total"),
-            "products"       : ligne_produits,
-        }
+    return _write_final_log(s3_client, deal_log, trace, response)
 
-        deal_id = create_transaction_with_line_product(commande=commande)
-        print(f"✅ Transaction créée dans Hubspot pour le PDF {base_name}")
-        # ----------------------------------------------------------->
 
-        # ----------------------------------------------------------->
-        # (9) Mise à jour du logging.
-        log_data["workflow"]["DEAL"]["status"]                  = "Success"
-        log_data["workflow"]["DEAL"]["details"]                 = "Created in Hubspot"
-        log_data["workflow"]["DEAL"]["transaction"]["dealname"] = "TEST-" + commande["nom"]
-        log_data["workflow"]["DEAL"]["transaction"]["id_deal"]  = deal_id
+def _company_not_found(log_data: dict) -> dict:
+    log_data["workflow"]["DEAL"]["status"]  = "Failed"
+    log_data["workflow"]["DEAL"]["details"] = "Aucun matching entreprise trouvé"
+    return {
+        "statusCode": 404,
+        "body": json.dumps({
+            "status": "failed",
+            "message": "Aucun matching Hubspot trouvé pour l'entreprise"
+        }),
+    }
+
+
+def _complete_deal(s3_client, base_name: str, deal_log: dict, llm_data: dict,
+                   matching_company: dict, matching_products: list, trace: tracing.Trace) -> dict:
+    """
+    Suite du pipeline une fois les deux matchings connus (l'entreprise a été trouvée) :
+    contrôle des produits, création de la transaction, mise à jour du log en mémoire.
+    Reprend la transaction et les lignes produits du checkpoint (_deal_checkpoint déjà appelé).
+    """
+    log_data   = deal_log["data"]
+    checkpoint = log_data["workflow"]["DEAL"]["checkpoint"]
+    checkpoint["matching_company"] = matching_company
+
+    # Liste permettent d'enregistrer les produits non retrouvés sur Hubspot.
+    missing_matching_products = []
+    for i in matching_products:
         
-        # Enregistrement du résultat du matching enrreprise.
-        log_data["workflow"]["DEAL"]["matching_company"]             = {
-            "match"        : matching_company.get("match"),
-            "hs_object_id" : matching_company.get("hs_object_id"),
-            "matched_name" : matching_company.get("matched_name"),
-            "score"        : matching_company.get("score"),
-            "method"       : matching_company.get("method"),
-            "client_naali" : matching_company.get("client_naali"),
-        }
+        # Récupération du nom du produit en input.
+        product_name = i["input"]["nom_produit"]
 
-        s3_client.put_object(
-            Bucket=BUCKET,
-            Key=log_key,
-            Body=json.dumps(log_data, ensure_ascii=False, indent=2),
-            ContentType="application/json",
-        )
-        print(f"✅ Log mis à jour dans S3 ({log_key})")
-        # ----------------------------------------------------------->
+        # Si le produit n'as pas été retrouvé sur Hubspot, on l'ajoute à la liste.
+        if i["match"] == "no_match":
+            missing_matching_products.append(product_name)
 
+        # Enregistrement du résultat du matching du produit dans le logging.
+        log_data["workflow"]["DEAL"]["matching_products"][product_name] = {
+            "match"         : i["match"],
+            "hs_object_id"  : i["hs_object_id"],
+            "matched_name"  : i["matched_name"],
+            "matched_price" : i["matched_price"],
+            "score"         : i["score"],
+            "method"        : i["method"],
+            # Candidats suivants (matching fuzzy) : un écart faible signale une variante ambiguë (x42 / x60…).
+            "ambiguous"     : i.get("ambiguous", False),
+            "alternatives"  : [
+                {"hs_object_id": a["hs_object_id"], "matched_name": a["matched_name"], "score": a["score"]}
+                for a in i.get("alternatives", [])
+            ],
+        }
+
+    # Enregistrement dans le logging les produits non retrouvées sur Hubspot.
+    if missing_matching_products:
+        log_data["workflow"]["DEAL"]["status"]  = "Failed"
+        log_data["workflow"]["DEAL"]["details"] = (f"Matching non retrouvé pour les produits : {missing_matching_products}")
         return {
-            "statusCode": 200,
+            "statusCode": 404,
             "body": json.dumps({
-                "status": "ok",
-                "message": f"Transaction créée pour le fichier PDF {base_name}"
+                "status": "failed",
+                "message": f"Matching non retrouvé pour les produits : {missing_matching_products}"
             }),
         }
+    checkpoint["matching_products"] = matching_products
+    # ----------------------------------------------------------->
+
+    # ----------------------------------------------------------->
+    # (7) Préparation des lignes produits en y associant leurs ID hubspot
+    # (hors lignes déjà créées lors d'un passage précédent).
+    created_line_items = checkpoint.setdefault("line_items", {})
+    pending = [idx for idx in range(len(matching_products)) if str(idx) not in created_line_items]
+    ligne_produits = []
+    for i in (matching_products[idx] for idx in pending):
+        produit = {
+            "name"         : i["matched_name"],
+            "price"        : i["matched_price"],
+            "quantity"     : i["input"]["quantite"],
+            "hs_product_id": i["hs_object_id"],
+        }
+        ligne_produits.append(produit)
+    # ----------------------------------------------------------->
+
+    # ----------------------------------------------------------->
+    # (8) Création de la transaction Hubspot.
+    commande = {
+        "nom"            : llm_data.get("entreprise", {}).get("nom"),
+        "id_hubspot"     : matching_company.get("hs_object_id"),
+        "is_naali_client": matching_company.get("client_naali"),
+        "total_price"    : llm_data.get("total"),
+        "products"       : ligne_produits,
+    }
+
+    # Checkpoint écrit dès la création de la transaction, avant les lignes produits : une invocation
+    # interrompue ensuite la reprend au lieu d'en créer une seconde. Seule écriture du log en cours
+    # de pipeline ; l'ETag obtenu conditionne l'écriture finale. Si elle échoue (LogWriteConflict
+    # compris), aucune ligne n'est postée : le pipeline s'arrête en erreur avec l'ID dans le log en mémoire.
+    def _deal_created(deal_id):
+        checkpoint["deal_id"] = deal_id
+        log_data["workflow"]["DEAL"]["transaction"]["id_deal"] = deal_id
+        try:
+            _write_log(s3_client, deal_log, trace)
+        except Exception as e:
+            raise RuntimeError(
+                f"Transaction {deal_id} créée mais checkpoint non enregistré ({deal_log['key']}) : {e}. "
+                "Lignes produits non postées."
+            ) from e
+
+    if checkpoint.get("deal_id") is not None and not pending:
+        print(f"⏩ Transaction {checkpoint['deal_id']} et lignes produits déjà créées (checkpoint)")
+        transaction = {"deal_id": checkpoint["deal_id"], "line_items": {"created": {}, "failed": {}}}
+    else:
+        with trace.span("deal_creation"):
+            transaction = create_transaction_with_line_product(
+                commande=commande, deal_id=checkpoint.get("deal_id"), on_deal_created=_deal_created,
+                known_line_items=list(created_line_items.values()),
+            )
+    deal_id     = transaction["deal_id"]
+    line_items  = {
+        "created": {str(pending[int(k)]): v for k, v in transaction["line_items"]["created"].items()},
+        "failed" : {str(pending[int(k)]): v for k, v in transaction["line_items"]["failed"].items()},
+    }
+    checkpoint["deal_id"] = deal_id
+    created_line_items.update(line_items["created"])
+    print(f"✅ Transaction créée dans Hubspot pour le PDF {base_name}")
+    # ----------------------------------------------------------->
+
+    # ----------------------------------------------------------->
+    # (9) Mise à jour du logging.
+    log_data["workflow"]["DEAL"]["status"]                  = "Success"
+    log_data["workflow"]["DEAL"]["details"]                 = "Created in Hubspot"
+    log_data["workflow"]["DEAL"]["transaction"]["dealname"] = "TEST-" + commande["nom"]
+    log_data["workflow"]["DEAL"]["transaction"]["id_deal"]  = deal_id
+
+    # Enregistrement des lignes produits créées / en échec (clé = nom du produit en input).
+    log_data["workflow"]["DEAL"]["transaction"]["line_items"] = {
+        matching_products[int(idx)]["input"]["nom_produit"]: {"line_item_id": line_item_id}
+        for idx, line_item_id in created_line_items.items()
+    }
+    for idx, error in line_items["failed"].items():
+        product_name = matching_products[int(idx)]["input"]["nom_produit"]
+        log_data["workflow"]["DEAL"]["transaction"]["line_items"][product_name] = {"error": error}
+    if line_items["failed"]:
+        log_data["workflow"]["DEAL"]["details"] = (
+            f"Created in Hubspot, lignes produits en échec : {len(line_items['failed'])}"
+        )
+    
+    # Enregistrement du résultat du matching enrreprise.
+    log_data["workflow"]["DEAL"]["matching_company"]             = {
+        "match"        : matching_company.get("match"),
+        "hs_object_id" : matching_company.get("hs_object_id"),
+        "matched_name" : matching_company.get("matched_name"),
+        "score"        : matching_company.get("score"),
+        "method"       : matching_company.get("method"),
+        "client_naali" : matching_company.get("client_naali"),
+    }
+    # ----------------------------------------------------------->
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "status": "ok",
+            "message": f"Transaction créée pour le fichier PDF {base_name}"
+        }),
+    }
+
+
+def _failed_response(deal_log: dict, e: Exception) -> dict:
+    # ----------------------------------------------------------->
+    # (10) Gestion d'erreur.
+    print(f"❌ Erreur inattendue : {e}")
+    if deal_log is not None:
+        deal_log["data"]["workflow"]["DEAL"]["status"]  = "Failed"
+        deal_log["data"]["workflow"]["DEAL"]["details"] = str(e)
+
+    return {
+        "statusCode": 500,
+        "body": json.dumps({"status": "error", "message": str(e)}),
+    }
+
+
+def build_catalog_step() -> dict:
+    """
+    Build planifié de l'artefact catalogue : les conteneurs suivants le rechargent au démarrage
+    au lieu de paginer tous les products HubSpot.
+    """
+    try:
+        summary = build_catalog_artifact()
+    except Exception as e:
+        print(f"❌ Échec du build de l'artefact catalogue : {e}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"status": "error", "message": str(e)}),
+        }
+    print(f"✅ Artefact catalogue écrit : {summary['products']} products, {summary['bytes']} octets ({summary['uri']})")
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"status": "success", **summary}),
+    }
+
+
+def process_backlog(s3_client, process_file=None) -> dict:
+    """
+    Traite tous les DEAL JSON dont le log n'a pas encore de statut DEAL final, du plus ancien
+    au plus récent, avec une concurrence bornée. Le catalogue produits est synchronisé une seule
+    fois pour tout le lot ; le pool HTTP HubSpot est partagé.
+    Seuls les fichiers plus récents que le curseur sont examinés ; le curseur avance ensuite
+    jusqu'au premier fichier dont le log n'a pas de statut final après traitement (log absent,
+    erreur, écriture refusée) : il sera réexaminé au prochain passage.
+    """
+    try:
+        cursor = load_deal_cursor(s3_client, bucket=BUCKET)
+        files  = [f for f in list_deal_json_files(s3_client, bucket=BUCKET, prefix=FOLDER, cursor=cursor)
+                  if deal_base_name(f["Key"])]
+        keys   = [f["Key"] for f in files]
+        statuses = _deal_statuses(s3_client, keys)
+
+        # Log absent : le PDF n'est pas (encore) suivi, on ne peut pas enregistrer le résultat.
+        todo = [k for k, st in zip(keys, statuses) if st is not None and st not in DEAL_FINAL_STATUSES]
+        print(f"📚 Backlog : {len(todo)} DEAL JSON à traiter sur {len(keys)}")
+
+        responses = process_deal_keys(s3_client, todo, process_file)
+
+        # Statuts relus sur S3 après traitement : seul le log écrit fait foi (la réponse ne dit pas
+        # si l'écriture finale a abouti, ni ce qu'une invocation concurrente y a mis).
+        after = dict(zip(todo, _deal_statuses(s3_client, todo)))
+        new_cursor = None
+        for f, st in zip(files, statuses):
+            if after.get(f["Key"], st) not in DEAL_FINAL_STATUSES:
+                break
+            new_cursor = f
 
     except Exception as e:
-        
-        # ----------------------------------------------------------->
-        # (10) Gestion d'erreur.
         print(f"❌ Erreur inattendue : {e}")
-        if "log_data" in locals() and "log_key" in locals():
-            log_data["workflow"]["DEAL"]["status"]  = "Failed"
-            log_data["workflow"]["DEAL"]["details"] = str(e)
-            s3_client.put_object(
-                Bucket=BUCKET,
-                Key=log_key,
-                Body=json.dumps(log_data, ensure_ascii=False, indent=2),
-                ContentType="application/json",
-            )
-            print(f"⚠️ Log mis à jour avec l'erreur ({log_key})")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"status": "error", "message": str(e)}),
+        }
+
+    if new_cursor:
+        _advance_cursor(s3_client, new_cursor)
+
+    return _summary_response(todo, responses)
+
+
+def _deal_statuses(s3_client, keys: list) -> list:
+    with ThreadPoolExecutor(max_workers=BACKLOG_CONCURRENCY) as pool:
+        return list(pool.map(lambda k: get_deal_status(s3_client, BUCKET, deal_base_name(k)), keys))
+
+
+def process_s3_event(s3_client, event, process_file=None) -> dict:
+    """
+    Traite les DEAL JSON nommés par un événement S3 ObjectCreated (direct ou via SQS) :
+    aucun listing du bucket, coût indépendant de sa taille.
+    Pour SQS, les messages en erreur sont renvoyés dans batchItemFailures.
+    """
+    objects = [o for o in s3_event_objects(event)
+               if o["bucket"] == BUCKET and o["key"].startswith(f"{FOLDER}/") and deal_base_name(o["key"])]
+    keys = [o["key"] for o in objects]
+    print(f"📨 Événement S3 : {len(keys)} DEAL JSON à traiter")
 
+    try:
+        responses = process_deal_keys(s3_client, keys, process_file)
+    except Exception as e:
+        print(f"❌ Erreur inattendue : {e}")
         return {
             "statusCode": 500,
             "body": json.dumps({"status": "error", "message": str(e)}),
+            "batchItemFailures": [{"itemIdentifier": o["message_id"]} for o in objects if o["message_id"]],
         }
-        
+
+    response = _summary_response(keys, responses)
+    response["batchItemFailures"] = [
+        {"itemIdentifier": o["message_id"]}
+        for o, resp in zip(objects, responses)
+        if o["message_id"] and resp["statusCode"] == 500
+    ]
+    return response
+
+
+def _load_deal_and_log(s3_client, key: str):
+    # DEAL JSON et log du PDF (avec son ETag) lus en parallèle ; pas de log sans nom de PDF
+    # (l'erreur est alors levée par le pipeline, étape 3).
+    base_name = deal_base_name(key)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        deal = pool.submit(read_json_object, s3_client, BUCKET, key)
+        log  = pool.submit(load_deal_log, s3_client, BUCKET, base_name) if base_name else None
+        return deal.result(), (log.result() if log else None)
+
+
+def process_deal_keys(s3_client, keys: list, process_file=None) -> list:
+    """
+    Traite une liste de DEAL JSON avec une concurrence bornée ; retourne les réponses dans l'ordre.
+    Pour plusieurs fichiers, le catalogue produits est synchronisé une seule fois en amont.
+    """
+    process_file = process_file or process_deal_file
+    sync_each = len(keys) <= 1
+    if not sync_each:
+        ensure_catalog(incremental=True)
+
+    def _process(key):
+        trace = tracing.Trace()
+        try:
+            with trace.span("s3_fetch"):
+                llm_data, deal_log = _load_deal_and_log(s3_client, key)
+        except Exception as e:
+            print(f"❌ Lecture impossible pour {key} : {e}")
+            return {"statusCode": 500, "body": json.dumps({"status": "error", "message": str(e)})}
+        return process_file(s3_client, key, llm_data, sync_catalog=sync_each, deal_log=deal_log, trace=trace)
+
+    with ThreadPoolExecutor(max_workers=BACKLOG_CONCURRENCY) as pool:
+        return list(pool.map(_process, keys))
+
+
+def _summary_response(keys: list, responses: list) -> dict:
+    summary = []
+    for key, resp in zip(keys, responses):
+        body = json.loads(resp["body"])
+        summary.append({
+            "file"      : key,
+            "statusCode": resp["statusCode"],
+            "status"    : body.get("status"),
+            "message"   : body.get("message"),
+        })
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"status": "ok", "processed": len(summary), "results": summary}),
+    }
@@ -0,0 +1,118 @@
+from hubspot_create_deal import (
+    BUCKET, COMPANY_MATCH_MODE, _company_not_found, _complete_deal, _deal_checkpoint, _failed_response,
+    _write_final_log, handle_event,
+)
+from tools import deal_base_name, load_deal_log
+from matching_company  import find_hubspot_company_ids
+from matching_products import match_products_preserve_shape
+import tracing
+
+import asyncio
+
+# ===================== VARIANTE ASYNCIO =====================
+# Même pipeline que hubspot_create_deal, mais la lecture du log, le matching entreprise et le
+# matching produits sont lancés ensemble au lieu de se suivre. Le client HubSpot (requests + budgets
+# de débit partagés) et boto3 restant synchrones, chaque appel bloquant passe par asyncio.to_thread :
+# le contexte (trace, étape en cours) est propagé au thread.
+# Handler Lambda : hubspot_create_deal_async.lambda_handler.
+
+
+def lambda_handler(event, context):
+    """
+    Variante asyncio de hubspot_create_deal.lambda_handler (mêmes modes, mêmes réponses, même log).
+    """
+    return handle_event(event, process_file=process_deal_file)
+
+
+def process_deal_file(s3_client, file_name: str, llm_data: dict, sync_catalog: bool = True,
+                      deal_log: dict = None, trace: tracing.Trace = None) -> dict:
+    """
+    Signature de hubspot_create_deal.process_deal_file ; une boucle d'évènements par appel
+    (les fichiers d'un lot sont déjà répartis sur des threads par process_deal_keys).
+    """
+    return asyncio.run(process_deal_file_async(s3_client, file_name, llm_data, sync_catalog, deal_log, trace))
+
+
+async def _in_span(trace: tracing.Trace, name: str, fn):
+    def _run():
+        with trace.span(name):
+            return fn()
+    return await asyncio.to_thread(_run)
+
+
+async def _no_op(value):
+    return value
+
+
+async def process_deal_file_async(s3_client, file_name: str, llm_data: dict, sync_catalog: bool = True,
+                                  deal_log: dict = None, trace: tracing.Trace = None) -> dict:
+    trace = trace or tracing.Trace()
+    with tracing.activate(trace):
+        response = await _process_deal_file(s3_client, file_name, llm_data, sync_catalog, deal_log, trace)
+    trace.emit(File=file_name, StatusCode=response["statusCode"])
+    return response
+
+
+async def _process_deal_file(s3_client, file_name: str, llm_data: dict, sync_catalog: bool,
+                             deal_log: dict, trace: tracing.Trace) -> dict:
+
+    try:
+
+        # ----------------------------------------------------------->
+        # (3) Extraire le nom du fichier PDF.
+        base_name = deal_base_name(file_name)
+        if not base_name:
+            raise ValueError("Impossible d'extraire le nom du PDF depuis le fichier JSON")
+        print(f"📄 Fichier DEAL à traiter : {base_name}")
+        # ----------------------------------------------------------->
+
+        # ----------------------------------------------------------->
+        # (4) (5) (6) Log (s'il n'a pas été lu avec le DEAL JSON), matching entreprise et matching
+        # produits en parallèle.
+        # Les erreurs sont ensuite traitées dans l'ordre du pipeline séquentiel : un log illisible
+        # l'emporte sur un échec du matching entreprise, qui l'emporte sur celui des produits.
+        # Le matching produits est attendu même si l'entreprise n'est pas trouvée : aucun thread
+        # ne doit continuer à modifier le catalogue partagé après la réponse.
+        # Checkpoint : les matchings déjà aboutis ne sont pas relancés si le log est déjà chargé
+        # (événement S3, backlog) ; sinon ils tournent avec sa lecture et le checkpoint l'emporte.
+        checkpoint = _deal_checkpoint(deal_log["data"], llm_data) if deal_log is not None else {}
+        log_res, company_res, products_res = await asyncio.gather(
+            _in_span(trace, "log_load", lambda: load_deal_log(s3_client, bucket=BUCKET, base_name=base_name))
+            if deal_log is None else _no_op(deal_log),
+            _in_span(trace, "company_match", lambda: find_hubspot_company_ids(
+                [llm_data["entreprise"]], min_score=75, mode=COMPANY_MATCH_MODE, use_cache=True
+            )) if "matching_company" not in checkpoint else _no_op(None),
+            _in_span(trace, "product_match", lambda: match_products_preserve_shape(
+                llm_data["produits"], min_score=78, incremental=sync_catalog, alternatives=2
+            )) if "matching_products" not in checkpoint else _no_op(None),
+            return_exceptions=True,
+        )
+        if isinstance(log_res, BaseException):
+            raise log_res
+        deal_log   = log_res
+        checkpoint = _deal_checkpoint(deal_log["data"], llm_data)
+        if "matching_company" in checkpoint:
+            print("⏩ Matching entreprise repris du checkpoint")
+            company_res = checkpoint["matching_company"]
+        if isinstance(company_res, BaseException):
+            raise company_res
+        if "matching_products" in checkpoint:
+            print("⏩ Matching produits repris du checkpoint")
+            products_res = checkpoint["matching_products"]
+        # ----------------------------------------------------------->
+
+        # Si l'entreprise n'a pas été retrouvé, un enregistre le logging avec l'erreur.
+        if company_res.get("match") != "found":
+            response = _company_not_found(deal_log["data"])
+
+        elif isinstance(products_res, BaseException):
+            raise products_res
+
+        else:
+            response = await asyncio.to_thread(_complete_deal, s3_client, base_name, deal_log, llm_data,
+                                               company_res, products_res, trace)
+
+    except Exception as e:
+        response = _failed_response(deal_log, e)
+
+    return await asyncio.to_thread(_write_final_log, s3_client, deal_log, trace, response)
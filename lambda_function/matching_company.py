@@ -1,10 +1,15 @@
 import os
-import re
+import json
 import time
-import unicodedata
-import requests
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+import hubspot_client
+from company_cache import CompanyMatchCache
+from normalization import normalize_address, normalize_company_name, strip_accents_lower
+from storage import read_bytes, write_bytes
+
 # ========= CONFIG PROPRIÉTÉS HUBSPOT =========
 
 HS_PROPS_ADDRESS      = "address"
@@ -14,80 +19,40 @@ HS_PROPS_NAME         = "name"
 HS_PROPS_CLIENT_NAALI = "client_naali"  
 HS_PROPS_CITY         = "city"  
 
-BASE_URL = "https://api.hubapi.com/crm/v3/objects/companies/search"
-REQUEST_TIMEOUT = 15
-RETRY_MAX = 4
-
-# ========= SIMILARITÉ (rapidfuzz si dispo) =========
-try:
-    from rapidfuzz import fuzz
-    def ratio(a, b):
-        return fuzz.token_set_ratio(a or "", b or "")
-except Exception:
-    def ratio(a, b):
-        a_set = set((a or "").split())
-        b_set = set((b or "").split())
-        if not a_set or not b_set:
-            return 0
-        return int(100 * len(a_set & b_set) / max(1, len(a_set | b_set)))
-
-# ========= TOKEN =========
-def _get_token() -> str:
-    ACCESS_TOKEN_HUBSPOT = os.getenv("ACCESS_TOKEN_HUBSPOT")
-    if not ACCESS_TOKEN_HUBSPOT:
-        raise RuntimeError(
-            "HUBSPOT_PRIVATE_APP_TOKEN absent. "
-            "Exporte la variable d’environnement avec le token d’app privée HubSpot."
-        )
-    return ACCESS_TOKEN_HUBSPOT.strip()
+BASE_URL = "/crm/v3/objects/companies/search"
+COMPANIES_LIST_URL = "/crm/v3/objects/companies"
+
+# ========= SIMILARITÉ (rapidfuzz si dispo, importé au premier appel) =========
+def _set_ratio(a, b):
+    a_set = set((a or "").split())
+    b_set = set((b or "").split())
+    if not a_set or not b_set:
+        return 0
+    return int(100 * len(a_set & b_set) / max(1, len(a_set | b_set)))
+
+_ratio_impl = None
 
-HUBSPOT_TOKEN = _get_token()
+def ratio(a, b):
+    global _ratio_impl
+    if _ratio_impl is None:
+        try:
+            from rapidfuzz import fuzz
+            _ratio_impl = lambda x, y: fuzz.token_set_ratio(x or "", y or "")
+        except Exception:
+            _ratio_impl = _set_ratio
+    return _ratio_impl(a, b)
+
+# Le token HubSpot est résolu à l'appel par hubspot_client.get_token().
 
 # ========= NORMALISATION =========
-def _strip_accents_lower(s: str) -> str:
-    s = s or ""
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    s = s.lower()
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-def _normalize_name(s: str) -> str:
-    s = _strip_accents_lower(s)
-    s = re.sub(r"\b(pharmacie|pharma|pharm|parapharmacie|para)\b", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-def _normalize_address(s: str) -> str:
-    s = _strip_accents_lower(s)
-    replacements = {
-        r"\bav\b": "avenue",
-        r"\bav\.\b": "avenue",
-        r"\bar\b": "avenue",
-        r"\br\b": "rue",
-        r"\br\.\b": "rue",
-        r"\bbd\b": "boulevard",
-        r"\bctr?e?\b": "centre",
-        r"\bctal?\b": "centre",
-        r"\bctal?\.\b": "centre",
-        r"\ball(ee|e|é)e?\b": "allee",
-        r"\bste\b": "sainte",
-        r"\bst\b": "saint",
-        r"centre cial": "centre commercial",
-        r"ctre cial": "centre commercial",
-        r"c cial": "centre commercial",
-    }
-    for pat, rep in replacements.items():
-        s = re.sub(pat, rep, s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+# normalize_address / normalize_company_name / strip_accents_lower : voir normalization.py (mémoïsées).
 
 def _street_token(address: str) -> str:
     """
     Extrait un jeton 'rue': [numéro?] + 1-3 mots significatifs.
     Ex: "10 Rue Porte Baron" -> "10 porte baron"
     """
-    norm = _normalize_address(address)
+    norm = normalize_address(address)
     parts = norm.split()
     if not parts:
         return ""
@@ -109,31 +74,28 @@ MALL_KEYWORDS = {
 }
 
 def _place_token(s: str) -> str:
-    t = _strip_accents_lower(s)
+    t = strip_accents_lower(s)
     hits = [k for k in MALL_KEYWORDS if k in t]
     return " ".join(sorted(set(hits)))[:60]
 
 def _name_token(name: str) -> str:
-    n = _normalize_name(name or "")
+    n = normalize_company_name(name or "")
     parts = [w for w in n.split() if len(w) > 2][:4]
     return " ".join(parts)
 
 # ========= APPELS API HUBSPOT =========
-def _hs_search(filter_groups: List[Dict[str, Any]], properties: List[str], limit: int = 100) -> List[Dict[str, Any]]:
-    headers = {
-        "Authorization": f"Bearer {HUBSPOT_TOKEN}",
-        "Content-Type": "application/json",
-    }
+def _hs_search(filter_groups: List[Dict[str, Any]], properties: List[str], limit: int = 100,
+               max_pages: int = 1) -> List[Dict[str, Any]]:
     payload = {
         "filterGroups": filter_groups,
         "properties": properties,
         "limit": limit,
     }
-    for attempt in range(RETRY_MAX):
-        resp = requests.post(BASE_URL, json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
-        if resp.status_code == 429:
-            time.sleep(2 ** attempt)
-            continue
+    results = []
+    for _ in range(max_pages):
+        # La recherche est en lecture seule : rejouable comme un GET (429 / 5xx gérés par le client,
+        # HubSpotRateLimitError si le budget search est épuisé, plutôt qu'un faux "aucun résultat").
+        resp = hubspot_client.post(BASE_URL, json=payload, idempotent=True)
         if resp.status_code == 401:
             raise RuntimeError(
                 "401 Unauthorized depuis HubSpot.\n"
@@ -144,13 +106,15 @@ def _hs_search(filter_groups: List[Dict[str, Any]], properties: List[str], limit
         if not resp.ok:
             raise RuntimeError(f"HubSpot API error {resp.status_code}: {resp.text}")
         data = resp.json()
-        return data.get("results", []) or []
-    return []
+        results.extend(_with_norms(c) for c in data.get("results", []) or [])
+        after = ((data.get("paging") or {}).get("next") or {}).get("after")
+        if not after:
+            break
+        payload["after"] = after
+    return results
 
 def hubspot_healthcheck():
-    url = "https://api.hubapi.com/crm/v3/objects/companies?limit=1&properties=name"
-    headers = {"Authorization": f"Bearer {HUBSPOT_TOKEN}"}
-    r = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    r = hubspot_client.get("/crm/v3/objects/companies", params={"limit": 1, "properties": "name"})
     if r.status_code == 401:
         raise RuntimeError(
             "Healthcheck 401: Token invalide ou scopes insuffisants (crm.objects.companies.read). "
@@ -161,18 +125,30 @@ def hubspot_healthcheck():
     return True
 
 # ========= SCORING =========
-def _score_candidate(input_addr: str, input_name: str, cand: Dict[str, Any]) -> int:
+def _candidate_norms(cand: Dict[str, Any]):
+    """
+    (adresse normalisée, nom normalisé) du candidat, précalculés si disponibles
+    (résultat de recherche ou index hors-ligne).
+    """
+    if "__norm_addr" in cand:
+        return cand["__norm_addr"], cand["__norm_name"]
     props = cand.get("properties", {})
     hs_addr = " ".join(filter(None, [
         props.get(HS_PROPS_ADDRESS, ""),
         props.get(HS_PROPS_ADDRESS2, "")
     ]))
     hs_name = props.get(HS_PROPS_NAME, "")
+    return normalize_address(hs_addr), normalize_company_name(hs_name or "")
 
-    a_in = _normalize_address(input_addr)
-    a_hs = _normalize_address(hs_addr)
-    n_in = _normalize_name(input_name or "")
-    n_hs = _normalize_name(hs_name or "")
+def _with_norms(cand: Dict[str, Any]) -> Dict[str, Any]:
+    # Normalisé une fois à la réception, réutilisé à chaque étape de la cascade.
+    cand["__norm_addr"], cand["__norm_name"] = _candidate_norms(cand)
+    return cand
+
+def _score_candidate(input_addr: str, input_name: str, cand: Dict[str, Any]) -> int:
+    a_in = normalize_address(input_addr)
+    n_in = normalize_company_name(input_name or "")
+    a_hs, n_hs = _candidate_norms(cand)
 
     addr_score = ratio(a_in, a_hs)
     name_score = ratio(n_in, n_hs) if n_in and n_hs else 0
@@ -206,105 +182,375 @@ def _to_bool_or_oui_non(v, as_oui_non=False):
         return "Non" if as_oui_non else False
     return v  # valeur inattendue: renvoyer brut
 
+# ========= CASCADE DE RECHERCHE =========
+# Stratégies dans l'ordre de priorité de la cascade.
+CASCADE_METHODS = [
+    "zip+address_token",
+    "zip+address2_token",
+    "zip_only",
+    "zip+place_in_address",
+    "zip+place_in_address2",
+    "zip+name_token",
+]
+
+# Recherches simultanées max (l'API search HubSpot est limitée à quelques requêtes/seconde).
+COMPANY_SEARCH_WORKERS = 4
+
+# Mode "packed" : filterGroups en OU par recherche (maximum HubSpot), taille de page et pages lues
+# par recherche groupée (l'union des stratégies dépasse rarement une page).
+PACKED_MAX_FILTER_GROUPS = 5
+PACKED_SEARCH_LIMIT      = 200
+PACKED_SEARCH_MAX_PAGES  = 3
+
+def _zip_filter_groups(cp: str, prop: Optional[str] = None, token: Optional[str] = None) -> List[Dict[str, Any]]:
+    filters = [{"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp}]
+    if prop:
+        filters.append({"propertyName": prop, "operator": "CONTAINS_TOKEN", "value": token})
+    return [{"filters": filters}]
+
+def _cascade_searches(it: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    filterGroups de chaque stratégie applicable à l'item (méthode -> filterGroups).
+    """
+    adr = it.get("adresse", "")
+    cp  = (it.get("code_postal") or "").strip()
+    if not cp:
+        return {}
+
+    street_tok = _street_token(adr)
+    place_tok  = _place_token(adr)
+    n_tok      = _name_token(it.get("nom", ""))
+
+    searches = {}
+    # 1) zip AND address CONTAINS_TOKEN(street_tok)
+    # 2) zip AND address2 CONTAINS_TOKEN(street_tok)
+    if street_tok:
+        searches["zip+address_token"]  = _zip_filter_groups(cp, HS_PROPS_ADDRESS, street_tok)
+        searches["zip+address2_token"] = _zip_filter_groups(cp, HS_PROPS_ADDRESS2, street_tok)
+    # 3) zip only + scoring
+    searches["zip_only"] = _zip_filter_groups(cp)
+    # 3bis) zip AND (address|address2) CONTAINS_TOKEN(place_token) si centre commercial détecté
+    if place_tok:
+        searches["zip+place_in_address"]  = _zip_filter_groups(cp, HS_PROPS_ADDRESS, place_tok)
+        searches["zip+place_in_address2"] = _zip_filter_groups(cp, HS_PROPS_ADDRESS2, place_tok)
+    # 3ter) zip AND name CONTAINS_TOKEN(name_token) fallback sur le nom
+    if n_tok:
+        searches["zip+name_token"] = _zip_filter_groups(cp, HS_PROPS_NAME, n_tok)
+    return searches
+
+def _run_cascade(it: Dict[str, str], searches: Dict[str, Any], fetch, min_score: int):
+    """
+    Applique l'ordre de priorité de la cascade. `fetch(method)` renvoie les candidats de la stratégie,
+    quelle que soit la façon dont ils ont été obtenus (séquentiel, concurrent...).
+    Retourne (chosen, method).
+    """
+    nom = it.get("nom", "")
+    adr = it.get("adresse", "")
+    chosen = None
+    method = None
+
+    def weak():
+        return not chosen or chosen.get("__match_score", 0) < min_score
+
+    def challenge(m):
+        nonlocal chosen, method
+        tmp = _pick_best(it, fetch(m))
+        if tmp and (not chosen or _score_candidate(adr, nom, tmp) > chosen.get("__match_score", -1)):
+            chosen = tmp
+            method = m
+
+    # 1) / 2) / 3) : premier candidat trouvé
+    for m in ("zip+address_token", "zip+address2_token", "zip_only"):
+        if not chosen and m in searches:
+            chosen = _pick_best(it, fetch(m))
+            method = m if chosen else None
+
+    # 3bis) place token, sur address puis address2
+    if weak() and "zip+place_in_address" in searches:
+        challenge("zip+place_in_address")
+        if weak():
+            challenge("zip+place_in_address2")
+
+    # 3ter) name token
+    if weak() and "zip+name_token" in searches:
+        challenge("zip+name_token")
+
+    return chosen, method
+
+def _packed_fetch(searches: Dict[str, List[Dict[str, Any]]], properties: List[str]):
+    """
+    fetch(method) du mode "packed" pour _run_cascade. Les stratégies à jeton partent ensemble
+    (filterGroups en OU, PACKED_MAX_FILTER_GROUPS par recherche) à la première demande ; les candidats
+    sont ensuite rattachés côté client aux stratégies qu'ils satisfont (_record_matches, comme le mode
+    offline) et triés par ID. zip_only, qui les englobe toutes, n'est recherché que si la cascade l'atteint.
+    Le rattachement côté client ne vaut que si notre tokenizer coïncide avec celui de HubSpot. Il n'est
+    donc pas cru pour conclure à l'absence : une stratégie sans candidat côté client alors que la recherche
+    groupée en a renvoyé est recherchée seule, et si un candidat renvoyé ne satisfait aucune stratégie côté
+    client (tokenizers différents pour cet item), toutes les stratégies demandées sont recherchées seules.
+    Ces recherches seules ne portent que sur les stratégies atteintes par la cascade (une fois chacune) :
+    au pire, le mode packed fait les recherches du mode séquentiel plus la recherche groupée
+    (PACKED_SEARCH_MAX_PAGES pages au plus). Mesuré (benchmarks/company_packed.py) : environ 2,2 recherches
+    par DEAL (2,6 si les tokenizers divergent) contre 1,8 en séquentiel et 4,9 en concurrent.
+    """
+    packed  = [m for m in CASCADE_METHODS if m in searches and m != "zip_only"]
+    fetched = {}
+
+    def fetch(m):
+        if m in fetched:
+            return fetched[m]
+        if m == "zip_only" or fetched.get("unattributed"):
+            fetched[m] = _hs_search(searches[m], properties)
+            return fetched[m]
+
+        if "packed" not in fetched:
+            groups = [g for pm in packed for g in searches[pm]]
+            by_id = {}
+            for start in range(0, len(groups), PACKED_MAX_FILTER_GROUPS):
+                for c in _hs_search(groups[start:start + PACKED_MAX_FILTER_GROUPS], properties,
+                                    limit=PACKED_SEARCH_LIMIT, max_pages=PACKED_SEARCH_MAX_PAGES):
+                    by_id.setdefault(c.get("id"), c)
+            fetched["packed"] = sorted(by_id.values(), key=lambda c: int(c["id"]) if str(c["id"]).isdigit() else 0)
+            fetched["unattributed"] = any(
+                not any(_record_matches(c, searches[pm]) for pm in packed) for c in fetched["packed"]
+            )
+            if fetched["unattributed"]:
+                print("⚠️ Recherche groupée : candidat non rattaché côté client, recherches par stratégie")
+                return fetch(m)
+        matches = [c for c in fetched["packed"] if _record_matches(c, searches[m])]
+        if not matches and fetched["packed"]:
+            fetched[m] = matches = _hs_search(searches[m], properties)
+        return matches
+
+    return fetch
+
+# ========= CACHE INTER-INVOCATIONS =========
+company_cache = CompanyMatchCache()
+
+def _cache_key(it: Dict[str, str]):
+    """
+    (zip, jeton rue, jeton nom), ou None sans rue ni nom exploitables : la clé (zip, "", "") serait
+    partagée par toutes les entrées du code postal et renverrait l'entreprise d'une autre entrée.
+    """
+    street, name = _street_token(it.get("adresse", "")), _name_token(it.get("nom", ""))
+    if not street and not name:
+        return None
+    return ((it.get("code_postal") or "").strip(), street, name)
+
+def _fetch_client_naali(hs_object_id: str):
+    """
+    Relit client_naali d'une entreprise par son ID (appel CRM simple, pas de recherche).
+    Retourne (existe, valeur).
+    """
+    r = hubspot_client.get(f"/crm/v3/objects/companies/{hs_object_id}", params={"properties": HS_PROPS_CLIENT_NAALI})
+    if r.status_code == 404:
+        return False, None
+    if not r.ok:
+        raise RuntimeError(f"HubSpot API error {r.status_code}: {r.text}")
+    props = r.json().get("properties", {}) or {}
+    return True, _to_bool_or_oui_non(props.get(HS_PROPS_CLIENT_NAALI), as_oui_non=True)
+
+def _cached_match(it: Dict[str, str], key, min_score: int) -> Optional[Dict[str, Any]]:
+    entry = company_cache.get(key)
+    if not entry or (entry.get("score") or 0) < min_score:
+        return None
+    if not company_cache.naali_is_fresh(entry):
+        exists, client_naali = _fetch_client_naali(entry["hs_object_id"])
+        if not exists:
+            company_cache.invalidate(key)
+            return None
+        company_cache.refresh_naali(key, client_naali)
+    return {
+        "input": it,
+        "match": "found",
+        "hs_object_id": entry["hs_object_id"],
+        "matched_name": entry["matched_name"],
+        "score": entry["score"],
+        "method": entry["method"],
+        "client_naali": entry["client_naali"],
+        "cache_hit": True,
+    }
+
+# ========= INDEX HORS-LIGNE (partitionné par code postal) =========
+# Export complet des entreprises, normalisé une fois, pour rejouer la cascade sans appel réseau.
+COMPANY_INDEX_URI     = os.getenv("COMPANY_INDEX_URI")
+COMPANY_INDEX_MAX_AGE = int(os.getenv("COMPANY_INDEX_MAX_AGE", str(24 * 3600)))
+COMPANY_INDEX_VERSION = 1
+COMPANY_PROPERTIES    = [HS_PROPS_NAME, HS_PROPS_ADDRESS, HS_PROPS_ADDRESS2, HS_PROPS_ZIP, HS_PROPS_CLIENT_NAALI]
+
+def _tokens(s: str) -> List[str]:
+    return strip_accents_lower(s).split()
+
+def fetch_all_hubspot_companies(properties: List[str] = COMPANY_PROPERTIES) -> List[Dict[str, Any]]:
+    """
+    Export complet des entreprises HubSpot (API liste paginée, pas de plafond de recherche).
+    """
+    params = {"limit": 100, "properties": ",".join(properties), "archived": "false"}
+    results = []
+    while True:
+        r = hubspot_client.get(COMPANIES_LIST_URL, params=params)
+        if r.status_code == 401:
+            raise RuntimeError("401 HubSpot (companies). Vérifie token/portail et scope 'crm.objects.companies.read'.")
+        if not r.ok:
+            raise RuntimeError(f"HubSpot API error {r.status_code}: {r.text}")
+        data = r.json()
+        results.extend(data.get("results", []) or [])
+        nextp = ((data.get("paging") or {}).get("next") or {}).get("after")
+        if not nextp:
+            break
+        params["after"] = nextp
+    return results
+
+def build_company_index(companies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Partitions par code postal ; chaque entrée porte ses formes normalisées (scoring)
+    et ses jetons par propriété (émulation de CONTAINS_TOKEN).
+    """
+    zips = {}
+    for c in companies:
+        props = {k: (c.get("properties", {}) or {}).get(k) for k in COMPANY_PROPERTIES}
+        cp = (props.get(HS_PROPS_ZIP) or "").strip()
+        if not cp:
+            continue
+        norm_addr, norm_name = _candidate_norms({"properties": props})
+        address = props.get(HS_PROPS_ADDRESS) or ""
+        zips.setdefault(cp, []).append({
+            "id": c.get("id"),
+            "properties": props,
+            "norm_addr": norm_addr,
+            "norm_name": norm_name,
+            "tokens": {
+                HS_PROPS_ADDRESS : _tokens(address),
+                HS_PROPS_ADDRESS2: _tokens(props.get(HS_PROPS_ADDRESS2) or ""),
+                HS_PROPS_NAME    : _tokens(props.get(HS_PROPS_NAME) or ""),
+            },
+        })
+    for rows in zips.values():
+        rows.sort(key=lambda r: int(r["id"]) if str(r["id"]).isdigit() else 0)
+    return {"version": COMPANY_INDEX_VERSION, "built_at": time.time(), "zips": zips}
+
+def _record_matches(record: Dict[str, Any], filter_groups: List[Dict[str, Any]]) -> bool:
+    """
+    Évalue des filterGroups HubSpot (OR de groupes, AND de filtres) sur une entrée de l'index
+    ou un résultat de recherche (jetons recalculés depuis les propriétés).
+    Seuls EQ (zip) et CONTAINS_TOKEN (tous les jetons de la valeur présents) sont utilisés par la cascade.
+    """
+    for group in filter_groups:
+        ok = True
+        for f in group.get("filters", []):
+            prop = f["propertyName"]
+            if f["operator"] == "EQ":
+                ok = (record["properties"].get(prop) or "").strip() == f["value"]
+            elif f["operator"] == "CONTAINS_TOKEN":
+                have = (record.get("tokens") or {}).get(prop)
+                if have is None:
+                    have = _tokens(record["properties"].get(prop) or "")
+                ok = set(_tokens(f["value"])) <= set(have)
+            else:
+                raise ValueError(f"Opérateur non supporté hors-ligne : {f['operator']}")
+            if not ok:
+                break
+        if ok:
+            return True
+    return False
+
+def _as_candidate(record: Dict[str, Any]) -> Dict[str, Any]:
+    # Copie fraîche : _pick_best annote le candidat retenu.
+    return {
+        "id": record["id"],
+        "properties": dict(record["properties"]),
+        "__norm_addr": record["norm_addr"],
+        "__norm_name": record["norm_name"],
+    }
+
+_company_index: Optional[Dict[str, Any]] = None
+
+def ensure_company_index(force_refresh: bool = False, uri: Optional[str] = COMPANY_INDEX_URI) -> Dict[str, Any]:
+    """
+    Index en mémoire ; sinon snapshot (si assez récent) ; sinon export HubSpot complet puis sauvegarde.
+    """
+    global _company_index
+    if _company_index is not None and not force_refresh \
+            and time.time() - _company_index["built_at"] <= COMPANY_INDEX_MAX_AGE:
+        return _company_index
+
+    if not force_refresh and uri:
+        try:
+            raw = read_bytes(uri)
+        except Exception as e:
+            print(f"⚠️ Index entreprises illisible ({uri}) : {e}")
+            raw = None
+        if raw:
+            index = json.loads(raw.decode("utf-8"))
+            if index.get("version") == COMPANY_INDEX_VERSION \
+                    and time.time() - index.get("built_at", 0) <= COMPANY_INDEX_MAX_AGE:
+                _company_index = index
+                return _company_index
+
+    _company_index = build_company_index(fetch_all_hubspot_companies())
+    if uri:
+        try:
+            body = json.dumps(_company_index, ensure_ascii=False, separators=(",", ":"))
+            write_bytes(uri, body.encode("utf-8"), content_type="application/json")
+        except Exception as e:
+            print(f"⚠️ Échec de l'écriture de l'index entreprises ({uri}) : {e}")
+    return _company_index
+
+def _offline_search(partition: List[Dict[str, Any]], filter_groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_as_candidate(r) for r in partition if _record_matches(r, filter_groups)]
+
 # ========= FONCTION PRINCIPALE =========
-def find_hubspot_company_ids(items: List[Dict[str, str]], min_score: int = 70) -> List[Dict[str, Any]]:
+def find_hubspot_company_ids(items: List[Dict[str, str]], min_score: int = 70,
+                             mode: str = "sequential", use_cache: bool = False) -> List[Dict[str, Any]]:
     """
     items: [{"nom":..., "adresse":..., "code_postal":...}, ...]
     Retourne pour chaque item: hs_object_id, matched_name, client_naali, score, method
+    mode:
+      - "sequential" : une recherche HubSpot à la fois, arrêt dès que la cascade a décidé.
+      - "concurrent" : toutes les recherches de la cascade partent en parallèle (pool borné),
+                       la décision suit le même ordre de priorité. Latence ≈ la recherche la plus lente,
+                       au prix de recherches parfois inutiles.
+      - "offline"    : même cascade sur l'index hors-ligne (aucun appel réseau), recherche live
+                       uniquement si le code postal est absent de l'index.
+      - "packed"     : les stratégies à jeton en une seule recherche (filterGroups en OU), zip_only en
+                       une seconde si nécessaire ; candidats rattachés aux stratégies côté client, une
+                       stratégie restée vide étant vérifiée par sa propre recherche (voir _packed_fetch).
+                       Bien moins de recherches que "concurrent", mais un peu plus que "sequential"
+                       en moyenne (environ 2,2 contre 1,8) ; latence de 2 recherches environ.
+    use_cache : réutilise un matching déjà trouvé pour la même entrée normalisée (zip, rue, nom),
+                sans aucune recherche HubSpot (client_naali relu si son TTL est dépassé).
     """
+    if mode not in ("sequential", "concurrent", "offline", "packed"):
+        raise ValueError(f"Mode de matching entreprise inconnu : {mode}")
+
     out = []
     props = [HS_PROPS_NAME, HS_PROPS_ADDRESS, HS_PROPS_ADDRESS2, HS_PROPS_ZIP, HS_PROPS_CLIENT_NAALI]
     # Si tu veux la ville:
     # props.append(HS_PROPS_CITY)
+    index = ensure_company_index() if mode == "offline" else None
 
     for it in items:
-        nom = it.get("nom", "")
-        adr = it.get("adresse", "")
-        cp  = (it.get("code_postal") or "").strip()
-
-        street_tok = _street_token(adr)
-        chosen = None
-        method = None
-
-        # 1) zip AND address CONTAINS_TOKEN(street_tok)
-        if cp and street_tok:
-            filters = [{
-                "filters": [
-                    {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp},
-                    {"propertyName": HS_PROPS_ADDRESS, "operator": "CONTAINS_TOKEN", "value": street_tok}
-                ]
-            }]
-            cand = _hs_search(filters, props)
-            chosen = _pick_best(it, cand)
-            method = "zip+address_token" if chosen else None
-
-        # 2) zip AND address2 CONTAINS_TOKEN(street_tok)
-        if not chosen and cp and street_tok:
-            filters = [{
-                "filters": [
-                    {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp},
-                    {"propertyName": HS_PROPS_ADDRESS2, "operator": "CONTAINS_TOKEN", "value": street_tok}
-                ]
-            }]
-            cand = _hs_search(filters, props)
-            chosen = _pick_best(it, cand)
-            method = "zip+address2_token" if chosen else None
-
-        # 3) zip only + scoring
-        if not chosen and cp:
-            filters = [{
-                "filters": [
-                    {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp}
-                ]
-            }]
-            cand = _hs_search(filters, props)
-            chosen = _pick_best(it, cand)
-            method = "zip_only" if chosen else None
-
-        # 3bis) zip AND (address|address2) CONTAINS_TOKEN(place_token) si centre commercial détecté
-        if (not chosen or chosen.get("__match_score", 0) < min_score) and cp:
-            place_tok = _place_token(adr)
-            if place_tok:
-                filters = [{
-                    "filters": [
-                        {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp},
-                        {"propertyName": HS_PROPS_ADDRESS, "operator": "CONTAINS_TOKEN", "value": place_tok}
-                    ]
-                }]
-                cand = _hs_search(filters, props)
-                tmp = _pick_best(it, cand)
-                if tmp and (not chosen or _score_candidate(adr, nom, tmp) > chosen.get("__match_score", -1)):
-                    chosen = tmp
-                    method = "zip+place_in_address"
-
-                if not chosen or chosen.get("__match_score", 0) < min_score:
-                    filters = [{
-                        "filters": [
-                            {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp},
-                            {"propertyName": HS_PROPS_ADDRESS2, "operator": "CONTAINS_TOKEN", "value": place_tok}
-                        ]
-                    }]
-                    cand = _hs_search(filters, props)
-                    tmp = _pick_best(it, cand)
-                    if tmp and (not chosen or _score_candidate(adr, nom, tmp) > chosen.get("__match_score", -1)):
-                        chosen = tmp
-                        method = "zip+place_in_address2"
-
-        # 3ter) zip AND name CONTAINS_TOKEN(name_token) fallback sur le nom
-        if (not chosen or chosen.get("__match_score", 0) < min_score) and cp:
-            n_tok = _name_token(nom)
-            if n_tok:
-                filters = [{
-                    "filters": [
-                        {"propertyName": HS_PROPS_ZIP, "operator": "EQ", "value": cp},
-                        {"propertyName": HS_PROPS_NAME, "operator": "CONTAINS_TOKEN", "value": n_tok}
-                    ]
-                }]
-                cand = _hs_search(filters, props)
-                tmp = _pick_best(it, cand)
-                if tmp and (not chosen or _score_candidate(adr, nom, tmp) > chosen.get("__match_score", -1)):
-                    chosen = tmp
-                    method = "zip+name_token"
+        key = _cache_key(it) if use_cache else None
+        if key and key[0]:
+            hit = _cached_match(it, key, min_score)
+            if hit:
+                out.append(hit)
+                continue
+
+        searches  = _cascade_searches(it)
+        partition = index["zips"].get((it.get("code_postal") or "").strip()) if index else None
+
+        if partition is not None:
+            chosen, method = _run_cascade(it, searches, lambda m: _offline_search(partition, searches[m]), min_score)
+        elif mode == "packed":
+            chosen, method = _run_cascade(it, searches, _packed_fetch(searches, props), min_score)
+        elif mode == "concurrent" and searches:
+            with ThreadPoolExecutor(max_workers=min(COMPANY_SEARCH_WORKERS, len(searches))) as pool:
+                # copy_context : les appels des workers sont comptés dans la trace courante.
+                futures = {m: pool.submit(contextvars.copy_context().run, _hs_search, fg, props)
+                           for m, fg in searches.items()}
+                chosen, method = _run_cascade(it, searches, lambda m: futures[m].result(), min_score)
+        else:
+            chosen, method = _run_cascade(it, searches, lambda m: _hs_search(searches[m], props), min_score)
 
         # Sortie
         if chosen and chosen.get("__match_score", 0) >= min_score:
@@ -318,6 +564,8 @@ def find_hubspot_company_ids(items: List[Dict[str, str]], min_score: int = 70) -
                 "method": method,
                 "client_naali": _to_bool_or_oui_non(props_chosen.get(HS_PROPS_CLIENT_NAALI), as_oui_non=True)
             })
+            if key and key[0]:
+                company_cache.put(key, out[-1])
         else:
             out.append({
                 "input": it,
@@ -329,4 +577,7 @@ def find_hubspot_company_ids(items: List[Dict[str, str]], min_score: int = 70) -
                 "client_naali": None
             })
 
+    if use_cache:
+        company_cache.save()
+
     return out[0]
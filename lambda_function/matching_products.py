@@ -1,13 +1,26 @@
 import os
 import re
+import sys
 import time
+import gc
 import json
-import unicodedata
-import requests
+import marshal
+import multiprocessing
+import struct
+from array import array
+from math import nan as NAN
+from datetime import datetime
 from typing import List, Dict, Any, Optional, Union, Tuple
 
+import requests
+
+import hubspot_client
+import tracing
+from normalization import strip_accents_lower
+from storage import map_bytes, write_bytes
+
 # ===================== CONFIG HUBSPOT =====================
-HS_PRODUCTS_LIST_URL = "https://api.hubapi.com/crm/v3/objects/products"
+HS_PRODUCTS_LIST_URL = "/crm/v3/objects/products"
 
 # Propriétés produits qu’on récupère une fois pour toutes
 HS_PROD_NAME  = "name"
@@ -17,31 +30,50 @@ HS_PROD_CODE  = "hs_product_id"  # code interne HubSpot (facultatif)
 HS_PROD_DESC  = "description"    # utile pour EAN/GTIN ou tags (UG/PLV)
 PRODUCT_PROPERTIES = [HS_PROD_NAME, HS_PROD_PRICE, HS_PROD_SKU, HS_PROD_CODE, HS_PROD_DESC]
 
-REQUEST_TIMEOUT = 20
 PAGE_LIMIT = 100
 
+# Snapshot persistant du catalogue (chemin local ou "s3://bucket/key"), optionnel.
+HS_PRODUCTS_SEARCH_URL   = "/crm/v3/objects/products/search"
+CATALOG_SNAPSHOT_URI     = os.getenv("CATALOG_SNAPSHOT_URI")
+CATALOG_SNAPSHOT_VERSION = 1
+SEARCH_PAGE_LIMIT        = 200
+SEARCH_MAX_RESULTS       = 10000   # plafond de pagination de l'API search HubSpot
+SYNC_OVERLAP_MS          = 5 * 60 * 1000  # marge pour le délai d'indexation de la recherche
+
+# Artefact binaire du catalogue (écrit sur CATALOG_SNAPSHOT_URI) : en-tête versionné puis colonnes et index
+# déjà calculés (marshal), rechargés sans featurisation. Un artefact d'une autre version est ignoré.
+CATALOG_ARTIFACT_MAGIC   = b"HSPCAT"
+CATALOG_ARTIFACT_VERSION = 1   # format du fichier
+CATALOG_FEATURES_VERSION = 1   # à incrémenter quand normalize_name_for_match / extract_* changent
+_ARTIFACT_HEADER         = struct.Struct("<6sHHHQ")  # magic, format, features, marshal.version, taille
+
 # ===================== SIMILARITÉ =====================
-try:
-    from rapidfuzz import fuzz
-    def name_ratio(a, b):
-        return fuzz.token_set_ratio(a or "", b or "")
-except Exception:
-    def name_ratio(a, b):
-        # fallback très simple
-        a_set = set((a or "").split())
-        b_set = set((b or "").split())
-        if not a_set or not b_set:
-            return 0
-        return int(100 * len(a_set & b_set) / max(1, len(a_set | b_set)))
+def _set_ratio(a, b):
+    # fallback très simple
+    a_set = set((a or "").split())
+    b_set = set((b or "").split())
+    if not a_set or not b_set:
+        return 0
+    return int(100 * len(a_set & b_set) / max(1, len(a_set | b_set)))
+
+_name_ratio_impl = None
+
+def name_ratio(a, b, score_cutoff=0):
+    # rapidfuzz importé au premier appel (démarrage à froid).
+    # score_cutoff : sous ce score, rapidfuzz abandonne le calcul et renvoie 0 (ignoré par le fallback).
+    global _name_ratio_impl
+    if _name_ratio_impl is None:
+        try:
+            from rapidfuzz import fuzz
+            _name_ratio_impl = lambda x, y, c: fuzz.token_set_ratio(x or "", y or "", score_cutoff=c)
+        except Exception:
+            _name_ratio_impl = lambda x, y, c: _set_ratio(x, y)
+    return _name_ratio_impl(a, b, score_cutoff)
 
 # ===================== NORMALISATION / EXTRACTIONS =====================
 def _strip_accents_lower(s: str) -> str:
-    s = s or ""
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    s = s.lower()
-    s = re.sub(r"[^\w\s\-]", " ", s)  # on garde tirets pour "citron-vert"
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    # on garde tirets pour "citron-vert" (implémentation partagée et mémoïsée)
+    return strip_accents_lower(s, keep_dash=True)
 
 # tokens utiles : tailles, categories, aromes, EAN
 SIZE_RE   = re.compile(r"\bx\s?(\d{1,3})\b")      # "x42", "x 60"
@@ -92,19 +124,16 @@ def extract_eans(s: str) -> List[str]:
     return EAN_RE.findall(s or "")
 
 # ===================== HUBSPOT FETCH =====================
-def _get_token() -> str:
-    ACCESS_TOKEN_HUBSPOT = os.getenv("ACCESS_TOKEN_HUBSPOT")
-    if not ACCESS_TOKEN_HUBSPOT:
-        raise RuntimeError(f"{ACCESS_TOKEN_HUBSPOT} absent. Exporte le token d’app privée HubSpot.")
-    return ACCESS_TOKEN_HUBSPOT
-
-HUBSPOT_TOKEN = _get_token()
+class CatalogDeltaTooLarge(RuntimeError):
+    """
+    Le delta depuis le high-water mark dépasse le plafond de pagination de l'API search :
+    seule une reconstruction complète peut resynchroniser le catalogue.
+    """
 
 def fetch_all_hubspot_products(properties: List[str] = PRODUCT_PROPERTIES, max_pages: Optional[int]=None) -> List[Dict[str, Any]]:
     """
     Liste complète des products HubSpot (pagination). On ramène les propriétés utiles.
     """
-    headers = {"Authorization": f"Bearer {HUBSPOT_TOKEN}"}
     params = {
         "limit": PAGE_LIMIT,
         "properties": ",".join(properties),
@@ -116,7 +145,7 @@ def fetch_all_hubspot_products(properties: List[str] = PRODUCT_PROPERTIES, max_p
     while True:
         if after:
             params["after"] = after
-        r = requests.get(HS_PRODUCTS_LIST_URL, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        r = hubspot_client.get(HS_PRODUCTS_LIST_URL, params=params)
         if r.status_code == 401:
             raise RuntimeError("401 HubSpot (products). Vérifie token/portail et scope 'crm.objects.products.read'.")
         if not r.ok:
@@ -136,36 +165,429 @@ def fetch_all_hubspot_products(properties: List[str] = PRODUCT_PROPERTIES, max_p
         time.sleep(0.05)
     return results
 
+def fetch_hubspot_products_modified_since(since_ms: int, properties: List[str] = PRODUCT_PROPERTIES) -> List[Dict[str, Any]]:
+    """
+    Products modifiés depuis `since_ms` (epoch ms), via l'API search triée par date de modification.
+    Lève CatalogDeltaTooLarge si le delta dépasse le plafond de pagination de la recherche.
+    """
+    payload = {
+        "filterGroups": [{
+            "filters": [{"propertyName": "hs_lastmodifieddate", "operator": "GT", "value": str(since_ms)}]
+        }],
+        "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "ASCENDING"}],
+        "properties": properties,
+        "limit": SEARCH_PAGE_LIMIT,
+    }
+    results = []
+    while True:
+        r = hubspot_client.post(HS_PRODUCTS_SEARCH_URL, json=payload, idempotent=True)
+        if r.status_code == 401:
+            raise RuntimeError("401 HubSpot (products search). Vérifie token/portail et scope 'crm.objects.products.read'.")
+        if not r.ok:
+            raise RuntimeError(f"HubSpot error {r.status_code}: {r.text}")
+        data = r.json()
+        results.extend(data.get("results", []) or [])
+        nextp = ((data.get("paging") or {}).get("next") or {}).get("after")
+        if not nextp:
+            break
+        if int(nextp) >= SEARCH_MAX_RESULTS:
+            raise CatalogDeltaTooLarge("Delta produits trop volumineux pour l'API search, reconstruction complète nécessaire.")
+        payload["after"] = nextp
+    return results
+
+def fetch_hubspot_products_archived_since(since_ms: int) -> List[Dict[str, Any]]:
+    """
+    Products archivés depuis `since_ms` (epoch ms). L'API liste ne filtre pas par date,
+    on filtre donc côté client sur `archivedAt`.
+    """
+    params = {"limit": PAGE_LIMIT, "archived": "true"}
+    results = []
+    while True:
+        r = hubspot_client.get(HS_PRODUCTS_LIST_URL, params=params)
+        if not r.ok:
+            raise RuntimeError(f"HubSpot error {r.status_code}: {r.text}")
+        data = r.json()
+        for row in data.get("results", []) or []:
+            archived_ms = _iso_to_ms(row.get("archivedAt"))
+            if archived_ms is None or archived_ms > since_ms:
+                results.append(row)
+        nextp = ((data.get("paging") or {}).get("next") or {}).get("after")
+        if not nextp:
+            break
+        params["after"] = nextp
+    return results
+
+def _iso_to_ms(v: Optional[str]) -> Optional[int]:
+    if not v:
+        return None
+    try:
+        return int(datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
 # ===================== INDEX LOCAL =====================
+def _featurize_product(row: Dict[str, Any]) -> Dict[str, Any]:
+    props = row.get("properties", {}) or {}
+    name     = props.get(HS_PROD_NAME, "") or ""
+    price    = props.get(HS_PROD_PRICE, None)
+    desc     = props.get(HS_PROD_DESC, "") or ""
+    sku      = props.get(HS_PROD_SKU, None)
+    hs_code  = props.get(HS_PROD_CODE, None)
+    norm     = normalize_name_for_match(name)
+    size     = extract_size_token(name)
+    aromas   = extract_aromes(name)
+    cats     = extract_categories(name) | extract_categories(desc)
+    eans     = set(extract_eans(desc))
+
+    # La description ne sert qu'à extraire catégories et EAN : elle n'est pas conservée.
+    return {
+        "id": row.get("id"),
+        "name": name,
+        "norm_name": norm,
+        "price": _safe_float(price),
+        "sku": sku,
+        "hs_code": hs_code,
+        "size": size,
+        "aromas": aromas,
+        "cats": cats,
+        "eans": eans,
+    }
+
+_SET_FIELDS = ("aromas", "cats", "eans")
+
+# Masques de bits des aromes et catégories (valeurs canoniques de extract_aromes / extract_categories).
+AROMA_BITS    = {a: 1 << i for i, a in enumerate(sorted(AROMES))}
+CATEGORY_BITS = {c: 1 << i for i, c in enumerate(sorted({"presentoir" if c == "présentoir" else c for c in CATEGORIES}))}
+UG_PRESENTOIR_MASK = CATEGORY_BITS["ug"] | CATEGORY_BITS["presentoir"]
+
+def _to_mask(values, bits: Dict[str, int]) -> int:
+    mask = 0
+    for v in values:
+        mask |= bits[v]
+    return mask
+
+def _from_mask(mask: int, bits: Dict[str, int]) -> set:
+    return {v for v, b in bits.items() if mask & b}
+
+def _signal_keys(norm_name: str, size: Optional[int], aromas: set, cats: set, eans) -> set:
+    """
+    Clés de l'index inversé : tokens du nom normalisé, taille, aromes, catégories, EAN.
+    """
+    keys = {("tok", w) for w in norm_name.split()}
+    if size:
+        keys.add(("size", size))
+    keys.update(("aroma", a) for a in aromas)
+    keys.update(("cat", c) for c in cats)
+    keys.update(("ean", e) for e in eans)
+    return keys
+
+def _norm_identifier(v: Any) -> str:
+    return str(v).strip().upper()
+
+_NO_SIZE = -1
+_NO_EANS = ()
+
+_LIST_COLUMNS  = ("ids", "names", "norm_names", "skus", "hs_codes", "eans")
+_ARRAY_COLUMNS = ("prices", "sizes", "aroma_masks", "cat_masks")
+
+def artifact_header(buf) -> Dict[str, int]:
+    """
+    En-tête d'un artefact catalogue. Lève ValueError si ce n'en est pas un ou s'il est tronqué.
+    """
+    if len(buf) < _ARTIFACT_HEADER.size:
+        raise ValueError("artefact tronqué")
+    magic, version, features, marshal_version, size = _ARTIFACT_HEADER.unpack_from(buf)
+    if magic != CATALOG_ARTIFACT_MAGIC:
+        raise ValueError("pas un artefact catalogue")
+    if len(buf) < _ARTIFACT_HEADER.size + size:
+        raise ValueError("artefact tronqué")
+    return {"version": version, "features_version": features, "marshal_version": marshal_version, "size": size}
+
 class ProductCatalog:
+    """
+    Catalogue produits en colonnes, une entrée par position :
+      - ids, names, skus, hs_codes : chaînes (internées) ; norm_names : noms normalisés internés
+      - prices : array('d'), NaN si absent ; sizes : array('i'), -1 si absent
+      - aroma_masks / cat_masks : array('I'), masques de bits (AROMA_BITS / CATEGORY_BITS)
+      - eans : tuples (tuple vide partagé si aucun)
+    Le scoring lit les colonnes par position, sans dict par ligne ; `rows` / `row()` reconstruisent
+    les dicts d'origine pour les appelants qui en ont besoin.
+    """
     def __init__(self, hubspot_products: List[Dict[str, Any]]):
-        self.rows = []
+        self.ids: List[str]       = []
+        self.names: List[str]     = []
+        self.norm_names: List[str] = []
+        self.skus: List[Any]      = []
+        self.hs_codes: List[Any]  = []
+        self.prices      = array("d")
+        self.sizes       = array("i")
+        self.aroma_masks = array("I")
+        self.cat_masks   = array("I")
+        self.eans: List[tuple]    = []
+        self._pos = {}
+        # Index inversé : clé de signal -> position (une seule ligne, cas des identifiants) ou set de positions.
+        self._index = {}
+        # Colonnes dérivées (scoring par lot), recalculées après modification.
+        self._columns = None
+        # Plus grande date de modification vue (epoch ms), sert de point de départ au delta.
+        self.high_water_mark = 0
+        self.upsert(hubspot_products)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _store(self, pos: int, feat: Dict[str, Any]) -> None:
+        values = (
+            (self.ids, sys.intern(str(feat["id"])) if feat["id"] is not None else None),
+            (self.names, sys.intern(feat["name"])),
+            (self.norm_names, sys.intern(feat["norm_name"])),
+            (self.skus, feat["sku"]),
+            (self.hs_codes, feat["hs_code"]),
+            (self.prices, NAN if feat["price"] is None else feat["price"]),
+            (self.sizes, _NO_SIZE if feat["size"] is None else feat["size"]),
+            (self.aroma_masks, _to_mask(feat["aromas"], AROMA_BITS)),
+            (self.cat_masks, _to_mask(feat["cats"], CATEGORY_BITS)),
+            (self.eans, tuple(sorted(feat["eans"])) if feat["eans"] else _NO_EANS),
+        )
+        for column, value in values:
+            if pos == len(column):
+                column.append(value)
+            else:
+                column[pos] = value
+
+    def price_at(self, pos: int) -> Optional[float]:
+        price = self.prices[pos]
+        return None if price != price else price
+
+    def row(self, pos: int) -> Dict[str, Any]:
+        """
+        Ligne `pos` sous la forme d'un dict (format de _featurize_product).
+        """
+        size = self.sizes[pos]
+        return {
+            "id": self.ids[pos],
+            "name": self.names[pos],
+            "norm_name": self.norm_names[pos],
+            "price": self.price_at(pos),
+            "sku": self.skus[pos],
+            "hs_code": self.hs_codes[pos],
+            "size": None if size == _NO_SIZE else size,
+            "aromas": _from_mask(self.aroma_masks[pos], AROMA_BITS),
+            "cats": _from_mask(self.cat_masks[pos], CATEGORY_BITS),
+            "eans": set(self.eans[pos]),
+        }
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        # Compatibilité : construit un dict par ligne, à éviter dans les boucles de scoring.
+        return [self.row(pos) for pos in range(len(self))]
+
+    def upsert(self, hubspot_products: List[Dict[str, Any]]) -> int:
+        """
+        Ajoute ou remplace (à la même position) les products donnés. Retourne le nombre de lignes
+        ajoutées ou réellement modifiées (un product relu à l'identique, ex. marge du delta, ne compte pas).
+        """
+        changed = 0
         for row in hubspot_products:
-            props = row.get("properties", {}) or {}
-            name     = props.get(HS_PROD_NAME, "") or ""
-            price    = props.get(HS_PROD_PRICE, None)
-            desc     = props.get(HS_PROD_DESC, "") or ""
-            sku      = props.get(HS_PROD_SKU, None)
-            hs_code  = props.get(HS_PROD_CODE, None)
-            norm     = normalize_name_for_match(name)
-            size     = extract_size_token(name)
-            aromas   = extract_aromes(name)
-            cats     = extract_categories(name) | extract_categories(desc)
-            eans     = set(extract_eans(desc))
-
-            self.rows.append({
-                "id": row.get("id"),
-                "name": name,
-                "norm_name": norm,
-                "price": _safe_float(price),
-                "sku": sku,
-                "hs_code": hs_code,
-                "desc": desc,
-                "size": size,
-                "aromas": aromas,
-                "cats": cats,
-                "eans": eans,
-            })
+            changed += self._upsert_features(_featurize_product(row))
+            updated = _iso_to_ms(row.get("updatedAt"))
+            if updated and updated > self.high_water_mark:
+                self.high_water_mark = updated
+        if changed:
+            self._columns = None
+        return changed
+
+    def _upsert_features(self, feat: Dict[str, Any]) -> bool:
+        pos = self._pos.get(feat["id"])
+        if pos is None:
+            pos = len(self)
+            self._pos[feat["id"]] = pos
+        else:
+            if self.row(pos) == dict(feat, id=self.ids[pos]):
+                return False
+            self._unindex_row(pos)
+        self._store(pos, feat)
+        self._index_row(pos)
+        return True
+
+    def remove(self, ids: List[str]) -> int:
+        """
+        Retire les products archivés. Retourne le nombre de lignes supprimées.
+        """
+        drop = {i for i in ids if i in self._pos}
+        if drop:
+            keep = [pos for pos, i in enumerate(self.ids) if i not in drop]
+            for name in _LIST_COLUMNS:
+                column = getattr(self, name)
+                setattr(self, name, [column[pos] for pos in keep])
+            for name in _ARRAY_COLUMNS:
+                column = getattr(self, name)
+                setattr(self, name, array(column.typecode, (column[pos] for pos in keep)))
+            self._pos = {i: pos for pos, i in enumerate(self.ids)}
+            self._index = {}
+            for pos in range(len(self)):
+                self._index_row(pos)
+            self._columns = None
+        return len(drop)
+
+    def _row_keys(self, pos: int) -> set:
+        size = self.sizes[pos]
+        keys = _signal_keys(self.norm_names[pos], None if size == _NO_SIZE else size,
+                            _from_mask(self.aroma_masks[pos], AROMA_BITS),
+                            _from_mask(self.cat_masks[pos], CATEGORY_BITS), self.eans[pos])
+        # Identifiants exacts (fast path avant le fuzzy).
+        if self.skus[pos]:
+            keys.add(("sku", _norm_identifier(self.skus[pos])))
+        if self.hs_codes[pos]:
+            keys.add(("product_id", _norm_identifier(self.hs_codes[pos])))
+        if self.ids[pos]:
+            keys.add(("product_id", _norm_identifier(self.ids[pos])))
+        return keys
+
+    def _index_row(self, pos: int) -> None:
+        for key in self._row_keys(pos):
+            bucket = self._index.get(key)
+            if bucket is None:
+                self._index[key] = pos
+            elif isinstance(bucket, int):
+                if bucket != pos:
+                    self._index[key] = {bucket, pos}
+            else:
+                bucket.add(pos)
+
+    def _unindex_row(self, pos: int) -> None:
+        for key in self._row_keys(pos):
+            bucket = self._index.get(key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, int):
+                if bucket == pos:
+                    del self._index[key]
+                continue
+            bucket.discard(pos)
+            if len(bucket) == 1:
+                self._index[key] = next(iter(bucket))
+
+    def positions(self, key) -> Union[set, tuple]:
+        """
+        Positions des lignes portant la clé de signal `key` (ex. ("cat", "ug")).
+        """
+        bucket = self._index.get(key)
+        if bucket is None:
+            return ()
+        return (bucket,) if isinstance(bucket, int) else bucket
+
+    def candidates(self, input_name: str) -> List[Dict[str, Any]]:
+        """
+        Lignes partageant au moins un signal avec le nom en entrée, dans l'ordre du catalogue
+        (même départage des égalités qu'un scan complet).
+        """
+        return [self.row(pos) for pos in self.candidate_positions(input_features(input_name, None))]
+
+    def candidate_positions(self, feat: Dict[str, Any]) -> List[int]:
+        keys = _signal_keys(feat["norm_name"], feat["size"], feat["aromas"], feat["cats"], feat["eans"])
+        positions = set()
+        for key in keys:
+            positions.update(self.positions(key))
+        return sorted(positions)
+
+    def lookup(self, kind: str, values) -> List[int]:
+        """
+        Positions des lignes portant exactement l'un des identifiants donnés (kind : "ean", "sku", "product_id").
+        """
+        positions = set()
+        for v in values:
+            key = v if kind == "ean" else _norm_identifier(v)
+            positions.update(self.positions((kind, key)))
+        return sorted(positions)
+
+    def price_columns(self):
+        """
+        (prix, masque prix non nul) en tableaux numpy, NaN pour les prix absents.
+        """
+        if self._columns is None:
+            import numpy as np
+            prices = np.array(self.prices, dtype=np.float64)
+            self._columns = (prices, ~np.isnan(prices) & (prices != 0))
+        return self._columns
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        rows = []
+        for r in self.rows:
+            for f in _SET_FIELDS:
+                r[f] = sorted(r[f])
+            rows.append(r)
+        return {
+            "version": CATALOG_SNAPSHOT_VERSION,
+            "high_water_mark": self.high_water_mark,
+            "rows": rows,
+        }
+
+    def to_artifact(self) -> bytes:
+        """
+        Artefact binaire : en-tête versionné + colonnes, index inversé et high-water mark (marshal).
+        """
+        payload = marshal.dumps({
+            "high_water_mark": self.high_water_mark,
+            "vocabulary": (tuple(AROMA_BITS), tuple(CATEGORY_BITS)),
+            "lists": {name: getattr(self, name) for name in _LIST_COLUMNS},
+            "arrays": {name: (getattr(self, name).typecode, getattr(self, name).itemsize, getattr(self, name).tobytes())
+                       for name in _ARRAY_COLUMNS},
+            "index": self._index,
+        })
+        header = _ARTIFACT_HEADER.pack(CATALOG_ARTIFACT_MAGIC, CATALOG_ARTIFACT_VERSION, CATALOG_FEATURES_VERSION,
+                                       marshal.version, len(payload))
+        return header + payload
+
+    @classmethod
+    def from_artifact(cls, buf) -> "ProductCatalog":
+        """
+        Recharge un catalogue depuis un artefact (bytes ou mmap), sans featurisation ni réindexation.
+        Lève ValueError si l'artefact est invalide ou périmé (format, features, vocabulaire ou plateforme différents).
+        """
+        header = artifact_header(buf)
+        expected = {"version": CATALOG_ARTIFACT_VERSION, "features_version": CATALOG_FEATURES_VERSION,
+                    "marshal_version": marshal.version}
+        for key, value in expected.items():
+            if header[key] != value:
+                raise ValueError(f"artefact périmé ({key} {header[key]}, attendu {value})")
+        # Des centaines de milliers de tuples / sets / entrées d'index créés d'un bloc, rien à libérer :
+        # le ramasse-miettes cyclique est suspendu pendant la reconstruction (~25 % du temps de chargement).
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with memoryview(buf) as view:
+                data = marshal.loads(view[_ARTIFACT_HEADER.size:_ARTIFACT_HEADER.size + header["size"]])
+            if data["vocabulary"] != (tuple(AROMA_BITS), tuple(CATEGORY_BITS)):
+                raise ValueError("artefact périmé (vocabulaire aromes / catégories)")
+
+            catalog = cls([])
+            for name in _LIST_COLUMNS:
+                setattr(catalog, name, data["lists"][name])
+            for name in _ARRAY_COLUMNS:
+                typecode, itemsize, raw = data["arrays"][name]
+                column = array(typecode)
+                if column.itemsize != itemsize:
+                    raise ValueError(f"artefact périmé (taille des éléments de {name})")
+                column.frombytes(raw)
+                setattr(catalog, name, column)
+            catalog._index = data["index"]
+            catalog._pos = {i: pos for pos, i in enumerate(catalog.ids)}
+            catalog.high_water_mark = data["high_water_mark"]
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return catalog
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "ProductCatalog":
+        catalog = cls([])
+        for r in snapshot.get("rows", []):
+            for f in _SET_FIELDS:
+                r[f] = set(r.get(f) or [])
+            catalog._upsert_features(r)
+        catalog.high_water_mark = int(snapshot.get("high_water_mark") or 0)
+        return catalog
 
 def _safe_float(v):
     try:
@@ -176,26 +598,49 @@ def _safe_float(v):
         return None
 
 # ===================== MATCHING =====================
-def score_candidate(input_name: str,
-                    input_price: Optional[float],
-                    cand: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+def input_features(input_name: str, input_price: Optional[float]) -> Dict[str, Any]:
     """
-    Score global = score_nom + bonus (prix, size, aromes, categories, ean).
-    Renvoie (score_total, details_bonus)
+    Signaux de la ligne de commande, extraits une seule fois quel que soit le nombre de candidats.
+    """
+    feat = {
+        "norm_name": normalize_name_for_match(input_name),
+        "price": input_price,
+        "size": extract_size_token(input_name),
+        "aromas": extract_aromes(input_name),
+        "cats": extract_categories(input_name),
+        "eans": set(extract_eans(input_name)),
+    }
+    feat["aroma_mask"] = _to_mask(feat["aromas"], AROMA_BITS)
+    feat["cat_mask"]   = _to_mask(feat["cats"], CATEGORY_BITS)
+    return feat
+
+def _score_features(feat: Dict[str, Any], cand: Dict[str, Any], s_name) -> Tuple[int, Dict[str, Any]]:
     """
+    Score d'un candidat au format dict (ProductCatalog.row).
+    """
+    return _score_values(feat, cand["price"], cand["size"],
+                         _to_mask(cand["aromas"], AROMA_BITS), _to_mask(cand["cats"], CATEGORY_BITS), cand["eans"], s_name)
+
+def _score_at(feat: Dict[str, Any], catalog: ProductCatalog, pos: int, s_name) -> Tuple[int, Dict[str, Any]]:
+    """
+    Score de la ligne `pos` du catalogue, lu directement dans les colonnes.
+    """
+    return _score_values(feat, catalog.price_at(pos), catalog.sizes[pos],
+                         catalog.aroma_masks[pos], catalog.cat_masks[pos], catalog.eans[pos], s_name)
+
+def _score_values(feat: Dict[str, Any], cand_price: Optional[float], cand_size: Optional[int],
+                  cand_aromas: int, cand_cats: int, cand_eans, s_name) -> Tuple[int, Dict[str, Any]]:
     details = {"name_score": 0, "price_bonus": 0, "size_bonus": 0, "aroma_bonus": 0, "cat_bonus": 0, "ean_bonus": 0}
 
-    # 1) score de nom (fuzzy)
-    in_norm  = normalize_name_for_match(input_name)
-    cand_norm= cand["norm_name"]
-    s_name   = name_ratio(in_norm, cand_norm)
+    # 1) score de nom (fuzzy), calculé par l'appelant
     details["name_score"] = s_name
 
     total = s_name
 
     # 2) bonus prix (si >0), plus c’est proche, plus bonus
-    if input_price is not None and input_price > 0 and cand["price"] not in (None, 0):
-        diff = abs(cand["price"] - input_price)
+    input_price = feat["price"]
+    if input_price is not None and input_price > 0 and cand_price not in (None, 0):
+        diff = abs(cand_price - input_price)
         rel  = diff / max(1e-6, input_price)
         if rel <= 0.01:   # <=1%
             bonus = 12
@@ -211,110 +656,639 @@ def score_candidate(input_name: str,
         total += bonus
     else:
         # si l’un vaut 0 et l’autre non → pénalité légère
-        if (input_price == 0 and (cand["price"] or 0) > 0) or ((input_price or 0) > 0 and (cand["price"] or 0) == 0):
+        if (input_price == 0 and (cand_price or 0) > 0) or ((input_price or 0) > 0 and (cand_price or 0) == 0):
             total -= 3
 
     # 3) bonus size (x42, x60…)
-    in_size = extract_size_token(input_name)
-    if in_size and cand["size"] == in_size:
+    in_size = feat["size"]
+    if in_size and cand_size == in_size:
         details["size_bonus"] = 6
         total += 6
 
     # 4) bonus aromes (fraise, orange, citron-vert/menthe…)
-    in_aromas = extract_aromes(input_name)
-    common_aromas = in_aromas & cand["aromas"]
-    if common_aromas:
-        add = 6 if len(common_aromas) >= 1 else 0
-        details["aroma_bonus"] = add
-        total += add
+    if feat["aroma_mask"] & cand_aromas:
+        details["aroma_bonus"] = 6
+        total += 6
 
     # 5) bonus categories (UG/PLV/Présentoir/Sachet/Échantillon/Pack/Trousse…)
-    in_cats = extract_categories(input_name)
-    common_cats = in_cats & cand["cats"]
+    common_cats = feat["cat_mask"] & cand_cats
     if common_cats:
-        add = 8 if ("ug" in common_cats or "presentoir" in common_cats) else 5
+        add = 8 if common_cats & UG_PRESENTOIR_MASK else 5
         details["cat_bonus"] = add
         total += add
 
     # 6) bonus EAN si détectable des deux côtés
-    in_eans = set(extract_eans(input_name))
-    if in_eans and cand["eans"]:
-        if in_eans & cand["eans"]:
+    in_eans = feat["eans"]
+    if in_eans and cand_eans:
+        if not in_eans.isdisjoint(cand_eans):
             details["ean_bonus"] = 20
             total += 20
 
     return total, details
 
-def match_one_item(catalog: ProductCatalog,
-                   item: Dict[str, Any],
-                   min_score: int = 78) -> Dict[str, Any]:
+def score_candidate(input_name: str,
+                    input_price: Optional[float],
+                    cand: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
     """
-    item = {'nom_produit': ..., 'prix_unitaire': ...}
-    Retourne un dict avec match ou no_match + détails.
+    Score global = score_nom + bonus (prix, size, aromes, categories, ean).
+    Renvoie (score_total, details_bonus)
     """
-    name_in  = item.get("nom_produit") or ""
-    price_in = _safe_float(item.get("prix_unitaire"))
+    feat = input_features(input_name, input_price)
+    return _score_features(feat, cand, name_ratio(feat["norm_name"], cand["norm_name"]))
 
-    best = None
-    best_score = -10**9
-    best_details = {}
-    for cand in catalog.rows:
-        sc, det = score_candidate(name_in, price_in, cand)
-        if sc > best_score:
-            best = cand
-            best_score = sc
-            best_details = det
-
-    if best and best_score >= min_score:
-        return {
+# Écart de score en dessous duquel le 2e candidat rend le matching ambigu (x42 / x60, fraise / orange…).
+AMBIGUITY_MARGIN = 5
+
+def max_bonus(feat: Dict[str, Any]) -> int:
+    """
+    Borne supérieure des bonus de _score_features pour une ligne, d'après sa table fixe : prix 12,
+    size 6, aromes 6, categories 8, EAN 20 (52 au total), chacun seulement si la ligne porte le signal.
+    """
+    bonus = 0
+    if feat["price"] is not None and feat["price"] > 0:
+        bonus += 12
+    if feat["size"]:
+        bonus += 6
+    if feat["aromas"]:
+        bonus += 6
+    if feat["cats"]:
+        bonus += 8
+    if feat["eans"]:
+        bonus += 20
+    return bonus
+
+def _top_candidates(feat: Dict[str, Any], catalog: ProductCatalog, positions, k: int = 1):
+    """
+    Les k meilleurs candidats parmi `positions` (croissantes) : liste de (position, score, détails), par score
+    décroissant puis par position (à égalité, le premier rencontré l'emporte, comme un scan simple).
+    Élagage une fois k candidats retenus : un candidat ne peut dépasser le k-ième score que si son score
+    de nom dépasse ce score moins max_bonus ; rapidfuzz reçoit ce seuil (score_cutoff) et les candidats
+    en dessous ne sont pas scorés. Mêmes résultats qu'un scan sans élagage.
+    """
+    top = []
+    kth = None
+    bound = max_bonus(feat)
+    query, norm_names = feat["norm_name"], catalog.norm_names
+    for pos in positions:
+        if kth is None:
+            s_name = name_ratio(query, norm_names[pos])
+        else:
+            if kth >= 100 + bound:
+                break
+            # Marge : l'arrondi flottant ne doit pas écarter un candidat à égalité près.
+            s_name = name_ratio(query, norm_names[pos], score_cutoff=max(0, kth - bound - 1e-6))
+            if s_name + bound < kth - 1e-6:
+                continue
+        sc, det = _score_at(feat, catalog, pos, s_name)
+        if kth is not None and sc <= kth:
+            continue
+        at = len(top)
+        while at and top[at - 1][1] < sc:
+            at -= 1
+        top.insert(at, (pos, sc, det))
+        if len(top) > k:
+            top.pop()
+        if len(top) == k:
+            kth = top[-1][1]
+    return top
+
+def _candidate_entry(catalog: ProductCatalog, pos: int, score, details: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "hs_object_id": catalog.ids[pos],
+        "matched_name": catalog.names[pos],
+        "matched_price": catalog.price_at(pos),
+        "score": int(score),
+        "details": details,
+    }
+
+def _with_alternatives(result: Dict[str, Any], catalog: ProductCatalog, best_score, alternatives) -> Dict[str, Any]:
+    """
+    alternatives : [(position, score, détails)] suivant le meilleur, None si non demandées.
+    """
+    if alternatives is not None:
+        result["alternatives"] = [_candidate_entry(catalog, pos, sc, det) for pos, sc, det in alternatives]
+        result["ambiguous"] = bool(alternatives) and best_score - alternatives[0][1] <= AMBIGUITY_MARGIN
+    return result
+
+def match_top_k(catalog: ProductCatalog, item: Dict[str, Any], k: int = 3) -> List[Dict[str, Any]]:
+    """
+    Les k meilleurs products du catalogue pour une ligne (scan complet élagué), avec le détail des scores.
+    """
+    feat = input_features(item.get("nom_produit") or "", _safe_float(item.get("prix_unitaire")))
+    tracing.count("rows_scored", len(catalog))
+    return [_candidate_entry(catalog, pos, sc, det) for pos, sc, det in _top_candidates(feat, catalog, range(len(catalog)), k)]
+
+def _match_result(item: Dict[str, Any], catalog: ProductCatalog, best: Optional[int], best_score, best_details,
+                  min_score: int, alternatives=None) -> Dict[str, Any]:
+    # best : position du meilleur candidat (None si aucun).
+    if best is not None and best_score >= min_score:
+        return _with_alternatives({
             "input": item,
             "match": "found",
-            "hs_object_id": best["id"],
-            "matched_name": best["name"],
-            "matched_price": best["price"],
+            "hs_object_id": catalog.ids[best],
+            "matched_name": catalog.names[best],
+            "matched_price": catalog.price_at(best),
             "score": int(best_score),
             "method": "fuzzy+signals",
             "details": best_details
-        }
+        }, catalog, best_score, alternatives)
     else:
-        return {
+        return _with_alternatives({
             "input": item,
             "match": "no_match",
             "hs_object_id": None,
             "matched_name": None,
             "matched_price": None,
-            "score": int(best_score if best else 0),
+            "score": int(best_score if best is not None else 0),
             "method": "fuzzy+signals",
-            "details": best_details if best else {}
-        }
+            "details": best_details if best is not None else {}
+        }, catalog, best_score, alternatives)
+
+# Champs d'une ligne de commande pouvant porter un identifiant produit.
+ITEM_EAN_FIELDS        = ("ean", "code_ean", "gtin")
+ITEM_SKU_FIELDS        = ("sku", "hs_sku", "reference", "ref", "code_produit")
+ITEM_PRODUCT_ID_FIELDS = ("hs_product_id", "hs_object_id")
+
+def _item_identifiers(item: Dict[str, Any], kind_fields) -> List[str]:
+    return [str(item[f]).strip() for f in kind_fields if item.get(f) not in (None, "")]
+
+def match_exact_identifier(catalog: ProductCatalog, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Fast path O(1) : si la ligne porte un EAN / SKU / ID produit qui désigne un seul product,
+    on le retourne directement sans scorer le catalogue. Sinon None.
+    """
+    name_in = item.get("nom_produit") or ""
+    lookups = [
+        ("ean", "ean_exact", _item_identifiers(item, ITEM_EAN_FIELDS) + extract_eans(name_in)),
+        ("sku", "sku_exact", _item_identifiers(item, ITEM_SKU_FIELDS)),
+        ("product_id", "product_id_exact", _item_identifiers(item, ITEM_PRODUCT_ID_FIELDS)),
+    ]
+    for kind, method, values in lookups:
+        if not values:
+            continue
+        hits = catalog.lookup(kind, values)
+        if len(hits) == 1:
+            best = hits[0]
+            return {
+                "input": item,
+                "match": "found",
+                "hs_object_id": catalog.ids[best],
+                "matched_name": catalog.names[best],
+                "matched_price": catalog.price_at(best),
+                "score": 100,
+                "method": method,
+                "details": {"identifier": kind, "values": values}
+            }
+    return None
+
+def _price_bonus_bound(feat: Dict[str, Any]) -> int:
+    """
+    Seul bonus possible pour une ligne du catalogue sans aucun signal commun avec l'entrée (size, aromes,
+    categories et EAN sont des clés de l'index inversé) : le bonus prix.
+    """
+    return 12 if feat["price"] is not None and feat["price"] > 0 else 0
+
+def _pruned_top(feat: Dict[str, Any], catalog: ProductCatalog, k: int):
+    """
+    Top k exact d'un scan complet (même format que _top_candidates) en scorant les candidats de l'index
+    inversé, puis seulement les autres lignes dont le score de nom atteint le k-ième score des candidats
+    moins le bonus prix. Une ligne sans signal commun peut gagner sur le seul fuzzy ("magnesiums marins"
+    pour "magnesium marin") : on ne l'écarte que si elle ne peut pas atteindre ce k-ième score.
+    """
+    positions = catalog.candidate_positions(feat)
+    top = _top_candidates(feat, catalog, positions, k)
+    cutoff = top[-1][1] - _price_bonus_bound(feat) - 1e-6 if len(top) == k else 0
+    if cutoff > 100:
+        tracing.count("rows_scored", len(positions))
+        return top
+    if cutoff <= 0:
+        tracing.count("rows_scored", len(catalog))
+        return _top_candidates(feat, catalog, range(len(catalog)), k)
+
+    # Scores de nom des autres lignes en un appel rapidfuzz (0 sous le seuil), sinon ligne par ligne.
+    scores = _name_score_matrix([feat["norm_name"]], catalog.norm_names, score_cutoff=cutoff)
+    if scores is None:
+        hits = [pos for pos, name in enumerate(catalog.norm_names)
+                if name_ratio(feat["norm_name"], name, score_cutoff=cutoff) >= cutoff]
+    else:
+        hits = (scores[0] >= cutoff).nonzero()[0].tolist()
+    candidates = set(positions)
+    extra = [pos for pos in hits if pos not in candidates]
+    tracing.count("rows_scored", len(positions) + len(extra))
+    if not extra:
+        return top
+    # Fusion : score décroissant puis position, comme un scan dans l'ordre du catalogue.
+    merged = top + _top_candidates(feat, catalog, extra, k)
+    return sorted(merged, key=lambda r: (-r[1], r[0]))[:k]
+
+def match_one_item(catalog: ProductCatalog,
+                   item: Dict[str, Any],
+                   min_score: int = 78,
+                   prune: bool = True,
+                   exact: bool = True,
+                   alternatives: int = 0) -> Dict[str, Any]:
+    """
+    item = {'nom_produit': ..., 'prix_unitaire': ...}
+    Retourne un dict avec match ou no_match + détails.
+    prune : ne score que les candidats de l'index inversé et les lignes sans signal commun dont le score
+            de nom peut encore les rattraper (_pruned_top) ; mêmes résultats qu'un scan complet.
+    exact : tente d'abord la correspondance exacte EAN / SKU / ID produit.
+    alternatives : nombre de candidats suivants à joindre au résultat ("alternatives", "ambiguous").
+    """
+    if exact:
+        hit = match_exact_identifier(catalog, item)
+        if hit:
+            return hit
+
+    name_in  = item.get("nom_produit") or ""
+    price_in = _safe_float(item.get("prix_unitaire"))
+    feat     = input_features(name_in, price_in)
+
+    if prune:
+        top = _pruned_top(feat, catalog, alternatives + 1)
+    else:
+        top = _top_candidates(feat, catalog, range(len(catalog)), alternatives + 1)
+        tracing.count("rows_scored", len(catalog))
+
+    best, best_score, best_details = top[0] if top else (None, -10**9, {})
+    return _match_result(item, catalog, best, best_score, best_details, min_score,
+                         top[1:] if alternatives else None)
+
+# ===================== MATCHING PAR LOT =====================
+def _name_score_matrix(queries: List[str], choices: List[str], score_cutoff=None):
+    """
+    Matrice (lignes x catalogue) des scores de nom en un seul appel rapidfuzz.
+    score_cutoff : les scores inférieurs valent 0.
+    Retourne None si rapidfuzz/numpy ne sont pas disponibles.
+    """
+    try:
+        import numpy as np
+        from rapidfuzz import process, fuzz
+    except ImportError:
+        return None
+    return process.cdist(queries, choices, scorer=fuzz.token_set_ratio, dtype=np.float64, workers=-1,
+                         score_cutoff=score_cutoff)
+
+def _bonus_vector(catalog: ProductCatalog, feat: Dict[str, Any]):
+    """
+    Somme des bonus (prix, size, aromes, categories, EAN) pour tout le catalogue,
+    en opérations vectorisées. Les bonus ensemblistes passent par l'index inversé.
+    """
+    import numpy as np
+
+    prices, nonzero = catalog.price_columns()
+    bonus = np.zeros(len(catalog), dtype=np.float64)
+
+    # 2) prix
+    input_price = feat["price"]
+    if input_price is not None and input_price > 0:
+        rel = np.abs(prices - input_price) / max(1e-6, input_price)
+        tiers = np.select([rel <= 0.01, rel <= 0.03, rel <= 0.07, rel <= 0.12], [12, 9, 6, 3], default=0)
+        bonus += np.where(nonzero, tiers, -3)
+    elif input_price == 0:
+        bonus -= np.where(np.nan_to_num(prices) > 0, 3, 0)
+
+    def _positions(kind, values):
+        pos = set()
+        for v in values:
+            pos.update(catalog.positions((kind, v)))
+        return np.fromiter(pos, dtype=np.int64, count=len(pos))
+
+    # 3) size
+    if feat["size"]:
+        bonus[_positions("size", [feat["size"]])] += 6
+    # 4) aromes
+    bonus[_positions("aroma", feat["aromas"])] += 6
+    # 5) categories : 8 si UG/présentoir en commun, sinon 5
+    cat_bonus = np.zeros(len(catalog), dtype=np.float64)
+    cat_bonus[_positions("cat", feat["cats"])] = 5
+    cat_bonus[_positions("cat", feat["cats"] & {"ug", "presentoir"})] = 8
+    bonus += cat_bonus
+    # 6) EAN
+    bonus[_positions("ean", feat["eans"])] += 20
+    return bonus
+
+def match_items_batch(catalog: ProductCatalog,
+                      items: List[Dict[str, Any]],
+                      min_score: int = 78,
+                      exact: bool = True,
+                      alternatives: int = 0) -> List[Dict[str, Any]]:
+    """
+    Matching de toutes les lignes d'une commande en une passe : signaux extraits une fois par ligne,
+    scores de nom calculés en une matrice (rapidfuzz cdist), bonus appliqués en vectoriel sur le catalogue.
+    Mêmes résultats (et mêmes `details`) qu'un scan complet ligne par ligne.
+    Sans numpy, retombe sur match_one_item avec élagage (index inversé).
+    """
+    out = [match_exact_identifier(catalog, it) if exact else None for it in items]
+    todo = [i for i, r in enumerate(out) if r is None]
+    if not todo:
+        return out
+    if not len(catalog):
+        for i in todo:
+            out[i] = match_one_item(catalog, items[i], min_score=min_score, prune=True, exact=False,
+                                    alternatives=alternatives)
+        return out
+
+    feats = [input_features(items[i].get("nom_produit") or "", _safe_float(items[i].get("prix_unitaire"))) for i in todo]
+    matrix = _name_score_matrix([f["norm_name"] for f in feats], catalog.norm_names)
+    if matrix is None:
+        for i in todo:
+            out[i] = match_one_item(catalog, items[i], min_score=min_score, prune=True, exact=False,
+                                    alternatives=alternatives)
+        return out
+    tracing.count("rows_scored", len(todo) * len(catalog))
+
+    import numpy as np
+    for row, (i, feat) in enumerate(zip(todo, feats)):
+        it = items[i]
+        totals = matrix[row] + _bonus_vector(catalog, feat)
+        # Les k premiers totaux et leurs ex-aequo (à l'arrondi flottant près) sont re-scorés dans l'ordre
+        # du catalogue : même total et même départage que le scan séquentiel.
+        k = min(alternatives + 1, len(totals))
+        threshold = totals.max() if k == 1 else np.partition(totals, -k)[-k]
+        ranked = []
+        for pos in (totals >= threshold - 1e-6).nonzero()[0].tolist():
+            sc, det = _score_at(feat, catalog, pos, float(matrix[row, pos]))
+            ranked.append((pos, sc, det))
+        ranked.sort(key=lambda r: -r[1])
+        best, best_score, best_details = ranked[0]
+        out[i] = _match_result(it, catalog, best, best_score, best_details, min_score,
+                               ranked[1:k] if alternatives else None)
+    return out
+
+# ===================== MATCHING PARALLÈLE (multi-processus) =====================
+# Le catalogue est découpé en tranches contiguës, une par processus. Les processus sont créés par fork :
+# catalogue et signaux des lignes sont hérités tels quels (aucune sérialisation par tâche), seuls les
+# meilleurs candidats de chaque tranche reviennent par Pipe. Process + Pipe fonctionnent sur Lambda,
+# contrairement à multiprocessing.Pool / Queue (pas de /dev/shm).
+PRODUCT_MATCH_WORKERS = int(os.getenv("PRODUCT_MATCH_WORKERS") or os.cpu_count() or 1)
+PARALLEL_MIN_ROWS     = 5000   # en dessous, le coût des fork dépasse le gain
+# Attente max des résultats des workers (secondes), puis des processus eux-mêmes avant terminate().
+PARALLEL_TIMEOUT      = float(os.getenv("PRODUCT_MATCH_TIMEOUT", "60"))
+PARALLEL_JOIN_TIMEOUT = 5
+
+def _top_in_shard(catalog: ProductCatalog, feats: List[Dict[str, Any]], lo: int, hi: int, k: int):
+    """
+    Pour chaque ligne : les k meilleurs (position, score, détails) parmi les positions lo..hi-1.
+    Pas de compteur de trace ici : son verrou a pu être copié verrouillé par le fork.
+    """
+    return [_top_candidates(feat, catalog, range(lo, hi), k) for feat in feats]
+
+def _shard_worker(conn, catalog: ProductCatalog, feats: List[Dict[str, Any]], lo: int, hi: int, k: int) -> None:
+    # Sortie par os._exit : ni flush de stdout ni handlers atexit, dont les verrous ont pu être copiés
+    # verrouillés par le fork (thread du backlog en train d'écrire) et bloqueraient le worker.
+    code = 0
+    try:
+        conn.send(("ok", _top_in_shard(catalog, feats, lo, hi, k)))
+    except Exception as e:
+        code = 1
+        try:
+            conn.send(("error", repr(e)))
+        except Exception:
+            pass
+    finally:
+        conn.close()
+        os._exit(code)
+
+def match_items_parallel(catalog: ProductCatalog,
+                         items: List[Dict[str, Any]],
+                         min_score: int = 78,
+                         exact: bool = True,
+                         workers: Optional[int] = None,
+                         alternatives: int = 0) -> List[Dict[str, Any]]:
+    """
+    Matching des lignes d'une commande réparti sur plusieurs processus (tranches du catalogue).
+    Mêmes résultats qu'un scan complet ligne par ligne : les meilleurs candidats par tranche sont
+    fusionnés dans l'ordre du catalogue, le premier rencontré l'emportant en cas d'égalité.
+    Retombe sur match_items_batch avec un seul worker, un petit catalogue ou sans fork.
+    """
+    workers = min(workers or PRODUCT_MATCH_WORKERS, max(1, len(catalog)))
+    if (workers <= 1 or len(catalog) < PARALLEL_MIN_ROWS
+            or "fork" not in multiprocessing.get_all_start_methods()):
+        return match_items_batch(catalog, items, min_score=min_score, exact=exact, alternatives=alternatives)
+
+    out = [match_exact_identifier(catalog, it) if exact else None for it in items]
+    todo = [i for i, r in enumerate(out) if r is None]
+    if not todo:
+        return out
+
+    feats = [input_features(items[i].get("nom_produit") or "", _safe_float(items[i].get("prix_unitaire"))) for i in todo]
+    # rapidfuzz importé avant le fork (le verrou d'import pourrait être tenu par un autre thread).
+    name_ratio("", "")
+
+    ctx = multiprocessing.get_context("fork")
+    bounds = [len(catalog) * k // workers for k in range(workers + 1)]
+    procs = []
+    shards = []
+    try:
+        for lo, hi in zip(bounds, bounds[1:]):
+            reader, writer = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_shard_worker, args=(writer, catalog, feats, lo, hi, alternatives + 1),
+                               daemon=True)
+            proc.start()
+            writer.close()
+            procs.append((proc, reader))
+        deadline = time.monotonic() + PARALLEL_TIMEOUT
+        for proc, reader in procs:
+            if not reader.poll(max(0.0, deadline - time.monotonic())):
+                raise RuntimeError(f"Worker de matching produits sans réponse après {PARALLEL_TIMEOUT:.0f} s.")
+            try:
+                status, payload = reader.recv()
+            except EOFError:
+                raise RuntimeError(f"Worker de matching produits interrompu (code {proc.exitcode}).")
+            if status != "ok":
+                raise RuntimeError(f"Worker de matching produits en échec : {payload}")
+            shards.append(payload)
+    finally:
+        # Jamais d'attente sans borne : un worker bloqué est tué (les autres ont déjà répondu ou sont abandonnés).
+        done = len(shards) == len(procs)
+        for proc, reader in procs:
+            reader.close()
+            proc.join(PARALLEL_JOIN_TIMEOUT if done else 0)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join(PARALLEL_JOIN_TIMEOUT)
+    tracing.count("rows_scored", len(todo) * len(catalog))
+
+    for k, i in enumerate(todo):
+        # Tranches concaténées dans l'ordre du catalogue puis tri stable : à score égal, la première
+        # position l'emporte, comme dans le scan séquentiel.
+        ranked = sorted((top for shard in shards for top in shard[k]), key=lambda r: -r[1])[:alternatives + 1]
+        best, best_score, best_details = ranked[0] if ranked else (None, -10**9, {})
+        out[i] = _match_result(items[i], catalog, best, best_score, best_details, min_score,
+                               ranked[1:] if alternatives else None)
+    return out
 
 # ===================== WRAPPER (listes imbriquées) =====================
 _product_cache_catalog: Optional[ProductCatalog] = None
 
-def ensure_catalog(force_refresh: bool = False) -> ProductCatalog:
+def load_catalog_snapshot(uri: Optional[str] = CATALOG_SNAPSHOT_URI) -> Optional[ProductCatalog]:
+    """
+    Catalogue depuis l'artefact binaire (mmap pour un fichier local), ou depuis un ancien snapshot JSON.
+    None si absent, illisible ou périmé : l'appelant reconstruit alors depuis HubSpot.
+    """
+    if not uri:
+        return None
+    try:
+        raw = map_bytes(uri)
+    except Exception as e:
+        print(f"⚠️ Snapshot catalogue illisible ({uri}) : {e}")
+        return None
+    if raw is None:
+        return None
+    try:
+        if raw[:len(CATALOG_ARTIFACT_MAGIC)] == CATALOG_ARTIFACT_MAGIC:
+            return ProductCatalog.from_artifact(raw)
+        snapshot = json.loads(bytes(raw).decode("utf-8"))
+        if snapshot.get("version") != CATALOG_SNAPSHOT_VERSION:
+            return None
+        return ProductCatalog.from_snapshot(snapshot)
+    except (ValueError, EOFError, KeyError) as e:
+        print(f"⚠️ Artefact catalogue ignoré ({uri}) : {e}")
+        return None
+    finally:
+        if not isinstance(raw, bytes):
+            raw.close()
+
+def save_catalog_snapshot(catalog: ProductCatalog, uri: Optional[str] = CATALOG_SNAPSHOT_URI) -> None:
+    if not uri:
+        return
+    try:
+        write_bytes(uri, catalog.to_artifact())
+    except Exception as e:
+        print(f"⚠️ Échec de l'écriture du snapshot catalogue ({uri}) : {e}")
+
+def build_catalog_artifact(uri: Optional[str] = CATALOG_SNAPSHOT_URI) -> Dict[str, Any]:
+    """
+    Étape de build (CLI build_catalog.py ou mode "catalog" du handler, planifiable) : reconstruit le
+    catalogue depuis HubSpot et écrit l'artefact sur `uri`. Contrairement à save_catalog_snapshot,
+    un échec d'écriture est levé.
+    """
     global _product_cache_catalog
-    if _product_cache_catalog is None or force_refresh:
-        hub = fetch_all_hubspot_products(PRODUCT_PROPERTIES)
-        _product_cache_catalog = ProductCatalog(hub)
+
+    if not uri:
+        raise RuntimeError("CATALOG_SNAPSHOT_URI non défini : aucune destination pour l'artefact catalogue")
+    catalog = rebuild_catalog()
+    body = catalog.to_artifact()
+    write_bytes(uri, body)
+    _product_cache_catalog = catalog
+    return {
+        "uri": uri,
+        "products": len(catalog),
+        "bytes": len(body),
+        "high_water_mark": catalog.high_water_mark,
+        "version": CATALOG_ARTIFACT_VERSION,
+        "features_version": CATALOG_FEATURES_VERSION,
+    }
+
+# Les products archivés ne sont lisibles que par l'API liste, sans filtre de date : chaque lecture parcourt
+# tout l'historique des archivés. Elle est faite au plus une fois par ARCHIVED_SYNC_INTERVAL secondes et
+# par conteneur ; entre deux lectures, un product archivé peut encore être matché.
+ARCHIVED_SYNC_INTERVAL = int(os.getenv("CATALOG_ARCHIVED_SYNC_INTERVAL", "900"))
+# Dernière lecture des archivés dans ce conteneur : (time.monotonic(), epoch ms au début de la lecture).
+_archived_synced_at: Optional[Tuple[float, int]] = None
+
+def _mark_archived_synced(started_ms: int) -> None:
+    global _archived_synced_at
+    _archived_synced_at = (time.monotonic(), started_ms)
+
+def rebuild_catalog() -> ProductCatalog:
+    """
+    Reconstruction complète depuis HubSpot (fallback explicite).
+    """
+    started_ms = int(time.time() * 1000)
+    catalog = ProductCatalog(fetch_all_hubspot_products(PRODUCT_PROPERTIES))
+    # La liste complète exclut déjà les archivés.
+    _mark_archived_synced(started_ms)
+    return catalog
+
+def sync_catalog(catalog: ProductCatalog) -> int:
+    """
+    Applique au catalogue les products modifiés depuis son high-water mark, et les archivés si leur
+    dernière lecture date de plus de ARCHIVED_SYNC_INTERVAL secondes.
+    Retourne le nombre de lignes ajoutées, réellement modifiées ou supprimées.
+    """
+    since = max(0, catalog.high_water_mark - SYNC_OVERLAP_MS)
+    modified = fetch_hubspot_products_modified_since(since)
+    changes  = catalog.upsert(modified)
+
+    if _archived_synced_at is None or time.monotonic() - _archived_synced_at[0] >= ARCHIVED_SYNC_INTERVAL:
+        # Première lecture du conteneur : tous les archivés (le snapshot chargé a pu en manquer).
+        archived_since = 0 if _archived_synced_at is None else max(0, _archived_synced_at[1] - SYNC_OVERLAP_MS)
+        started_ms = int(time.time() * 1000)
+        archived = fetch_hubspot_products_archived_since(archived_since)
+        changes += catalog.remove([r.get("id") for r in archived])
+        _mark_archived_synced(started_ms)
+    return changes
+
+def ensure_catalog(force_refresh: bool = False, incremental: bool = False) -> ProductCatalog:
+    """
+    - force_refresh : reconstruction complète depuis HubSpot.
+    - incremental   : synchronise le delta depuis le high-water mark (snapshot chargé si besoin).
+    Sans option, le catalogue en cache est réutilisé tel quel.
+    Au démarrage à froid, l'artefact (CATALOG_SNAPSHOT_URI) est rechargé puis complété par le delta ;
+    la reconstruction complète n'a lieu que s'il est absent ou périmé (version de format ou de features).
+    """
+    global _product_cache_catalog
+
+    if not force_refresh and _product_cache_catalog is None:
+        _product_cache_catalog = load_catalog_snapshot()
+        if _product_cache_catalog is not None:
+            incremental = True
+
+    if force_refresh or _product_cache_catalog is None:
+        _product_cache_catalog = rebuild_catalog()
+        save_catalog_snapshot(_product_cache_catalog)
+    elif incremental:
+        high_water_mark = _product_cache_catalog.high_water_mark
+        try:
+            changes = sync_catalog(_product_cache_catalog)
+        except CatalogDeltaTooLarge as e:
+            print(f"⚠️ {e}")
+            _product_cache_catalog = rebuild_catalog()
+            changes = len(_product_cache_catalog)
+        except (hubspot_client.HubSpotError, requests.RequestException, RuntimeError) as e:
+            # Débit épuisé ou HubSpot indisponible : une reconstruction complète échouerait de même en
+            # multipliant les appels. On garde le catalogue en cache ; le high-water mark n'avance que sur les
+            # products appliqués, le reste du delta sera repris à la prochaine synchronisation.
+            print(f"⚠️ Delta catalogue impossible ({e}), catalogue en cache conservé.")
+            changes = 0
+        # Snapshot réécrit seulement si les lignes ou le high-water mark ont changé (pas pour la marge du delta).
+        if changes or _product_cache_catalog.high_water_mark != high_water_mark:
+            save_catalog_snapshot(_product_cache_catalog)
+    tracing.gauge("catalog_size", len(_product_cache_catalog))
     return _product_cache_catalog
 
 Nested = Union[List[Any], Dict[str, Any]]
 
-def match_products_preserve_shape(nested: Nested, min_score: int = 78, force_refresh: bool = False) -> Nested:
+def match_products_preserve_shape(nested: Nested, min_score: int = 78, force_refresh: bool = False,
+                                  incremental: bool = False, prune: bool = True, batch: bool = False,
+                                  parallel: bool = False, alternatives: int = 0) -> Nested:
     """
     Accepte:
       - liste plate d’items produits
       - liste de listes
       - n niveaux d’imbrication
     Retourne la même structure, mais avec les objets résultat.
+    batch : matching de la commande en une passe (match_items_batch). Désactivé par défaut : il demande
+            numpy, absent des layers Lambda, et sans numpy chaque ligne serait matchée seule de toute façon.
+    parallel : scoring réparti sur plusieurs processus (PRODUCT_MATCH_WORKERS), pour les gros catalogues.
+    alternatives : joint aux résultats fuzzy les n candidats suivants et le drapeau "ambiguous".
     """
-    catalog = ensure_catalog(force_refresh=force_refresh)
+    catalog = ensure_catalog(force_refresh=force_refresh, incremental=incremental)
 
     if isinstance(nested, list):
         if not nested:
             return []
         if all(isinstance(x, dict) for x in nested):
-            return [match_one_item(catalog, x, min_score=min_score) for x in nested]
-        return [match_products_preserve_shape(x, min_score=min_score, force_refresh=False) for x in nested]
+            if parallel:
+                return match_items_parallel(catalog, nested, min_score=min_score, alternatives=alternatives)
+            if batch:
+                return match_items_batch(catalog, nested, min_score=min_score, alternatives=alternatives)
+            return [match_one_item(catalog, x, min_score=min_score, prune=prune, alternatives=alternatives)
+                    for x in nested]
+        return [match_products_preserve_shape(x, min_score=min_score, force_refresh=False, prune=prune, batch=batch,
+                                              parallel=parallel, alternatives=alternatives)
+                for x in nested]
     else:
         raise TypeError("L'entrée doit être une liste d’items ou une liste de listes.")
\ No newline at end of file
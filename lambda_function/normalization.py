@@ -0,0 +1,74 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+# ========= NORMALISATION TEXTE (partagée entreprises / produits) =========
+# Regex compilées une fois, abréviations d'adresse traduites en une seule passe,
+# résultats mémoïsés (LRU borné) : les mêmes adresses / noms reviennent à chaque candidat.
+
+NORM_CACHE_SIZE = int(os.getenv("NORM_CACHE_SIZE", "8192"))
+
+_PUNCT_RE      = re.compile(r"[^\w\s]")
+_PUNCT_DASH_RE = re.compile(r"[^\w\s\-]")   # on garde tirets pour "citron-vert"
+_SPACES_RE     = re.compile(r"\s+")
+
+# Abréviations d'adresse (mots entiers, après suppression des accents et de la ponctuation).
+ADDRESS_WORDS = {
+    "av": "avenue", "ar": "avenue",
+    "r": "rue",
+    "bd": "boulevard",
+    "ct": "centre", "ctr": "centre", "cte": "centre", "ctre": "centre",
+    "cta": "centre", "ctal": "centre",
+    "alle": "allee", "allee": "allee", "alleee": "allee",
+    "ste": "sainte",
+    "st": "saint",
+}
+# Expressions appliquées après les mots (sans bornes de mot, comme à l'origine).
+_ADDRESS_PHRASES_RE = re.compile(r"centre cial|ctre cial|c cial")
+
+# Termes génériques retirés des noms d'entreprise.
+COMPANY_NAME_NOISE = {"pharmacie", "pharma", "pharm", "parapharmacie", "para"}
+
+
+@lru_cache(maxsize=NORM_CACHE_SIZE)
+def _strip_accents_lower(s: str, keep_dash: bool) -> str:
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    s = s.lower()
+    s = (_PUNCT_DASH_RE if keep_dash else _PUNCT_RE).sub(" ", s)
+    return _SPACES_RE.sub(" ", s).strip()
+
+def strip_accents_lower(s: str, keep_dash: bool = False) -> str:
+    """
+    Minuscules sans accents, ponctuation remplacée par des espaces (tirets conservés si keep_dash).
+    """
+    return _strip_accents_lower(s or "", keep_dash)
+
+@lru_cache(maxsize=NORM_CACHE_SIZE)
+def _normalize_address(s: str) -> str:
+    words = _strip_accents_lower(s, False).split()
+    s = " ".join([ADDRESS_WORDS.get(w, w) for w in words])
+    return _ADDRESS_PHRASES_RE.sub("centre commercial", s)
+
+def normalize_address(s: str) -> str:
+    """
+    Adresse normalisée : "10 av. Foch, C Cial" -> "10 avenue foch centre commercial".
+    """
+    return _normalize_address(s or "")
+
+@lru_cache(maxsize=NORM_CACHE_SIZE)
+def _normalize_company_name(s: str) -> str:
+    return " ".join([w for w in _strip_accents_lower(s, False).split() if w not in COMPANY_NAME_NOISE])
+
+def normalize_company_name(s: str) -> str:
+    """
+    Nom d'entreprise normalisé, sans les termes génériques (pharmacie, para…).
+    """
+    return _normalize_company_name(s or "")
+
+def cache_info():
+    return {
+        "strip_accents_lower": _strip_accents_lower.cache_info(),
+        "normalize_address": _normalize_address.cache_info(),
+        "normalize_company_name": _normalize_company_name.cache_info(),
+    }
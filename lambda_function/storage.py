@@ -0,0 +1,117 @@
+import mmap
+import os
+from typing import Optional, Tuple, Union
+
+# ========= STOCKAGE (local ou S3) =========
+# Les URIs acceptées sont soit un chemin local ("/tmp/catalog.json"),
+# soit une URI S3 ("s3://bucket/prefixe/catalog.json").
+
+_s3_client = None
+
+def _get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client(
+            "s3",
+            aws_access_key_id     = os.environ.get("ACCESS_KEY_ID_CHEMS"),
+            aws_secret_access_key = os.environ.get("SECRET_ACCESS_KEY_CHEMS"),
+            region_name           = os.environ.get("REGION_CHEMS"),
+        )
+    return _s3_client
+
+def _split_s3_uri(uri: str) -> Tuple[str, str]:
+    path = uri[len("s3://"):]
+    bucket, _, key = path.partition("/")
+    if not bucket or not key:
+        raise ValueError(f"URI S3 invalide : {uri}")
+    return bucket, key
+
+def read_bytes(uri: str) -> Optional[bytes]:
+    """
+    Lit le contenu brut d'une URI. Retourne None si l'objet n'existe pas.
+    """
+    if uri.startswith("s3://"):
+        bucket, key = _split_s3_uri(uri)
+        client = _get_s3_client()
+        try:
+            obj = client.get_object(Bucket=bucket, Key=key)
+        except client.exceptions.NoSuchKey:
+            return None
+        return obj["Body"].read()
+
+    if not os.path.exists(uri):
+        return None
+    with open(uri, "rb") as f:
+        return f.read()
+
+def read_bytes_etag(uri: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Comme read_bytes, avec l'ETag de l'objet S3 pour une écriture conditionnelle (write_bytes_if).
+    ETag None en local ou si l'objet n'existe pas.
+    """
+    if not uri.startswith("s3://"):
+        return read_bytes(uri), None
+    bucket, key = _split_s3_uri(uri)
+    client = _get_s3_client()
+    try:
+        obj = client.get_object(Bucket=bucket, Key=key)
+    except client.exceptions.NoSuchKey:
+        return None, None
+    return obj["Body"].read(), obj.get("ETag")
+
+def map_bytes(uri: str) -> Optional[Union[bytes, mmap.mmap]]:
+    """
+    Comme read_bytes, mais un fichier local est mappé en mémoire (lecture seule) au lieu d'être copié.
+    L'appelant ferme le mmap retourné une fois le contenu décodé.
+    """
+    if uri.startswith("s3://") or not os.path.exists(uri):
+        return read_bytes(uri)
+    with open(uri, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def write_bytes(uri: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+    """
+    Écrit le contenu brut sur une URI (écriture atomique en local).
+    """
+    if uri.startswith("s3://"):
+        bucket, key = _split_s3_uri(uri)
+        _get_s3_client().put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+        return
+
+    folder = os.path.dirname(uri)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = f"{uri}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, uri)
+
+# Écriture refusée : l'objet a changé (ou a été créé) depuis sa lecture par read_bytes_etag.
+class StorageWriteConflict(RuntimeError):
+    pass
+
+def write_bytes_if(uri: str, data: bytes, etag: Optional[str],
+                   content_type: str = "application/octet-stream") -> None:
+    """
+    Écriture S3 conditionnée à l'ETag lu (IfMatch), ou à l'absence de l'objet si etag est None (IfNoneMatch).
+    Lève StorageWriteConflict si la condition échoue. En local, écriture simple (write_bytes).
+    """
+    if not uri.startswith("s3://"):
+        write_bytes(uri, data, content_type=content_type)
+        return
+    bucket, key = _split_s3_uri(uri)
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        _get_s3_client().put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type, **condition)
+    except Exception as e:
+        code = ((getattr(e, "response", None) or {}).get("Error") or {}).get("Code")
+        if code in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise StorageWriteConflict(f"{uri} modifié depuis sa lecture : écriture refusée") from e
+        if type(e).__name__ != "ParamValidationError":
+            raise
+        # boto3 du runtime trop ancien pour les écritures conditionnelles : écriture simple.
+        print(f"⚠️ Écriture conditionnelle non supportée par ce boto3 : {uri} écrit sans contrôle d'ETag")
+        write_bytes(uri, data, content_type=content_type)
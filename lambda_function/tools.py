@@ -1,12 +1,14 @@
 import os
+import re
 import requests
+import hubspot_client
+import tracing
 from datetime import datetime  
-from dotenv import load_dotenv
+from urllib.parse import unquote_plus
 import json
-import boto3
 
-from hubspot.crm.deals import SimplePublicObjectInputForCreate
-import hubspot
+# boto3, python-dotenv et le SDK hubspot sont importés à la première utilisation
+# (coût de démarrage à froid de la Lambda).
 
 # ------------------------>
 AWS_CONNEXION_CHEMS = [
@@ -21,7 +23,8 @@ AWS_CONNEXION_CHEMS = [
 # Fonction permettent de se connecter à AWS. 
 def connexion_aws(liste_connexion=AWS_CONNEXION_CHEMS):
     try:
-        load_dotenv()
+        import boto3
+        hubspot_client.load_env()
         s3_client = boto3.client(
             's3',
             aws_access_key_id     = os.environ.get(liste_connexion[0]),
@@ -50,17 +53,80 @@ def connexion_aws(liste_connexion=AWS_CONNEXION_CHEMS):
 # ------------------------>
 
 
-load_dotenv()
-headers = {
-    "Authorization": f"Bearer {os.environ.get('ACCESS_TOKEN_HUBSPOT')}",
-    "Content-Type": "application/json"
-}
-ACCESS_TOKEN_HUBSPOT = os.getenv("HUBSPOT_API_KEY")
+LINE_ITEMS_URL       = "/crm/v3/objects/line_items"
+LINE_ITEMS_BATCH_URL = "/crm/v3/objects/line_items/batch/create"
+LINE_ITEMS_BATCH_MAX = 100   # limite HubSpot par requête batch
+LINE_ITEMS_READ_URL  = "/crm/v3/objects/line_items/batch/read"
+DEAL_LINE_ITEMS_URL  = "/crm/v4/objects/deals/{deal_id}/associations/line_items"
 
 # ------------------------------------------------------------------------>
 
+# Curseurs persistants (dernier DEAL JSON traité) pour ne lister que les nouveaux fichiers.
+# Le mode backlog n'avance le sien que sur des fichiers au statut DEAL final ; le mode "dernier fichier"
+# a son propre curseur (il saute les fichiers plus anciens, qui restent à traiter par le backlog).
+DEAL_CURSOR_KEY        = "STATE/deal_json_cursor.json"
+DEAL_LATEST_CURSOR_KEY = "STATE/deal_json_latest_cursor.json"
+
+# Si les clés DEAL_JSON sont croissantes dans le temps (ex. préfixe horodaté), le listing démarre
+# directement après le curseur (StartAfter) : coût constant quelle que soit la taille du dossier.
+# Ce n'est pas le cas des clés actuelles (DEAL_JSON/deal_[<nom du PDF>].json, écrites en amont) : le
+# listing reste paginé sur tout le préfixe à chaque invocation, O(taille du dossier), et filtré sur
+# LastModified ; le curseur n'évite que la relecture des fichiers déjà traités.
+DEAL_JSON_ORDERED_KEYS = os.getenv("DEAL_JSON_ORDERED_KEYS", "false").lower() == "true"
+
+# Fonction permettent de lire le curseur ({"key", "last_modified"}), None s'il n'existe pas encore.
+def load_deal_cursor(s3_client, bucket: str, key: str = DEAL_CURSOR_KEY):
+    try:
+        cursor = read_json_object(s3_client, bucket=bucket, key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    cursor["last_modified"] = datetime.fromisoformat(cursor["last_modified"])
+    return cursor
+
+# Fonction permettent d'enregistrer le curseur sur un objet S3 (Key, LastModified) du listing.
+def save_deal_cursor(s3_client, bucket: str, obj: dict, key: str = DEAL_CURSOR_KEY):
+    body = {"key": obj["Key"], "last_modified": obj["LastModified"].isoformat()}
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(body),
+        ContentType="application/json",
+    )
+
+def _after_cursor(obj: dict, cursor) -> bool:
+    if not cursor:
+        return True
+    return (obj["LastModified"], obj["Key"]) > (cursor["last_modified"], cursor["key"])
+
+# Fonction permettent de parcourir (paginé, en flux) les fichiers plus récents que le curseur.
+def iter_deal_json_files(s3_client, bucket: str, prefix: str, cursor=None):
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if cursor and DEAL_JSON_ORDERED_KEYS:
+        params["StartAfter"] = cursor["key"]
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(**params):
+        for obj in page.get("Contents", []):
+            if DEAL_JSON_ORDERED_KEYS or _after_cursor(obj, cursor):
+                yield obj
+
+# Fonction permettent de trouver le fichier le plus récent (sans trier tout le listing).
+def find_last_deal_json(s3_client, bucket: str, prefix: str, cursor=None) -> dict:
+    """
+    Retourne l'objet S3 (Key, LastModified) le plus récent. Avec un curseur, seuls les fichiers
+    plus récents sont examinés ; s'il n'y en a aucun, le fichier du curseur reste le plus récent.
+    """
+    last = None
+    for obj in iter_deal_json_files(s3_client, bucket, prefix, cursor=cursor):
+        if last is None or (obj["LastModified"], obj["Key"]) > (last["LastModified"], last["Key"]):
+            last = obj
+    if last is None and cursor:
+        last = {"Key": cursor["key"], "LastModified": cursor["last_modified"]}
+    if last is None:
+        raise FileNotFoundError(f"Aucun fichier trouvé dans {prefix}")
+    return last
+
 # Fonction permettent de récupérer le dernier fichier JSON du dossier.
-def get_last_json(s3_client, bucket: str, prefix: str) -> tuple:
+def get_last_json(s3_client, bucket: str, prefix: str, cursor=None) -> tuple:
     """
     Récupère le fichier JSON le plus récent dans le dossier S3 et retourne :
       - le contenu en dictionnaire Python
@@ -69,25 +135,109 @@ def get_last_json(s3_client, bucket: str, prefix: str) -> tuple:
     Returns:
         tuple: (data: dict, key: str)
     """
-    response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
+    # Récupérer le dernier fichier (le plus récent), listing paginé
+    file_name = find_last_deal_json(s3_client, bucket, prefix, cursor=cursor)["Key"]
 
-    if "Contents" not in response:
-        raise FileNotFoundError(f"Aucun fichier trouvé dans {prefix}")
+    # Télécharger le contenu du fichier JSON
+    data = read_json_object(s3_client, bucket=bucket, key=file_name)
 
-    # Trier les fichiers par date de modification décroissante
-    sorted_files = sorted(response["Contents"], key=lambda x: x["LastModified"], reverse=True)
+    return data, file_name
 
-    # Récupérer le dernier fichier (le plus récent)
-    file_name = sorted_files[0]["Key"]
+# ------------------------------------------------------------------------>
 
-    # Télécharger le contenu du fichier JSON
-    obj = s3_client.get_object(Bucket=bucket, Key=file_name)
-    json_content = obj["Body"].read().decode("utf-8")
+# Statuts DEAL finaux dans le log : le DEAL JSON correspondant est considéré comme traité.
+DEAL_FINAL_STATUSES = ("Success", "Failed")
 
-    # Convertir le JSON en dictionnaire Python
-    data = json.loads(json_content)
+# Fonction permettent de lire un objet JSON S3.
+def read_json_object(s3_client, bucket: str, key: str) -> dict:
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    return json.loads(obj["Body"].read().decode("utf-8"))
 
-    return data, file_name
+# Fonction permettent d'extraire le nom du PDF ("...[nom].json" -> "nom").
+def deal_base_name(file_name: str):
+    match = re.search(r"\[(.*?)\]", file_name)
+    return match.group(1) if match else None
+
+# Clé S3 du log correspondant au PDF.
+def deal_log_key(base_name: str) -> str:
+    return f"LOGS/log_[{base_name}].json"
+
+# Log d'un PDF en mémoire : {"key", "data", "etag"}. Toutes les mises à jour d'une invocation sont
+# faites sur `data` puis écrites en une fois, conditionnées à l'ETag lu (IfMatch) : une invocation
+# concurrente sur le même PDF ne peut pas écraser le log sans que l'écriture soit refusée.
+class LogWriteConflict(RuntimeError):
+    pass
+
+# Fonction permettent de lire le log d'un PDF avec son ETag.
+def load_deal_log(s3_client, bucket: str, base_name: str) -> dict:
+    key = deal_log_key(base_name)
+    obj = s3_client.get_object(Bucket=bucket, Key=key)
+    return {"key": key, "data": json.loads(obj["Body"].read().decode("utf-8")), "etag": obj.get("ETag")}
+
+# Fonction permettent d'écrire le log d'un PDF (JSON compact) si personne ne l'a modifié depuis la lecture.
+def save_deal_log(s3_client, bucket: str, deal_log: dict) -> None:
+    """
+    Met à jour deal_log["etag"] (écritures suivantes de la même invocation).
+    Lève LogWriteConflict si le log a changé sur S3 depuis la lecture (412).
+    """
+    body      = json.dumps(deal_log["data"], ensure_ascii=False, separators=(",", ":"))
+    condition = {"IfMatch": deal_log["etag"]} if deal_log.get("etag") else {}
+    try:
+        response = s3_client.put_object(
+            Bucket=bucket, Key=deal_log["key"], Body=body, ContentType="application/json", **condition
+        )
+    except Exception as e:
+        code = ((getattr(e, "response", None) or {}).get("Error") or {}).get("Code")
+        if code in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise LogWriteConflict(
+                f"Log {deal_log['key']} modifié par une autre invocation depuis sa lecture : écriture refusée"
+            ) from e
+        if not condition or type(e).__name__ != "ParamValidationError":
+            raise
+        # boto3 du runtime trop ancien pour les écritures conditionnelles : écriture simple.
+        print("⚠️ IfMatch non supporté par ce boto3 : log écrit sans contrôle d'ETag")
+        response = s3_client.put_object(Bucket=bucket, Key=deal_log["key"], Body=body, ContentType="application/json")
+    deal_log["etag"] = response.get("ETag")
+
+# Fonction permettent de lister les fichiers plus récents que le curseur, du plus ancien au plus récent.
+def list_deal_json_files(s3_client, bucket: str, prefix: str, cursor=None) -> list:
+    files = list(iter_deal_json_files(s3_client, bucket, prefix, cursor=cursor))
+    return sorted(files, key=lambda x: (x["LastModified"], x["Key"]))
+
+# Fonction permettent de lire le statut DEAL du log d'un PDF (None si le log n'existe pas).
+def get_deal_status(s3_client, bucket: str, base_name: str):
+    try:
+        log_data = read_json_object(s3_client, bucket=bucket, key=deal_log_key(base_name))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return ((log_data.get("workflow") or {}).get("DEAL") or {}).get("status") or ""
+
+# Fonction permettent d'extraire les objets (bucket, key) créés d'un événement S3,
+# direct ou encapsulé dans SQS (éventuellement via SNS).
+def s3_event_objects(event) -> list:
+    """
+    Returns:
+        list: [{"bucket": ..., "key": ..., "message_id": id SQS ou None}, ...]
+    """
+    objects = []
+
+    def _collect(records, message_id=None):
+        for record in records or []:
+            source = record.get("eventSource") or record.get("EventSource")
+            if source == "aws:sqs":
+                body = json.loads(record.get("body") or "{}")
+                if body.get("Type") == "Notification" and "Message" in body:
+                    body = json.loads(body["Message"])
+                _collect(body.get("Records"), message_id=record.get("messageId"))
+            elif source == "aws:s3" and record.get("eventName", "").startswith("ObjectCreated"):
+                objects.append({
+                    "bucket"    : record["s3"]["bucket"]["name"],
+                    "key"       : unquote_plus(record["s3"]["object"]["key"]),
+                    "message_id": message_id,
+                })
+
+    _collect((event or {}).get("Records"))
+    return objects
 
 # ------------------------------------------------------------------------>
 
@@ -171,14 +321,9 @@ def get_object_hubspot(hubspot_id_company:int, deal_name:str, amount:float, clie
 
 # ------------------------------------------------------------------------>
 
-# Association des lignes produits à une transaction.
-def create_line_item_and_associate_to_deal(product:dict, deal_id:int):
-    url = "https://api.hubapi.com/crm/v3/objects/line_items"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN_HUBSPOT}",
-        "Content-Type": "application/json"
-    }
-    line_item_data = {
+# Objet ligne produit (propriétés + association à la transaction).
+def _line_item_input(product:dict, deal_id:int):
+    return {
         "properties": {
             "name"          : product['name'],
             "price"         : float(product['price']),
@@ -199,7 +344,11 @@ def create_line_item_and_associate_to_deal(product:dict, deal_id:int):
             }
         ]
     }
-    response = requests.post(url, headers=headers, json=line_item_data)
+
+# Association des lignes produits à une transaction.
+def create_line_item_and_associate_to_deal(product:dict, deal_id:int):
+    line_item_data = _line_item_input(product, deal_id)
+    response = hubspot_client.post(LINE_ITEMS_URL, json=line_item_data)
     response.raise_for_status()
     line_item_id = response.json()['id']
     print(f"Ligne produit créée et associée avec ID: {line_item_id}")
@@ -207,11 +356,166 @@ def create_line_item_and_associate_to_deal(product:dict, deal_id:int):
 
 # ------------------------------------------------------------------------>
 
+# Statuts d'un paquet refusé en bloc à la validation (rien n'a été créé) : rejoué ligne par ligne.
+LINE_ITEMS_BATCH_REJECTED = (400, 409, 422)
+
+# Création des lignes produits par lots (endpoint batch), associées à la transaction.
+def create_line_items_batch(products:list, deal_id:int) -> dict:
+    """
+    Crée les lignes produits par paquets de LINE_ITEMS_BATCH_MAX avec association inline à la transaction.
+    Un paquet refusé à la validation (LINE_ITEMS_BATCH_REJECTED) est rejoué ligne par ligne pour isoler
+    les erreurs. Une erreur serveur ou un timeout n'est jamais rejoué (le paquet a pu être créé) :
+    ses lignes sont rapportées en échec.
+
+    Returns:
+        dict: {"created": {index: line_item_id}, "failed": {index: message}}
+              (index = position de la ligne dans `products`, en str).
+    """
+    created, failed = {}, {}
+
+    for start in range(0, len(products), LINE_ITEMS_BATCH_MAX):
+        chunk, inputs = [], []
+        for idx, product in enumerate(products[start:start + LINE_ITEMS_BATCH_MAX], start=start):
+            # Ligne invalide (prix ou quantité absents…) : en échec seule, le reste du paquet est posté.
+            try:
+                line_item = _line_item_input(product, deal_id)
+            except (KeyError, TypeError, ValueError) as e:
+                failed[str(idx)] = f"Ligne produit invalide : {e!r}"
+                continue
+            line_item["objectWriteTraceId"] = str(idx)
+            chunk.append((idx, product))
+            inputs.append(line_item)
+        if not inputs:
+            continue
+
+        try:
+            response = hubspot_client.post(LINE_ITEMS_BATCH_URL, json={"inputs": inputs})
+        except requests.RequestException as e:
+            for idx, _ in chunk:
+                failed[str(idx)] = f"Paquet sans réponse de HubSpot (non rejoué) : {e}"
+            continue
+
+        if response.status_code in LINE_ITEMS_BATCH_REJECTED:
+            # Paquet refusé en bloc : on rejoue ligne par ligne.
+            for idx, product in chunk:
+                try:
+                    created[str(idx)] = create_line_item_and_associate_to_deal(product=product, deal_id=deal_id)
+                except Exception as e:
+                    failed[str(idx)] = str(e)
+            continue
+
+        if response.status_code not in (200, 201, 207):
+            for idx, _ in chunk:
+                failed[str(idx)] = f"Paquet en erreur HubSpot {response.status_code} (non rejoué) : {response.text[:200]}"
+            continue
+
+        data = response.json()
+        pending = [str(idx) for idx, _ in chunk]
+
+        # Erreurs partielles (207) : rattachées à leur ligne via objectWriteTraceId.
+        for err in data.get("errors", []) or []:
+            for trace in (err.get("context") or {}).get("objectWriteTraceId", []) or []:
+                if trace in pending:
+                    failed[trace] = err.get("message", "Erreur HubSpot")
+                    pending.remove(trace)
+
+        # Résultats : objectWriteTraceId si renvoyé, sinon ordre des entrées restantes.
+        untraced = []
+        for res in data.get("results", []) or []:
+            trace = res.get("objectWriteTraceId")
+            if trace in pending:
+                created[trace] = res["id"]
+                pending.remove(trace)
+            else:
+                untraced.append(res["id"])
+        for trace, line_item_id in zip(list(pending), untraced):
+            created[trace] = line_item_id
+            pending.remove(trace)
+        for trace in pending:
+            failed[trace] = "Aucun résultat renvoyé par HubSpot pour cette ligne"
+
+    print(f"Lignes produits créées : {len(created)} / {len(products)} (échecs : {len(failed)})")
+    return {"created": created, "failed": failed}
+
+# ------------------------------------------------------------------------>
+
+# Lignes produits déjà associées à une transaction (reprise après une interruption).
+def get_deal_line_items(deal_id) -> list:
+    """
+    Returns:
+        list: [{"id": ..., "hs_product_id": ..., "quantity": ...}, ...]
+    """
+    ids, after = [], None
+    while True:
+        params = {"limit": 500}
+        if after:
+            params["after"] = after
+        response = hubspot_client.get(DEAL_LINE_ITEMS_URL.format(deal_id=deal_id), params=params)
+        response.raise_for_status()
+        data = response.json()
+        ids.extend(str(r["toObjectId"]) for r in data.get("results", []) or [])
+        after = ((data.get("paging") or {}).get("next") or {}).get("after")
+        if not after:
+            break
+
+    line_items = []
+    for start in range(0, len(ids), LINE_ITEMS_BATCH_MAX):
+        response = hubspot_client.post(LINE_ITEMS_READ_URL, json={
+            "properties": ["hs_product_id", "quantity"],
+            "inputs": [{"id": i} for i in ids[start:start + LINE_ITEMS_BATCH_MAX]],
+        }, idempotent=True)
+        response.raise_for_status()
+        for r in response.json().get("results", []) or []:
+            props = r.get("properties") or {}
+            line_items.append({"id": r["id"], "hs_product_id": props.get("hs_product_id"),
+                               "quantity": props.get("quantity")})
+    return line_items
+
+# Rattache les lignes existantes d'une transaction aux lignes attendues (même produit, même quantité).
+def match_existing_line_items(products:list, existing:list, exclude=()) -> dict:
+    """
+    exclude : IDs de lignes déjà attribuées (checkpoint) ; jamais rattachés à une autre ligne attendue,
+              sinon deux lignes identiques (même produit, même quantité) se partageraient le même ID.
+
+    Returns:
+        dict: {index: line_item_id} (index = position de la ligne dans `products`, en str).
+    """
+    exclude = {str(i) for i in exclude}
+    available = {}
+    for item in existing:
+        if str(item["id"]) in exclude:
+            continue
+        try:
+            key = (str(item["hs_product_id"]), float(item["quantity"]))
+        except (TypeError, ValueError):
+            continue
+        available.setdefault(key, []).append(item["id"])
+
+    matched = {}
+    for idx, product in enumerate(products):
+        ids = available.get((str(product["hs_product_id"]), float(product["quantity"])))
+        if ids:
+            matched[str(idx)] = ids.pop(0)
+    return matched
+
+# ------------------------------------------------------------------------>
+
 # Fonction permettent de créer la transaction avec les lignes produits.
-def create_transaction_with_line_product(commande:dict, DEV=True):
-    
- 
-    
+def create_transaction_with_line_product(commande:dict, DEV=True, deal_id=None, on_deal_created=None,
+                                         known_line_items=()):
+    """
+    deal_id          : transaction déjà créée par un passage précédent (reprise) : elle n'est pas recréée,
+                       les lignes de commande["products"] déjà associées sont retrouvées et seules les
+                       manquantes sont postées.
+    on_deal_created  : appelé avec l'ID de la transaction dès sa création, avant les lignes produits ;
+                       une exception levée par ce callback interrompt la création (aucune ligne postée).
+    known_line_items : IDs des lignes de la transaction déjà attribuées à d'autres lignes de commande
+                       (checkpoint), exclus de la reprise.
+
+    Returns:
+        dict: {"deal_id": ..., "line_items": {"created": {...}, "failed": {...}}}
+    """
+
     # ----------------------------------------->
     # Création des dictionnaires.
     transaction, associations = get_object_hubspot(
@@ -225,27 +529,52 @@ def create_transaction_with_line_product(commande:dict, DEV=True):
             amount              = commande["total_price"]
     )
         
-    # Création de l'objet Transaction avec le bon pipeline.
-    simple_public_object_input = SimplePublicObjectInputForCreate(associations=associations, properties=transaction)
-    print(simple_public_object_input)
     # ----------------------------------------->
 
 
     if not DEV: 
         
         # --------------------------->
-        # Création de la transaction & récupération de son ID.
-        client = hubspot(access_token=ACCESS_TOKEN_HUBSPOT)
-        api_response = client.crm.deals.basic_api.create(simple_public_object_input_for_create=simple_public_object_input)
-        deal_id = api_response.id
-        
-        # Association des lignes produits à la transaction.
-        for i in commande["products"]:
-            create_line_item_and_associate_to_deal(product=i, deal_id=deal_id)
+        if deal_id is None:
+
+            # Création de l'objet Transaction avec le bon pipeline (SDK chargé seulement ici).
+            import hubspot
+            from hubspot.crm.deals import SimplePublicObjectInputForCreate
+            simple_public_object_input = SimplePublicObjectInputForCreate(associations=associations, properties=transaction)
+            print(simple_public_object_input)
+
+            # Création de la transaction & récupération de son ID.
+            client = hubspot.HubSpot(
+                access_token=hubspot_client.get_token(),
+                host=hubspot_client.HUBSPOT_API_BASE,
+            )
+            hubspot_client.throttle("crm")
+            tracing.count("hubspot_calls")
+            api_response = client.crm.deals.basic_api.create(simple_public_object_input_for_create=simple_public_object_input)
+            deal_id = api_response.id
+            if on_deal_created:
+                on_deal_created(deal_id)
+            existing = {}
+
+        else:
+            # Reprise : lignes déjà postées avant l'interruption.
+            existing = match_existing_line_items(commande["products"], get_deal_line_items(deal_id),
+                                                 exclude=known_line_items)
+            print(f"Reprise de la transaction {deal_id} : {len(existing)} ligne(s) produit déjà présente(s)")
+
+        # Association des lignes produits manquantes à la transaction (par lots).
+        pending = [idx for idx in range(len(commande["products"])) if str(idx) not in existing]
+        posted  = create_line_items_batch(products=[commande["products"][idx] for idx in pending], deal_id=deal_id)
+        line_items = {
+            "created": {**existing, **{str(pending[int(k)]): v for k, v in posted["created"].items()}},
+            "failed" : {str(pending[int(k)]): v for k, v in posted["failed"].items()},
+        }
         # --------------------------->
         
-        # On retourne l'ID de la transaction.
-        return deal_id
+        # On retourne l'ID de la transaction et le détail des lignes produits.
+        return {"deal_id": deal_id, "line_items": line_items}
+
+    return {"deal_id": None, "line_items": {"created": {}, "failed": {}}}
             
 # ------------------------------------------------------------------------>
 
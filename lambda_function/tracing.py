@@ -0,0 +1,134 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# ========= TRACES PAR DEAL JSON =========
+# Une Trace par fichier traité : durée de chaque étape (span) et compteurs associés
+# (appels HubSpot, retries, 429...), plus des mesures globales (taille catalogue, lignes scorées).
+# La trace active et l'étape en cours sont portées par des ContextVar : hubspot_client / matching_products
+# comptent sans qu'on leur passe d'objet, et des étapes concurrentes (threads, tâches asyncio) ne se
+# mélangent pas. Les pools de threads doivent propager le contexte (copy_context, asyncio.to_thread).
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "HubspotCreateDeal")
+SPAN_COUNTERS     = ("hubspot_calls", "retries", "rate_limited")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deal_trace", default=None)
+_step: contextvars.ContextVar    = contextvars.ContextVar("deal_step", default=None)
+
+
+class Trace:
+    def __init__(self, name: str = ""):
+        self.name    = name
+        self.started = time.perf_counter()
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.metrics: Dict[str, Any] = {}
+        self._lock   = threading.Lock()
+
+    def _entry(self, name: str) -> Dict[str, float]:
+        entry = self.spans.get(name)
+        if entry is None:
+            entry = self.spans[name] = {"ms": 0.0, **{c: 0 for c in SPAN_COUNTERS}}
+        return entry
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Chronomètre une étape ; les compteurs incrémentés pendant l'étape lui sont rattachés.
+        """
+        with self._lock:
+            self._entry(name)
+        token = _step.set(name)
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            _step.reset(token)
+            with self._lock:
+                self.spans[name]["ms"] += round(1000 * (time.perf_counter() - t0), 1)
+
+    def count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            if counter in SPAN_COUNTERS:
+                self._entry(_step.get() or "other")[counter] += n
+            else:
+                self.metrics[counter] = self.metrics.get(counter, 0) + n
+
+    def gauge(self, name: str, value: Any) -> None:
+        with self._lock:
+            self.metrics[name] = value
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"total_ms": round(1000 * (time.perf_counter() - self.started), 1)}
+            out.update(self.metrics)
+            out["spans"] = {k: dict(v) for k, v in self.spans.items()}
+            for c in SPAN_COUNTERS:
+                out[c] = sum(v[c] for v in self.spans.values())
+            return out
+
+    def emit(self, **properties) -> None:
+        """
+        Écrit les métriques au format CloudWatch Embedded Metric Format (une ligne JSON par étape,
+        dimension "Step", plus une ligne globale). `properties` : champs de contexte non agrégés.
+        """
+        data = self.as_dict()
+        ts = int(time.time() * 1000)
+        for step, values in data["spans"].items():
+            print(json.dumps(_emf(ts, [["Step"]], {
+                "DurationMs": (values["ms"], "Milliseconds"),
+                "HubSpotCalls": (values["hubspot_calls"], "Count"),
+                "HubSpotRetries": (values["retries"], "Count"),
+                "HubSpotRateLimited": (values["rate_limited"], "Count"),
+            }, {"Step": step, **properties})))
+        totals = {"TotalDurationMs": (data["total_ms"], "Milliseconds"),
+                  "HubSpotCalls": (data["hubspot_calls"], "Count")}
+        for name, unit in (("catalog_size", "Count"), ("rows_scored", "Count")):
+            if name in data:
+                totals["".join(p.capitalize() for p in name.split("_"))] = (data[name], unit)
+        print(json.dumps(_emf(ts, [[]], totals, properties)))
+
+
+def _emf(ts: int, dimensions, metrics: Dict[str, tuple], properties: Dict[str, Any]) -> Dict[str, Any]:
+    line = {
+        "_aws": {
+            "Timestamp": ts,
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": dimensions,
+                "Metrics": [{"Name": k, "Unit": unit} for k, (_, unit) in metrics.items()],
+            }],
+        },
+    }
+    line.update(properties)
+    line.update({k: v for k, (v, _) in metrics.items()})
+    return line
+
+
+@contextmanager
+def activate(trace: Trace):
+    """
+    Rend `trace` courante pour le contexte (thread) en cours.
+    """
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+def count(counter: str, n: int = 1) -> None:
+    # No-op hors d'une trace (benchmarks, appels directs).
+    trace = _current.get()
+    if trace is not None:
+        trace.count(counter, n)
+
+def gauge(name: str, value: Any) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.gauge(name, value)
@@ -44,7 +44,7 @@ data "archive_file" "lambda_zip" {
 # Déploiement de la fonction Lambda avec layers dynamiques
 resource "aws_lambda_function" "hubspot_create_deal" {
   function_name = "hubspot-create-deal"
-  handler       = "hubspot_create_deal.lambda_handler"
+  handler       = var.LAMBDA_HANDLER
   runtime       = "python3.9"
   role          = "arn:aws:iam::975515885951:role/lambda"
 
@@ -56,7 +56,10 @@ resource "aws_lambda_function" "hubspot_create_deal" {
   # Variables d'environnement.
   environment {
     variables = {
-      ACCESS_TOKEN_HUBSPOT = var.ACCESS_TOKEN_HUBSPOT
+      ACCESS_TOKEN_HUBSPOT   = var.ACCESS_TOKEN_HUBSPOT
+      CATALOG_SNAPSHOT_URI   = var.CATALOG_SNAPSHOT_URI
+      COMPANY_MATCH_MODE     = var.COMPANY_MATCH_MODE
+      DEAL_JSON_ORDERED_KEYS = var.DEAL_JSON_ORDERED_KEYS
     }
   }
 
@@ -69,4 +72,27 @@ resource "aws_lambda_function" "hubspot_create_deal" {
 
 
   ]
-}
\ No newline at end of file
+}
+
+# Build planifié de l'artefact catalogue produits (event = {"mode": "catalog"}).
+resource "aws_cloudwatch_event_rule" "catalog_build" {
+  count               = var.CATALOG_SNAPSHOT_URI == "" ? 0 : 1
+  name                = "hubspot-create-deal-catalog-build"
+  schedule_expression = var.CATALOG_BUILD_SCHEDULE
+}
+
+resource "aws_cloudwatch_event_target" "catalog_build" {
+  count = var.CATALOG_SNAPSHOT_URI == "" ? 0 : 1
+  rule  = aws_cloudwatch_event_rule.catalog_build[0].name
+  arn   = aws_lambda_function.hubspot_create_deal.arn
+  input = jsonencode({ mode = "catalog" })
+}
+
+resource "aws_lambda_permission" "catalog_build" {
+  count         = var.CATALOG_SNAPSHOT_URI == "" ? 0 : 1
+  statement_id  = "AllowCatalogBuildSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.hubspot_create_deal.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.catalog_build[0].arn
+}
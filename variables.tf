@@ -2,4 +2,34 @@ variable "ACCESS_TOKEN_HUBSPOT" {
   type        = string
   description = "Clé API Hubspot"
   sensitive   = true
-}
\ No newline at end of file
+}
+
+variable "LAMBDA_HANDLER" {
+  type        = string
+  description = "Handler Lambda : hubspot_create_deal.lambda_handler ou hubspot_create_deal_async.lambda_handler (asyncio)"
+  default     = "hubspot_create_deal.lambda_handler"
+}
+
+variable "CATALOG_SNAPSHOT_URI" {
+  type        = string
+  description = "Artefact binaire du catalogue produits (s3://bucket/cle ou chemin local) ; vide : pas d'artefact ni de build planifié"
+  default     = ""
+}
+
+variable "CATALOG_BUILD_SCHEDULE" {
+  type        = string
+  description = "Fréquence du build de l'artefact catalogue (expression EventBridge)"
+  default     = "rate(6 hours)"
+}
+
+variable "COMPANY_MATCH_MODE" {
+  type        = string
+  description = "Matching entreprise : sequential (le moins de recherches, environ 1,8 par DEAL), concurrent (latence minimale, environ 4,9 recherches par DEAL) ou packed (stratégies groupées en une recherche, environ 2,2 à 2,6 recherches par DEAL : plus que sequential, au pire sequential + 3)"
+  default     = "sequential"
+}
+
+variable "DEAL_JSON_ORDERED_KEYS" {
+  type        = string
+  description = "true seulement si les clés DEAL_JSON sont croissantes dans le temps (préfixe horodaté) : listing après le curseur (StartAfter), coût constant. Les clés actuelles (deal_[<nom du PDF>].json) ne le sont pas : avec false, chaque invocation liste tout le préfixe DEAL_JSON/ (coût proportionnel au dossier)"
+  default     = "false"
+}